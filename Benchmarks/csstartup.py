@@ -0,0 +1,205 @@
+#Author: kshitijshukla345@gmail.com
+#Description: Startup benchmark. Measures how long each script takes to import (and which heavy modules
+#that pulls in) and how long a fresh process takes to reach its first prompt, appending every run to a CSV.
+import argparse
+import csv
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCH_CONFIG = {
+    "runs": 5,  # Runs per measurement, the median is reported
+    "prompt_timeout": 60,  # Seconds to wait for a script's first prompt before counting the run as failed
+    "results_file": "startup_bench.csv",  # One row per target per benchmark run, to track startup over time
+    "importtime_top": 15,  # Modules listed per target with --importtime
+}
+
+# Modules that no script should load just by being imported; each belongs to one code path
+WATCH_MODULES = ("pandas", "numpy", "dotenv", "ijson", "pstats", "cProfile", "tracemalloc")
+
+# Per target: the script, the arguments that lead to its first prompt, the prompt text and the input
+# files it reads before prompting. Scripts that make API calls before any prompt are timed with --help,
+# which covers the same interpreter start, imports and argument parsing.
+TARGETS = {
+    "ioa": {"script": "CustomIOA/ioaMTv1.4.0.py", "prompt": "Enter the client ID"},
+    "exceptions": {"script": "DeviceControlExceptions/exceptionV1.4.1.py", "prompt": "Enter the Client ID",
+                   "files": {"combined_ids.csv": "device_id\n1234_5678_USB Disk\n",
+                             "target_cids.csv": "cid\n0123456789abcdef0123456789abcdef\n"}},
+    "firewall": {"script": "FirewallManagement/FirewallRuleGroupAPIMigration.py", "args": ["--targets", "target_cids.csv"],
+                 "prompt": "Enter the source member CID",
+                 "files": {"target_cids.csv": "cid\n0123456789abcdef0123456789abcdef\n"}},
+    "fwrgid": {"script": "FirewallManagement/FwRgId.py", "args": ["--help"]},
+    "host": {"script": "HostManagement/crowdstrike_host_hider.py", "args": ["--help"]},
+    "inventory": {"script": "Inventory/csinventory.py", "args": ["--help"]},
+    "drift": {"script": "Inventory/csdrift.py", "args": ["--help"]},
+    "service": {"script": "Service/csservice.py", "prompt": "Enter the parent client ID"},
+}
+
+# Run in a child interpreter: imports one script the way csservice and csinventory do, then reports
+# the elapsed seconds and which of the watched modules ended up in sys.modules
+IMPORT_PROBE = """
+import os, sys, time
+started = time.perf_counter()
+sys.path.append(os.path.dirname(os.path.join(sys.argv[1], sys.argv[2])))  # csdrift imports csinventory
+sys.path.insert(0, sys.argv[1])
+from oauth.csload import load_script
+load_script(sys.argv[2])
+elapsed = time.perf_counter() - started
+print(elapsed, ",".join(name for name in sys.argv[3:] if name in sys.modules))
+"""
+
+
+def child_env():
+    # No credentials, so every script reaches its prompt instead of minting a token
+    env = {key: value for key, value in os.environ.items() if not key.endswith(("CLIENT_ID", "CLIENT_SECRET"))}
+    env["PYTHONUNBUFFERED"] = "1"
+    return env
+
+
+def write_files(target, workdir):
+    for name, content in target.get("files", {}).items():
+        with open(os.path.join(workdir, name), "w") as file:
+            file.write(content)
+
+
+def time_import(target, workdir):
+    """Seconds to import the script in a fresh interpreter (interpreter start excluded), and the watched modules it loaded."""
+    command = [sys.executable, "-c", IMPORT_PROBE, REPO_ROOT, target["script"], *WATCH_MODULES]
+    result = subprocess.run(command, cwd=workdir, env=child_env(), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    seconds, loaded = result.stdout.split(" ", 1)
+    return float(seconds), [name for name in loaded.strip().split(",") if name]
+
+
+def time_first_prompt(target, workdir, command=None):
+    """Seconds from process start until the first prompt shows up (or until --help has printed and exited)."""
+    command = command or [sys.executable, os.path.join(REPO_ROOT, target["script"])]
+    command = command + target.get("args", [])
+    prompt = target.get("prompt", "").encode()
+    found = threading.Event()
+    output = bytearray()
+
+    def read_output(stream):
+        # A reader thread instead of select(), which does not work on pipes on Windows
+        for chunk in iter(lambda: stream.read1(4096), b""):
+            output.extend(chunk)
+            if prompt and prompt in output:
+                found.set()
+                return
+
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=workdir, env=child_env(), stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    reader = threading.Thread(target=read_output, args=(process.stdout,), daemon=True)
+    reader.start()
+    try:
+        if prompt:
+            if not found.wait(BENCH_CONFIG["prompt_timeout"]):
+                raise RuntimeError(f"no prompt: {bytes(output).decode(errors='replace').strip()[-200:]}")
+            elapsed = time.perf_counter() - started
+        else:
+            process.wait(BENCH_CONFIG["prompt_timeout"])
+            elapsed = time.perf_counter() - started
+            if process.returncode != 0:
+                reader.join(1)
+                raise RuntimeError(f"exit {process.returncode}: {bytes(output).decode(errors='replace').strip()[-200:]}")
+    finally:
+        process.kill()
+        process.wait()
+    return elapsed
+
+
+def importtime_report(target, workdir):
+    """Slowest modules (self time) when importing the script, from python -X importtime."""
+    command = [sys.executable, "-X", "importtime", "-c", IMPORT_PROBE, REPO_ROOT, target["script"]]
+    result = subprocess.run(command, cwd=workdir, env=child_env(), capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line and "self [us]" not in line:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            rows.append((int(self_us), int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:BENCH_CONFIG["importtime_top"]]
+
+
+def run_target(name, target, runs, command=None):
+    with tempfile.TemporaryDirectory() as workdir:
+        write_files(target, workdir)
+        import_times, prompt_times, loaded = [], [], []
+        for _ in range(runs):
+            seconds, loaded = time_import(target, workdir)
+            import_times.append(seconds)
+            prompt_times.append(time_first_prompt(target, workdir, command))
+    return {
+        "target": name,
+        "import_ms": round(statistics.median(import_times) * 1000, 1),
+        "first_prompt_ms": round(statistics.median(prompt_times) * 1000, 1),
+        "measured_at": target.get("prompt") or "--help",
+        "heavy_modules": " ".join(loaded),
+    }
+
+
+def append_results(rows, file_path, label):
+    fields = ["timestamp", "label", "python", "target", "import_ms", "first_prompt_ms", "measured_at", "heavy_modules"]
+    new_file = not os.path.isfile(file_path)
+    with open(file_path, "a", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        if new_file:
+            writer.writeheader()
+        for row in rows:
+            writer.writerow({"timestamp": time.strftime("%Y-%m-%d %H:%M:%S"), "label": label,
+                             "python": sys.version.split()[0], **row})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and time to first prompt of the scripts.")
+    parser.add_argument("targets", nargs="*", help=f"Targets to measure: {', '.join(TARGETS)} (default: all)")
+    parser.add_argument("--runs", type=int, default=BENCH_CONFIG["runs"], help="Runs per measurement, the median is reported")
+    parser.add_argument("--label", default="", help="Tag stored with the results, e.g. a branch or build name")
+    parser.add_argument("--results", default=BENCH_CONFIG["results_file"], help="CSV the results are appended to")
+    parser.add_argument("--exe", action="append", default=[], metavar="TARGET=PATH",
+                        help="Time the first prompt of a PyInstaller build instead of the .py, e.g. ioa=dist/ioaMTv1.4.0.exe")
+    parser.add_argument("--importtime", action="store_true", help="Also list the slowest modules per target (python -X importtime)")
+    parser.add_argument("--max-prompt-ms", type=float, help="Exit with status 1 if any target takes longer to reach its prompt")
+    args = parser.parse_args()
+    unknown = [name for name in args.targets + [item.split("=", 1)[0] for item in args.exe] if name not in TARGETS]
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(unknown)}")
+
+    executables = dict(item.split("=", 1) for item in args.exe)
+    rows, failed = [], []
+    print(f"{'target':<12}{'import ms':>11}{'prompt ms':>11}  measured at / heavy modules loaded on import")
+    for name in args.targets or TARGETS:
+        target = TARGETS[name]
+        command = [os.path.abspath(executables[name])] if name in executables else None
+        try:
+            row = run_target(name, target, args.runs, command)
+        except (RuntimeError, subprocess.TimeoutExpired) as e:
+            print(f"{name:<12}  failed: {e}")
+            failed.append(name)
+            continue
+        rows.append(row)
+        print(f"{name:<12}{row['import_ms']:>11.1f}{row['first_prompt_ms']:>11.1f}  {row['measured_at']}"
+              + (f" / {row['heavy_modules']}" if row["heavy_modules"] else ""))
+        if args.importtime:
+            with tempfile.TemporaryDirectory() as workdir:
+                for self_us, cumulative_us, module in importtime_report(target, workdir):
+                    print(f"{'':<12}{self_us / 1000:>11.1f}{cumulative_us / 1000:>11.1f}  {module}")
+
+    append_results(rows, args.results, args.label)
+    print(f"Results appended to {args.results}")
+    slow = [row["target"] for row in rows if args.max_prompt_ms and row["first_prompt_ms"] > args.max_prompt_ms]
+    if slow:
+        print(f"Over {args.max_prompt_ms:g} ms to the first prompt: {', '.join(slow)}")
+    if slow or failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,29 +2,32 @@
 #Description: This script is used to copy custom IOA rule groups and rules from one tenant to another tenant using multi-threading.
 import requests
 import re
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from oauth.csoauth import get_bearer
+from oauth.csplan import ApiPlan
+from oauth.csprofile import profiler, add_profile_arguments, start_from_args
+from oauth import cstrace
+from oauth.cstrace import tracer, add_trace_arguments
+from oauth.csretry import RetrySession, RETRY_CONFIG
+from oauth.csjson import decode
+from oauth.csfetch import FETCH_CONFIG, fetch_entities
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import time
+import math
+import argparse
 from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 import getpass
 
-# Set up logging
-logging.basicConfig(
-    filename="ioa_migration_multithread.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
-
 # Configuration
 CONFIG = {
     "max_workers": 10,  # Number of threads (adjust based on rate limits)
-    "batch_delay": 0.1,  # Delay between batches in seconds
-    "max_retries": 3,  # Number of retries for failed API calls
-    "retry_backoff_factor": 1,  # Backoff factor for retries
 }
 
+# Retrying session shared by every call (oauth/csretry.py)
+session = RetrySession()
+session.mount("https://", HTTPAdapter(pool_maxsize=CONFIG["max_workers"]))
+
 # Function to validate UUID format
 def is_uuid(value):
     return bool(re.match(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', value))
@@ -33,19 +36,23 @@ def is_uuid(value):
 def get_custom_ioa_rule_groups(bearer_token):
     url = "https://api.eu-1.crowdstrike.com/ioarules/queries/rule-groups/v1"
     headers = {"Authorization": f"Bearer {bearer_token}"}
-    response = requests.get(url, headers=headers)
+    with profiler.phase("list"):
+        response = session.get(url, headers=headers)
     response.raise_for_status()
-    logging.info(f"Fetched rule groups: {response.json()['resources']}")
-    return response.json()["resources"]
+    rule_groups = decode(response)["resources"]
+    logging.info(f"Fetched rule groups: {rule_groups}")
+    return rule_groups
 
 # Function to get specific custom IOA rule group details
 def get_custom_ioa_rule_group_details(bearer_token, rule_group_id):
     url = f"https://api.eu-1.crowdstrike.com/ioarules/entities/rule-groups/v1?ids={rule_group_id}"
     headers = {"Authorization": f"Bearer {bearer_token}"}
-    response = requests.get(url, headers=headers)
+    with profiler.phase("fetch"):
+        response = session.get(url, headers=headers)
     response.raise_for_status()
-    logging.info(f"Fetched rule group details for {rule_group_id}: {response.json()}")
-    return response.json()["resources"][0]
+    body = decode(response)
+    logging.info(f"Fetched rule group details for {rule_group_id}: {body}")
+    return body["resources"][0]
 
 # Function to transform a rule object for creating a new rule
 def transform_rule_for_creation(rule):
@@ -59,100 +66,40 @@ def transform_rule_for_creation(rule):
         "comment": rule.get("comment", "")
     }
 
-# Function to fetch a single rule with retry logic
+# Function to fetch a single rule; raises when it cannot be fetched, so a copy is never silently partial
 def fetch_rule(bearer_token, rule_id):
     details_url = "https://api.eu-1.crowdstrike.com/ioarules/entities/rules/v1"
     headers = {"Authorization": f"Bearer {bearer_token}"}
     params = {"ids": rule_id}
     
-    # Set up retry strategy
-    session = requests.Session()
-    retries = Retry(
-        total=CONFIG["max_retries"],
-        backoff_factor=CONFIG["retry_backoff_factor"],
-        status_forcelist=[429, 500, 502, 503, 504],  # Retry on these status codes
-    )
-    session.mount("https://", HTTPAdapter(max_retries=retries))
-    
     try:
-        response = session.get(details_url, headers=headers, params=params)
+        with profiler.phase("fetch"):
+            response = session.get(details_url, headers=headers, params=params)
         response.raise_for_status()
-        rules = response.json().get("resources", [])
+        rules = decode(response).get("resources", [])
         logging.info(f"Fetched rule {rule_id}: {rules}")
         return rules
     except requests.exceptions.RequestException as e:
-        print(f"Failed to fetch rule {rule_id} after {CONFIG['max_retries']} retries: {e}")
-        logging.error(f"Failed to fetch rule {rule_id} after {CONFIG['max_retries']} retries: {e}")
-        return []
-
-# Function to get specific custom IOA rules using multi-threading
-def get_custom_ioa_rules(bearer_token, rule_group_id):
-    # Step 1: Fetch all rule IDs
-    query_url = "https://api.eu-1.crowdstrike.com/ioarules/queries/rules/v1"
-    headers = {"Authorization": f"Bearer {bearer_token}"}
-    all_rule_ids = []
-    offset = 0
-    limit = 100
+        print(f"Failed to fetch rule {rule_id} after {RETRY_CONFIG['max_retries']} retries: {e}")
+        logging.error(f"Failed to fetch rule {rule_id} after {RETRY_CONFIG['max_retries']} retries: {e}")
+        raise
 
-    while True:
-        params = {"offset": str(offset), "limit": str(limit)}
-        try:
-            query_response = requests.get(query_url, headers=headers, params=params)
-            query_response.raise_for_status()
-            query_json = query_response.json()
-            print(f"Full JSON response from queries/rules/v1 (offset={offset}): {query_json}")
-            logging.info(f"Queried rule IDs (offset={offset}): {query_json}")
-            
-            rule_ids = query_json.get("resources", [])
-            all_rule_ids.extend(rule_ids)
-            
-            total = query_json.get("meta", {}).get("pagination", {}).get("total", 0)
-            offset += limit
-            if offset >= total or not rule_ids:
-                break
-        except requests.exceptions.RequestException as e:
-            print(f"Failed to fetch rule IDs: {e}")
-            logging.error(f"Failed to fetch rule IDs: {e}")
-            return []
-
-    print(f"All Rule IDs in tenant: {all_rule_ids}")
-    logging.info(f"All Rule IDs in tenant: {all_rule_ids}")
-    
-    if not all_rule_ids:
-        print("No rules found in tenant")
-        logging.warning("No rules found in tenant")
-        return []
-    
-    # Step 2: Fetch rule details using multi-threading
-    start_time = time.time()  # Start timing
-    all_rules = []
-    max_workers = CONFIG["max_workers"]
-    batch_size = max_workers
-    for i in range(0, len(all_rule_ids), batch_size):
-        batch_ids = all_rule_ids[i:i + batch_size]
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_rule_id = {executor.submit(fetch_rule, bearer_token, rule_id): rule_id for rule_id in batch_ids}
-            for future in as_completed(future_to_rule_id):
-                rule_id = future_to_rule_id[future]
-                try:
-                    rules = future.result()
-                    print(f"Completed fetching rule {rule_id}")
-                    all_rules.extend(rules)
-                except Exception as e:
-                    print(f"Error fetching rule {rule_id}: {e}")
-                    logging.error(f"Error fetching rule {rule_id}: {e}")
-        time.sleep(CONFIG["batch_delay"])  # Add delay between batches to avoid rate limits
-    
-    end_time = time.time()  # End timing
-    print(f"Time taken to fetch {len(all_rule_ids)} rules: {end_time - start_time:.2f} seconds")
-    logging.info(f"Time taken to fetch {len(all_rule_ids)} rules: {end_time - start_time:.2f} seconds")
-    
-    # Step 3: Filter rules by rule_group_id
-    filtered_rules = [rule for rule in all_rules if rule.get("rulegroup_id") == rule_group_id]
-    print(f"Filtered rules for rule group {rule_group_id}: {len(filtered_rules)} rules")
-    print(f"Filtered rule details: {filtered_rules}")
-    logging.info(f"Filtered rules for rule group {rule_group_id}: {filtered_rules}")
-    return filtered_rules
+# Function to get the custom IOA rules of one rule group.
+# Rule group entities embed their rules; when they do not, only the group's own rule_ids are fetched,
+# in chunks of up to 100 IDs per request. Raises if any rule is missing, so the group is not copied partially.
+def get_custom_ioa_rules(bearer_token, rule_group):
+    rules = rule_group.get("rules")
+    rule_ids = rule_group.get("rule_ids") or []
+    if rules is None:
+        details_url = "https://api.eu-1.crowdstrike.com/ioarules/entities/rules/v1"
+        headers = {"Authorization": f"Bearer {bearer_token}"}
+        rules = fetch_entities(details_url, headers, rule_ids, max_workers=CONFIG["max_workers"], get=session.get)
+    missing = set(rule_ids) - {rule.get("instance_id") or rule.get("id") for rule in rules}
+    if missing:
+        raise RuntimeError(f"{len(missing)} of {len(rule_ids)} rules of rule group {rule_group['id']} could not be fetched: {sorted(missing)}")
+    print(f"Rules for rule group {rule_group['id']}: {len(rules)} rules")
+    logging.info(f"Rules for rule group {rule_group['id']}: {len(rules)} rules")
+    return rules
 
 # Function to create a rule group in the destination tenant
 def create_rule_group(bearer_token, rule_group):
@@ -165,12 +112,13 @@ def create_rule_group(bearer_token, rule_group):
         "enabled": rule_group["enabled"]
     }
     print(f"Creating rule group with payload: {payload}")
-    response = requests.post(url, headers=headers, json=payload)
+    with profiler.phase("submit"), tracer.span(f"create_rule_group {rule_group['name']}"):
+        response = session.post(url, headers=headers, json=payload)
     response.raise_for_status()
     print(f"Create rule group response status: {response.status_code}")
     print(f"Create rule group response text: {response.text}")
     logging.info(f"Created rule group: {response.text}")
-    new_rule_group_id = response.json()["resources"][0]["id"]
+    new_rule_group_id = decode(response)["resources"][0]["id"]
     print(f"Newly created rule group ID: {new_rule_group_id}")
     return new_rule_group_id
 
@@ -181,15 +129,18 @@ def create_rule(bearer_token, rule, rule_group_id):
     rule_payload = transform_rule_for_creation(rule)
     rule_payload["rulegroup_id"] = rule_group_id
     print(f"Creating rule with payload: {rule_payload}")
-    response = requests.post(url, headers=headers, json=rule_payload)
+    with profiler.phase("submit"), tracer.span(f"create_rule {rule['name']}", **{"cs.rule_id": rule.get("id")}):
+        response = session.post(url, headers=headers, json=rule_payload)
     response.raise_for_status()
     print(f"Create rule response status: {response.status_code}")
     print(f"Create rule response text: {response.text}")
     logging.info(f"Created rule: {response.text}")
-    return response.json()
+    return decode(response)
 
 # Function to copy custom IOA rule group and rules to another tenant
 def copy_custom_ioa_rules(bearer_token, rule_group, rules):
+    new_rule_group_id = None
+    copied = 0
     try:
         # Step 1: Create the rule group in the destination tenant
         new_rule_group_id = create_rule_group(bearer_token, rule_group)
@@ -197,15 +148,77 @@ def copy_custom_ioa_rules(bearer_token, rule_group, rules):
         # Step 2: Create each rule in the new rule group
         for rule in rules:
             create_rule(bearer_token, rule, new_rule_group_id)
+            copied += 1
         
-        return {"id": new_rule_group_id}
+        return {"id": new_rule_group_id, "rules": copied}
     except Exception as e:
+        if new_rule_group_id:
+            e = RuntimeError(f"{e} (rule group {new_rule_group_id} was created with {copied} of {len(rules)} rules)")
         print(f"Failed to copy rule group: {e}")
         logging.error(f"Failed to copy rule group: {e}")
-        raise
+        raise e
+
+# Function to copy rule groups, with their rules, from the source tenant to the destination tenant.
+# A group whose rules cannot all be fetched or created is reported as failed and the next group is copied.
+def copy_rule_groups(source_bearer_token, destination_bearer_token, rule_group_ids):
+    results = []
+    for rule_group_id in rule_group_ids:
+        name = rule_group_id
+        try:
+            with tracer.span(f"group {rule_group_id}", **{"cs.rule_group_id": rule_group_id}) as span:
+                rule_group_details = get_custom_ioa_rule_group_details(source_bearer_token, rule_group_id)
+                name = rule_group_details["name"]
+                span.set("cs.rule_group_name", name)
+                # All rules are fetched before the group is created, so a fetch failure leaves nothing behind
+                rules = get_custom_ioa_rules(source_bearer_token, rule_group_details)
+                copy_result = copy_custom_ioa_rules(destination_bearer_token, rule_group_details, rules)
+        except Exception as e:
+            print(f"Failed to copy rule group {name}: {e}")
+            logging.error(f"Failed to copy rule group {name} (ID: {rule_group_id}): {e}")
+            results.append({"name": name, "source_id": rule_group_id, "status": "failed", "error": str(e)})
+            continue
+        print(f"Copied rule group: {name} (New ID: {copy_result.get('id', 'N/A')})")
+        results.append({"name": name, "source_id": rule_group_id, "status": "copied", "new_id": copy_result.get("id"), "rules": copy_result["rules"]})
+    return results
+
+# Function to count the calls main() would make to copy the selected rule groups
+def plan_copy(rule_groups, selected_groups):
+    base = "https://api.eu-1.crowdstrike.com"
+    copies = len(selected_groups)
+    total_rules = sum(len(group.get("rule_ids", [])) for group in selected_groups)
+    plan = ApiPlan(f"copy {copies} IOA rule group(s), {total_rules} rules")
+    plan.add("POST", f"{base}/oauth2/token", 2)
+    plan.add("GET", f"{base}/ioarules/queries/rule-groups/v1")
+    plan.add("GET", f"{base}/ioarules/entities/rule-groups/v1", len(rule_groups) + copies)
+    # get_custom_ioa_rules only fetches a group's own rule_ids, and only when the group entity does not embed its rules
+    chunk_size = FETCH_CONFIG["chunk_size"]
+    rule_chunks = sum(math.ceil(len(group.get("rule_ids", [])) / chunk_size) for group in selected_groups if group.get("rules") is None)
+    if rule_chunks:
+        plan.add("GET", f"{base}/ioarules/entities/rules/v1", rule_chunks, workers=CONFIG["max_workers"])
+    plan.add("POST", f"{base}/ioarules/entities/rule-groups/v1", copies)
+    plan.add("POST", f"{base}/ioarules/entities/rules/v1", sum(len(group.get("rule_ids", [])) for group in selected_groups))
+    plan.report()
+    return plan
 
 # Main function
 def main():
+    parser = argparse.ArgumentParser(description="Copy custom IOA rule groups between CIDs.")
+    parser.add_argument("--plan", action="store_true", help="Only count the API calls and estimate wall time")
+    parser.add_argument("--workers", type=int, default=CONFIG["max_workers"], help="Threads used to fetch rules")
+    add_profile_arguments(parser)
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    start_from_args(args, "ioa_copy")
+    cstrace.start_from_args(args, "ioa_copy")
+    CONFIG["max_workers"] = args.workers
+
+    # Set up logging
+    logging.basicConfig(
+        filename="ioa_migration_multithread.log",
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
     primary_client_id = input("Enter the client ID: ")
     primary_client_secret = getpass.getpass("Enter the client secret: ")
     source_member_cid = input("Enter the source member CID: ")
@@ -214,7 +227,7 @@ def main():
     try:
         # Generate bearer tokens
         source_bearer_token = get_bearer(primary_client_id, primary_client_secret, source_member_cid)
-        destination_bearer_token = get_bearer(primary_client_id, primary_client_secret, destination_member_cid)
+        destination_bearer_token = None if args.plan else get_bearer(primary_client_id, primary_client_secret, destination_member_cid)
         
         # Get custom IOA rule groups from source CID
         rule_group_ids = get_custom_ioa_rule_groups(source_bearer_token)
@@ -231,13 +244,15 @@ def main():
         selected_indices = input("Enter the indices of the rule groups you want to copy (comma-separated): ")
         selected_indices = [int(idx.strip()) - 1 for idx in selected_indices.split(",")]
         
+        if args.plan:
+            plan_copy(rule_groups, [rule_groups[idx] for idx in selected_indices])
+            return
+        
         # Copy selected rule groups to destination CID
-        for idx in selected_indices:
-            rule_group_id = rule_groups[idx]['id']
-            rule_group_details = get_custom_ioa_rule_group_details(source_bearer_token, rule_group_id)
-            rules = get_custom_ioa_rules(source_bearer_token, rule_group_id)
-            copy_result = copy_custom_ioa_rules(destination_bearer_token, rule_group_details, rules)
-            print(f"Copied rule group: {rule_group_details['name']} (New ID: {copy_result.get('id', 'N/A')})")
+        results = copy_rule_groups(source_bearer_token, destination_bearer_token, [rule_groups[idx]['id'] for idx in selected_indices])
+        failed = [result["name"] for result in results if result["status"] == "failed"]
+        if failed:
+            print(f"{len(failed)} of {len(results)} rule groups failed to copy: {', '.join(failed)}")
     except Exception as e:
         print(f"Script failed: {e}")
         logging.error(f"Script failed: {e}")
@@ -1,52 +1,88 @@
 #V1.4.0 checks combined_ids.csv input and auto removes non standard ids and logs them
 import requests
-import pandas as pd
 import json
 import logging
 import os
 #from dotenv import load_dotenv
 import getpass
 import re
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth.csoauth import TokenManager
+from oauth.cscids import read_cids
+from oauth.csplan import ApiPlan
+from oauth.csprofile import profiler, add_profile_arguments, start_from_args
+from oauth import cstrace
+from oauth.cstrace import tracer, add_trace_arguments
+from oauth.csretry import RetrySession
+from oauth.csjson import decode, iter_events
+from oauth.csscheduler import TenantScheduler
+from oauth.csstats import RunStats
 
 '''
 # Load environment variables from .env file
 load_dotenv()
 '''
 
-# Configure logging to append to the log file
-logging.basicConfig(filename='usb_exceptions.log', level=logging.INFO, 
-                    format='%(asctime)s - %(levelname)s - %(message)s', filemode='a')
+CONFIG = {
+    "max_in_flight": 8,  # Policy updates running at once, across all CIDs
+    "max_in_flight_per_cid": 1,  # One policy update per CID at a time
+    "max_consecutive_failures": 2,  # Stop a CID after this many failed policies in a row
+}
+
+# Retrying session shared by every call (oauth/csretry.py)
+session = RetrySession()
 
-# Function to generate bearer token
+# Function to generate bearer token (in the CID's own cloud, where the calls made with it are routed)
 def generate_bearer_token(client_id, client_secret, member_cid):
-    url = "https://api.eu-1.crowdstrike.com/oauth2/token"
-    headers = {
-        "accept": "application/json",
-        "Content-Type": "application/x-www-form-urlencoded"
-    }
-    data = {
-        "client_id": client_id,
-        "client_secret": client_secret,
-        "member_cid": member_cid
-    }
-    response = requests.post(url, headers=headers, data=data)
-    response.raise_for_status()
-    token = response.json()["access_token"]
+    token = TokenManager(client_id, client_secret, member_cid=member_cid).get()
     logging.info(f"Generated bearer token for CID {member_cid}")
     print(f"Generated bearer token for CID {member_cid}")
     return token
 
-# Function to retrieve policy details by ID
+# Function to retrieve policy details by ID (the whole document; the inventory crawlers store it)
 def get_policy_details(bearer_token, policy_id):
     url = f"https://api.eu-1.crowdstrike.com/policy/entities/device-control/v1?ids={policy_id}"
     headers = {
         "Authorization": f"Bearer {bearer_token}",
         "Content-Type": "application/json"
     }
-    response = requests.get(url, headers=headers)
+    with profiler.phase("fetch"):
+        response = session.get(url, headers=headers)
     response.raise_for_status()
-    policy_details = response.json().get("resources", [])[0]
-    return policy_details
+    return decode(response).get("resources", [])[0]
+
+# Function to read a policy's name and its MASS_STORAGE exception combined IDs.
+# Policies can hold tens of thousands of exceptions, so the body is streamed and only these fields are kept.
+def get_policy_summary(bearer_token, policy_id):
+    url = f"https://api.eu-1.crowdstrike.com/policy/entities/device-control/v1?ids={policy_id}"
+    headers = {
+        "Authorization": f"Bearer {bearer_token}",
+        "Content-Type": "application/json"
+    }
+    with profiler.phase("fetch"):
+        response = session.get(url, headers=headers, stream=True)
+    response.raise_for_status()
+    summary = {"name": None, "combined_ids": []}
+    class_id = None
+    class_combined_ids = []
+    # With stream=True the body is downloaded while it is parsed, so this phase includes the transfer
+    with profiler.phase("parse"):
+        for prefix, event, value in iter_events(response):
+            if prefix == "resources.item.name" and event == "string":
+                summary["name"] = value
+            elif prefix == "resources.item.settings.classes.item.id":
+                class_id = value
+            elif prefix == "resources.item.settings.classes.item.exceptions.item.combined_id" and event == "string":
+                class_combined_ids.append(value)
+            elif prefix == "resources.item.settings.classes.item" and event == "end_map":
+                if class_id == "MASS_STORAGE" and not summary["combined_ids"]:
+                    summary["combined_ids"] = class_combined_ids
+                class_id = None
+                class_combined_ids = []
+    return summary
 
 # Function to retrieve policy ID by name
 def get_policy_id(bearer_token, policy_name):
@@ -55,25 +91,19 @@ def get_policy_id(bearer_token, policy_name):
         "Authorization": f"Bearer {bearer_token}",
         "Content-Type": "application/json"
     }
-    response = requests.get(url, headers=headers)
+    with profiler.phase("list"):
+        response = session.get(url, headers=headers)
     response.raise_for_status()
-    policy_ids = response.json().get("resources", [])
+    policy_ids = decode(response).get("resources", [])
     for policy_id in policy_ids:
-        policy_details = get_policy_details(bearer_token, policy_id)
-        if policy_details.get("name") == policy_name:
+        if get_policy_summary(bearer_token, policy_id)["name"] == policy_name:
             return policy_id
     return None
 
 # Function to get existing combined IDs from policy
 def get_existing_combined_ids(bearer_token, policy_id):
-    policy_details = get_policy_details(bearer_token, policy_id)
-    exceptions = policy_details.get("settings", {}).get("classes", [])
-    existing_combined_ids = []
-    for device_class in exceptions:
-        if device_class["id"] == "MASS_STORAGE":
-            existing_combined_ids = [exception["combined_id"] for exception in device_class.get("exceptions", []) if "combined_id" in exception]
-            break
-    return existing_combined_ids, policy_details.get("name")
+    summary = get_policy_summary(bearer_token, policy_id)
+    return summary["combined_ids"], summary["name"]
 
 # Function to create USB device control exceptions
 def create_usb_exceptions(bearer_token, policy_id, combined_ids, description):
@@ -98,99 +128,215 @@ def create_usb_exceptions(bearer_token, policy_id, combined_ids, description):
             }
         ]
     }
-    response = requests.patch(url, headers=headers, data=json.dumps(payload))
+    with profiler.phase("submit"), tracer.span("PATCH exceptions", **{"cs.policy_id": policy_id, "cs.exception_count": len(combined_ids)}):
+        response = session.patch(url, headers=headers, data=json.dumps(payload))
     response.raise_for_status()
     logging.info(f"Created USB exceptions for policy {policy_id} with combined IDs: {combined_ids}")
     print(f"Created USB exceptions for policy {policy_id} with combined IDs: {combined_ids}")
-    return response.json()
+    return decode(response)
 
 # Regex to match standard combined_ids
 pattern = re.compile(r'^\d+_\d+_( ?\S.*)$')
 
-# Read combined IDs from CSV after filtering with regex
-combined_ids_df = pd.read_csv("combined_ids.csv")
-#combined_ids_df = combined_ids_df.dropna(subset=['device_id'])  # Remove rows with NaN values in 'device_id'
-matching_ids = combined_ids_df[combined_ids_df["device_id"].apply(lambda x: bool(pattern.match(x)))]
-non_matching_ids = combined_ids_df[~combined_ids_df["device_id"].apply(lambda x: bool(pattern.match(x)))]
-combined_ids = matching_ids["device_id"].tolist()
-if not non_matching_ids.empty:
-    non_matching_ids.to_csv("nonStandardCombinedIds.csv", index=False)
-
-# Read target CIDs from CSV
-target_cids_df = pd.read_csv("target_cids.csv")
-target_cids = target_cids_df["cid"].tolist()
-
-# Home CID credentials
-#home_cid_client_id = os.getenv("HOME_CID_CLIENT_ID")
-home_cid_client_id = input("Enter the Client ID: ")
-#home_cid_client_secret = os.getenv("HOME_CID_CLIENT_SECRET")
-home_cid_client_secret = getpass.getpass("Enter the Client Secret: ")
-
 # Policy names to target
 policy_names = ["CyberSOC Windows - Monitoring", "CyberSOC Windows - Production"]
 
-# Get description from user
-description = input("Enter the description for the USB exceptions: ")
-
-# Process each target CID for each policy
-excluded_ids = []
-for target_cid in target_cids:
-    try:
-        # Generate bearer token for the target CID
-        bearer_token = generate_bearer_token(home_cid_client_id, home_cid_client_secret, target_cid)
-        
-        for policy_name in policy_names:
-            # Retrieve the policy ID
-            policy_id = get_policy_id(bearer_token, policy_name)
-            if not policy_id:
-                logging.warning(f"Policy '{policy_name}' not found for CID {target_cid}")
-                print(f"Policy '{policy_name}' not found for CID {target_cid}")
-                continue
-            
-            # Get existing combined IDs from the policy
-            existing_combined_ids, policy_name = get_existing_combined_ids(bearer_token, policy_id)
-            
-            ''' Debugging code
-            # Save existing exceptions to a csv file
-            os.makedirs("existingExceptions", exist_ok=True)
-            existing_exceptions_df = pd.DataFrame({"combined_id": existing_combined_ids, "policy_name": policy_name})
-            existing_exceptions_df.to_csv(f"existingExceptions/{target_cid}-{policy_name.replace(' ', '_')}-EE.csv", index=False)
-            '''
-            # Filter out combined IDs that already exist in the policy
-            new_combined_ids = [cid for cid in combined_ids if cid not in existing_combined_ids]
-            excluded_combined_ids = [cid for cid in combined_ids if cid in existing_combined_ids]
-            
-            # Log and save excluded combined IDs
-            for excluded_id in excluded_combined_ids:
-                excluded_ids.append({"combined_id": excluded_id, "policy_name": policy_name, "cid": target_cid})
-            
-            # Create exceptions for the target CID
-            if new_combined_ids:
-                response = create_usb_exceptions(bearer_token, policy_id, new_combined_ids, description)
-                logging.info(f"Exceptions created for CID {target_cid} under policy '{policy_name}'")
-                print(f"Exceptions created for CID {target_cid} under policy '{policy_name}'")
-            else:
-                logging.info(f"No new exceptions to add for CID {target_cid} under policy '{policy_name}'")
-                print(f"No new exceptions to add for CID {target_cid} under policy '{policy_name}'")
-            
-            # Log and print summary for the target CID and policy
-            logging.info(f"Summary for CID {target_cid} under policy '{policy_name}': {len(new_combined_ids)} new exceptions added, {len(excluded_combined_ids)} existing exceptions excluded")
-            print(f"Summary for CID {target_cid} under policy '{policy_name}': {len(new_combined_ids)} new exceptions added, {len(excluded_combined_ids)} existing exceptions excluded")
-    except requests.exceptions.HTTPError as err:
-        logging.error(f"HTTP error occurred for CID {target_cid}: {err}")
-        print(f"HTTP error occurred for CID {target_cid}: {err}")
-        print("Response content:", err.response.content)  # Print the response content for debugging
-
-# Save excluded combined IDs to CSV
-if excluded_ids:
-    excluded_ids_df = pd.DataFrame(excluded_ids)
-    if not os.path.isfile("excluded_combined_ids.csv"):
-        excluded_ids_df.to_csv("excluded_combined_ids.csv", index=False)
+# Function to read combined IDs from CSV after filtering with regex
+def load_combined_ids(file_path="combined_ids.csv"):
+    import pandas as pd  # Imported here so loading the script (csservice, csinventory) does not pay for pandas
+    combined_ids_df = pd.read_csv(file_path)
+    #combined_ids_df = combined_ids_df.dropna(subset=['device_id'])  # Remove rows with NaN values in 'device_id'
+    matching_ids = combined_ids_df[combined_ids_df["device_id"].apply(lambda x: bool(pattern.match(x)))]
+    non_matching_ids = combined_ids_df[~combined_ids_df["device_id"].apply(lambda x: bool(pattern.match(x)))]
+    if not non_matching_ids.empty:
+        non_matching_ids.to_csv("nonStandardCombinedIds.csv", index=False)
+    return matching_ids["device_id"].tolist(), len(non_matching_ids)
+
+# Function to read target CIDs from CSV
+def load_target_cids(file_path="target_cids.csv"):
+    return read_cids(file_path)
+
+# Function to count the calls the push would make for one CID (reads only, no PATCH is sent).
+# workers is how many of these calls the push runs at once across all CIDs
+def plan_cid(plan, bearer_token, target_cid, combined_ids, workers=1):
+    query_url = "https://api.eu-1.crowdstrike.com/policy/queries/device-control/v1"
+    details_url = "https://api.eu-1.crowdstrike.com/policy/entities/device-control/v1"
+    plan.add("POST", "https://api.eu-1.crowdstrike.com/oauth2/token", workers=workers)
+    headers = {"Authorization": f"Bearer {bearer_token}", "Content-Type": "application/json"}
+    response = session.get(query_url, headers=headers)
+    response.raise_for_status()
+    policy_ids = decode(response).get("resources", [])
+    summaries = {}
+    for policy_name in policy_names:
+        # get_policy_id queries the list and fetches details until the name matches
+        plan.add("GET", query_url, workers=workers)
+        policy_id = None
+        for candidate_id in policy_ids:
+            plan.add("GET", details_url, workers=workers)
+            if candidate_id not in summaries:
+                summaries[candidate_id] = get_policy_summary(bearer_token, candidate_id)
+            if summaries[candidate_id]["name"] == policy_name:
+                policy_id = candidate_id
+                break
+        if not policy_id:
+            print(f"Policy '{policy_name}' not found for CID {target_cid}")
+            continue
+        # get_existing_combined_ids fetches the policy once more
+        plan.add("GET", details_url, workers=workers)
+        existing_combined_ids = set(summaries[policy_id]["combined_ids"])
+        new_count = sum(1 for cid in combined_ids if cid not in existing_combined_ids)
+        if new_count:
+            plan.add("PATCH", details_url, workers=workers)
+        print(f"Plan for CID {target_cid} under policy '{policy_name}': {new_count} new exceptions")
+
+# Function to push the combined IDs into one CyberSOC policy of one CID
+def push_policy_exceptions(bearer_token, target_cid, policy_name, combined_ids, description):
+    # Retrieve the policy ID
+    policy_id = get_policy_id(bearer_token, policy_name)
+    if not policy_id:
+        logging.warning(f"Policy '{policy_name}' not found for CID {target_cid}")
+        print(f"Policy '{policy_name}' not found for CID {target_cid}")
+        return {"cid": target_cid, "policy_name": policy_name, "status": "policy not found"}, []
+
+    # Get existing combined IDs from the policy
+    existing_combined_ids, policy_name = get_existing_combined_ids(bearer_token, policy_id)
+
+    ''' Debugging code
+    # Save existing exceptions to a csv file
+    os.makedirs("existingExceptions", exist_ok=True)
+    existing_exceptions_df = pd.DataFrame({"combined_id": existing_combined_ids, "policy_name": policy_name})
+    existing_exceptions_df.to_csv(f"existingExceptions/{target_cid}-{policy_name.replace(' ', '_')}-EE.csv", index=False)
+    '''
+    # Filter out combined IDs that already exist in the policy
+    with profiler.phase("diff"):
+        existing_lookup = set(existing_combined_ids)
+        new_combined_ids = [cid for cid in combined_ids if cid not in existing_lookup]
+        excluded_combined_ids = [cid for cid in combined_ids if cid in existing_lookup]
+
+    # Log and save excluded combined IDs
+    excluded_ids = [{"combined_id": excluded_id, "policy_name": policy_name, "cid": target_cid} for excluded_id in excluded_combined_ids]
+
+    # Create exceptions for the target CID
+    if new_combined_ids:
+        create_usb_exceptions(bearer_token, policy_id, new_combined_ids, description)
+        logging.info(f"Exceptions created for CID {target_cid} under policy '{policy_name}'")
+        print(f"Exceptions created for CID {target_cid} under policy '{policy_name}'")
     else:
-        excluded_ids_df.to_csv("excluded_combined_ids.csv", mode='a', header=False, index=False)
+        logging.info(f"No new exceptions to add for CID {target_cid} under policy '{policy_name}'")
+        print(f"No new exceptions to add for CID {target_cid} under policy '{policy_name}'")
+
+    # Log and print summary for the target CID and policy
+    logging.info(f"Summary for CID {target_cid} under policy '{policy_name}': {len(new_combined_ids)} new exceptions added, {len(excluded_combined_ids)} existing exceptions excluded")
+    print(f"Summary for CID {target_cid} under policy '{policy_name}': {len(new_combined_ids)} new exceptions added, {len(excluded_combined_ids)} existing exceptions excluded")
+    return {"cid": target_cid, "policy_name": policy_name, "status": "ok",
+            "added": len(new_combined_ids), "excluded": len(excluded_combined_ids)}, excluded_ids
+
+# Function to push the combined IDs into every CyberSOC policy of one CID
+def push_cid_exceptions(bearer_token, target_cid, combined_ids, description):
+    results = []
+    excluded_ids = []
+    for policy_name in policy_names:
+        with tracer.span(f"policy {policy_name}", **{"cs.cid": target_cid}):
+            result, policy_excluded_ids = push_policy_exceptions(bearer_token, target_cid, policy_name, combined_ids, description)
+        results.append(result)
+        excluded_ids.extend(policy_excluded_ids)
+    return results, excluded_ids
+
+# Function to append the combined IDs that were already excepted to excluded_combined_ids.csv
+def save_excluded_ids(excluded_ids, file_path="excluded_combined_ids.csv"):
+    if excluded_ids:
+        import pandas as pd
+        excluded_ids_df = pd.DataFrame(excluded_ids)
+        if not os.path.isfile(file_path):
+            excluded_ids_df.to_csv(file_path, index=False)
+        else:
+            excluded_ids_df.to_csv(file_path, mode='a', header=False, index=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Push USB mass storage exceptions into the CyberSOC policies of many CIDs.")
+    parser.add_argument("--plan", action="store_true", help="Only count the API calls and estimate wall time")
+    add_profile_arguments(parser)
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    start_from_args(args, "exception_push")
+    cstrace.start_from_args(args, "exception_push")
+
+    # Configure logging to append to the log file
+    logging.basicConfig(filename='usb_exceptions.log', level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s', filemode='a')
+
+    # Reading the CSVs covers pandas and the combined ID regex validation
+    with profiler.phase("read"):
+        combined_ids, non_matching_count = load_combined_ids()
+        target_cids = load_target_cids()
+
+    # Home CID credentials
+    #home_cid_client_id = os.getenv("HOME_CID_CLIENT_ID")
+    home_cid_client_id = input("Enter the Client ID: ")
+    #home_cid_client_secret = os.getenv("HOME_CID_CLIENT_SECRET")
+    home_cid_client_secret = getpass.getpass("Enter the Client Secret: ")
+
+    if args.plan:
+        plan = ApiPlan(f"push {len(combined_ids)} combined IDs to {len(target_cids)} CIDs")
+        # The push runs max_in_flight policies at once, at most max_in_flight_per_cid of them per CID
+        workers = min(CONFIG["max_in_flight"], CONFIG["max_in_flight_per_cid"] * len(target_cids))
+        for target_cid in target_cids:
+            try:
+                bearer_token = generate_bearer_token(home_cid_client_id, home_cid_client_secret, target_cid)
+                plan_cid(plan, bearer_token, target_cid, combined_ids, workers)
+            except requests.exceptions.HTTPError as err:
+                logging.error(f"HTTP error occurred while planning CID {target_cid}: {err}")
+                print(f"HTTP error occurred while planning CID {target_cid}: {err}")
+        plan.report()
+        return
+
+    # Get description from user
+    description = input("Enter the description for the USB exceptions: ")
+
+    # Process each target CID for each policy: CIDs round-robin on one pool, each CID capped and
+    # stopped after repeated failures, so one huge or failing tenant does not hold up the rest
+    tokens = {target_cid: TokenManager(home_cid_client_id, home_cid_client_secret, member_cid=target_cid) for target_cid in target_cids}
+    excluded_ids = []
+
+    def push(target_cid, policy_name):
+        with tracer.span(f"policy {policy_name}", **{"cs.cid": target_cid}):
+            return push_policy_exceptions(tokens[target_cid].get(), target_cid, policy_name, combined_ids, description)
+
+    def on_result(target_cid, policy_name, result, err):
+        if err is None:
+            excluded_ids.extend(result[1])
+            return
+        logging.error(f"Error occurred for CID {target_cid} under policy '{policy_name}': {err}")
+        print(f"Error occurred for CID {target_cid} under policy '{policy_name}': {err}")
+        if isinstance(err, requests.exceptions.HTTPError) and err.response is not None:
+            print("Response content:", err.response.content)  # Print the response content for debugging
+
+    def on_abandon(target_cid, policy_name):
+        logging.error(f"Skipped policy '{policy_name}' for CID {target_cid}: CID stopped after repeated failures")
+
+    # Start the CIDs that took longest on earlier runs first, so they do not stretch the end of the run
+    run_stats = RunStats("exception_push")
+    priority = run_stats.priorities(target_cids)
+    if priority:
+        eta = run_stats.eta(priority, CONFIG["max_in_flight"], CONFIG["max_in_flight_per_cid"])
+        logging.info(f"Estimated run time from earlier runs: {eta:.0f}s")
+        print(f"Estimated run time from earlier runs: {eta:.0f}s")
+    scheduler = TenantScheduler(CONFIG["max_in_flight"], CONFIG["max_in_flight_per_cid"], CONFIG["max_consecutive_failures"])
+    stats = scheduler.run({target_cid: policy_names for target_cid in target_cids}, push, on_result, on_abandon, priority)
+    run_stats.record_run(stats)
+    stopped = {target_cid: cid_stats["stopped"] for target_cid, cid_stats in stats.items() if cid_stats["stopped"]}
+    if stopped:
+        logging.error(f"Stopped CIDs: {stopped}")
+        print(f"Stopped CIDs: {stopped}")
+
+    with profiler.phase("write"):
+        save_excluded_ids(excluded_ids)
+
+    # Log and print final completion message
+    logging.info(f"Input List Summary: {len(combined_ids)} combined IDs matched, {non_matching_count} non-standard combined IDs skipped. Refer to nonStandardCombinedIds.csv.")
+    print(f"Input List Summary: {len(combined_ids)} combined IDs matched, {non_matching_count} non-standard combined IDs skipped. Refer to nonStandardCombinedIds.csv.")
+    logging.info("USB device control exceptions creation process completed.")
+    print("USB device control exceptions creation process completed.")
 
-# Log and print final completion message
-logging.info(f"Input List Summary: {len(combined_ids)} combined IDs matched, {len(non_matching_ids)} non-standard combined IDs skipped. Refer to nonStandardCombinedIds.csv.")
-print(f"Input List Summary: {len(combined_ids)} combined IDs matched, {len(non_matching_ids)} non-standard combined IDs skipped. Refer to nonStandardCombinedIds.csv.")
-logging.info("USB device control exceptions creation process completed.")
-print("USB device control exceptions creation process completed.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
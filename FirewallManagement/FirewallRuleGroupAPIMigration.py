@@ -1,17 +1,50 @@
 import requests
+import csv
 import json
+import hashlib
 import logging
 import os
-from dotenv import load_dotenv
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 
-# Load environment variables from .env file
-load_dotenv()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth.csoauth import TokenManager
+from oauth.cscids import read_cids
+from oauth.csplan import ApiPlan
+from oauth.csprofile import profiler, add_profile_arguments, start_from_args
+from oauth import cstrace
+from oauth.cstrace import tracer, add_trace_arguments
+from oauth.csscheduler import TenantScheduler
+from oauth.csstats import RunStats
+from oauth.csretry import RetrySession, CircuitOpenError, backoff_delay
+from oauth.csjson import decode
+from oauth.csfetch import FETCH_CONFIG, iter_query_pages, iter_entities, fetch_entities
 
 # Replace these with your actual base URL
 BASE_URL = 'https://api.eu-1.crowdstrike.com'
 
-# Configure logging
-logging.basicConfig(filename='firewall_migration.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Configuration
+CONFIG = {
+    'rule_chunk_size': 100,  # Rule/rule group IDs per entities GET, keeps the URL well under server limits
+    'max_workers': 8,  # Concurrent entity chunk fetches
+    'max_group_workers': 4,  # Rule groups exported (and, separately, imported) at the same time
+    'max_target_workers': 8,  # Fan-out mode: target CIDs processed at the same time
+    'target_retries': 3,  # Fan-out mode: retries per group and target before it counts as failed
+    'max_consecutive_target_failures': 2,  # Fan-out mode: stop a target after this many failed groups in a row
+}
+
+FANOUT_RESULTS_FILE = 'firewall_fanout_results.csv'  # Fan-out mode: one row per target CID and rule group
+
+# Server-managed rule fields, ignored when comparing rule groups across tenants
+VOLATILE_RULE_FIELDS = {'id', 'family', 'version', 'rule_group', 'customer_id', 'deleted',
+                        'created_by', 'created_on', 'modified_by', 'modified_on'}
+
+# Retrying session shared by every call (oauth/csretry.py)
+session = RetrySession()
+session.mount('https://', HTTPAdapter(pool_maxsize=CONFIG['max_workers'] * CONFIG['max_group_workers']))
 
 def get_headers(api_key):
     return {
@@ -20,56 +53,454 @@ def get_headers(api_key):
     }
 
 def get_bearer_token(client_id, client_secret):
-    url = f'{BASE_URL}/oauth2/token'
-    data = {
-        'client_id': client_id,
-        'client_secret': client_secret
-    }
-    response = requests.post(url, data=data)
-    response.raise_for_status()
-    return response.json()['access_token']
+    # Minted in the tenant's own cloud; calls made with the token are routed there (oauth/csretry.py)
+    return TokenManager(client_id, client_secret).get()
 
 def list_rule_group_ids(api_token):
+    # Every rule group ID in the tenant, following pagination
     headers = {
         'Authorization': f'Bearer {api_token}'
     }
-    response = requests.get(f'{BASE_URL}/fwmgr/queries/rule-groups/v1', headers=headers)
-    response.raise_for_status()
-    return response.json()['resources']
+    return [rule_group_id for page in iter_query_pages(f'{BASE_URL}/fwmgr/queries/rule-groups/v1', headers, get=session.get)
+            for rule_group_id in page]
 
-def get_rule_group_details(api_token, rule_group_ids):
+def iter_rule_group_details(api_token):
+    # Rule group details in chunks, available while later ID pages are still being listed
     headers = {
         'Authorization': f'Bearer {api_token}'
     }
-    params = {
-        'ids': rule_group_ids
+    id_pages = iter_query_pages(f'{BASE_URL}/fwmgr/queries/rule-groups/v1', headers, get=session.get)
+    return iter_entities(f'{BASE_URL}/fwmgr/entities/rule-groups/v1', headers, id_pages,
+                         CONFIG['rule_chunk_size'], CONFIG['max_workers'], session.get)
+
+def get_rule_group_details(api_token, rule_group_ids):
+    headers = {
+        'Authorization': f'Bearer {api_token}'
     }
-    response = requests.get(f'{BASE_URL}/fwmgr/entities/rule-groups/v1', headers=headers, params=params)
-    response.raise_for_status()
-    return response.json()['resources']
+    return fetch_entities(f'{BASE_URL}/fwmgr/entities/rule-groups/v1', headers, rule_group_ids,
+                          CONFIG['rule_chunk_size'], CONFIG['max_workers'], session.get)
 
 def export_rule_group(source_cid_api_key, rule_group_id):
     url = f'{BASE_URL}/fwmgr/entities/rule-groups/v1?ids={rule_group_id}'
     headers = get_headers(source_cid_api_key)
-    response = requests.get(url, headers=headers)
+    with profiler.phase('fetch'):
+        response = session.get(url, headers=headers)
     response.raise_for_status()
-    return response.json()['resources'][0]
+    return decode(response)['resources'][0]
 
 def export_rule_details(source_cid_api_key, rule_ids):
-    url = f'{BASE_URL}/fwmgr/entities/rules/v1?ids=' + '&ids='.join(rule_ids)
-    headers = get_headers(source_cid_api_key)
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()['resources']
+    # Fetch the rules in ID chunks concurrently, then put them back in the group's
+    # rule_ids order, which is the rule precedence
+    rules = fetch_entities(f'{BASE_URL}/fwmgr/entities/rules/v1', get_headers(source_cid_api_key), rule_ids,
+                           CONFIG['rule_chunk_size'], CONFIG['max_workers'], session.get)
+    rules_by_id = {}
+    for rule in rules:
+        # rule_ids may hold either the rule family or the rule version id
+        rules_by_id[rule['id']] = rule
+        if rule.get('family'):
+            rules_by_id.setdefault(rule['family'], rule)
+    missing = [rule_id for rule_id in rule_ids if rule_id not in rules_by_id]
+    if missing:
+        logging.warning(f'{len(missing)} rules could not be exported: {missing}')
+    return [rules_by_id[rule_id] for rule_id in rule_ids if rule_id in rules_by_id]
 
 def import_rule_group(target_cid_api_key, rule_group_data):
     url = f'{BASE_URL}/fwmgr/entities/rule-groups/v1'
     headers = get_headers(target_cid_api_key)
-    response = requests.post(url, headers=headers, data=json.dumps(rule_group_data))
+    with profiler.phase('submit'):
+        response = session.post(url, headers=headers, data=json.dumps(rule_group_data))
     response.raise_for_status()
-    return response.json()
+    return decode(response)
+
+def export_full_rule_group(source_cid_api_key, rule_group_id):
+    # Export the rule group and its rules, shaped as the payload for import_rule_group
+    with tracer.span(f'export group {rule_group_id}', **{'cs.rule_group_id': rule_group_id}) as span:
+        rule_group_data = export_rule_group(source_cid_api_key, rule_group_id)
+        span.set('cs.rule_group_name', rule_group_data['name'])
+        logging.info(f'Exported rule group: {rule_group_data["name"]} (ID: {rule_group_id})')
+
+        rules = export_rule_details(source_cid_api_key, rule_group_data['rule_ids'])
+        span.set('cs.rule_count', len(rules))
+        logging.info(f'Exported rules for {rule_group_data["name"]}: {[rule["name"] for rule in rules]}')
+
+    return {
+        "description": rule_group_data['description'],
+        "enabled": rule_group_data['enabled'],
+        "name": rule_group_data['name'],
+        "platform": rule_group_data['platform'],
+        "rules": rules
+    }
+
+def normalize_rule(rule):
+    return {key: value for key, value in rule.items() if key not in VOLATILE_RULE_FIELDS}
+
+def rule_group_hash(rule_group_data):
+    # Content hash of the group definition and its rules in precedence order
+    normalized = {
+        'name': rule_group_data['name'],
+        'description': rule_group_data.get('description') or '',
+        'platform': rule_group_data['platform'],
+        'enabled': rule_group_data['enabled'],
+        'rules': [normalize_rule(rule) for rule in rule_group_data['rules']],
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+def rule_keys(rules):
+    # Rules are matched across tenants by name; repeated names are told apart by occurrence
+    seen = {}
+    keys = []
+    for rule in rules:
+        seen[rule['name']] = seen.get(rule['name'], 0) + 1
+        keys.append((rule['name'], seen[rule['name']]))
+    return keys
+
+def longest_increasing_run(values):
+    # Indexes of one longest strictly increasing subsequence of values (patience sorting, O(n log n))
+    tails = []  # tails[k]: index of the smallest tail of an increasing subsequence of length k + 1
+    previous = [None] * len(values)
+    for index, value in enumerate(values):
+        low, high = 0, len(tails)
+        while low < high:
+            middle = (low + high) // 2
+            if values[tails[middle]] < value:
+                low = middle + 1
+            else:
+                high = middle
+        previous[index] = tails[low - 1] if low else None
+        if low == len(tails):
+            tails.append(index)
+        else:
+            tails[low] = index
+    run = []
+    index = tails[-1] if tails else None
+    while index is not None:
+        run.append(index)
+        index = previous[index]
+    return set(run)
+
+def diff_rules(target_rules, source_rules):
+    # Minimal JSON patch turning the target rule list into the source one: removes first, then
+    # moves and adds, then field changes. The longest run of kept rules already in source order
+    # stays put and every other rule is moved once, right after the rule that precedes it in the source
+    diff_operations = []
+    counts = {'add': 0, 'remove': 0, 'modify': 0, 'reorder': 0}
+    source_keys = rule_keys(source_rules)
+    source_index = {key: index for index, key in enumerate(source_keys)}
+
+    current = []  # (key, normalized rule) of the target, mirroring each op as it is applied
+    for index, (key, rule) in reversed(list(enumerate(zip(rule_keys(target_rules), target_rules)))):
+        if key in source_index:
+            current.insert(0, (key, normalize_rule(rule)))
+        else:
+            diff_operations.append({'op': 'remove', 'path': f'/rules/{index}'})
+            counts['remove'] += 1
+
+    stay = {current[i][0] for i in longest_increasing_run([source_index[key] for key, _ in current])}
+    positions = {key: i for i, (key, _) in enumerate(current)}
+    for index, (key, rule) in enumerate(zip(source_keys, source_rules)):
+        if key in stay:
+            continue
+        destination = positions[source_keys[index - 1]] + 1 if index else 0
+        if key in positions:
+            position = positions[key]
+            if position < destination:
+                destination -= 1  # The path of a move counts positions after the rule is taken out
+            if position == destination:
+                continue
+            diff_operations.append({'op': 'move', 'from': f'/rules/{position}', 'path': f'/rules/{destination}'})
+            current.insert(destination, current.pop(position))
+            counts['reorder'] += 1
+        else:
+            diff_operations.append({'op': 'add', 'path': f'/rules/{destination}', 'value': normalize_rule(rule)})
+            current.insert(destination, (key, normalize_rule(rule)))
+            counts['add'] += 1
+        positions = {key: i for i, (key, _) in enumerate(current)}
+
+    for index, rule in enumerate(source_rules):
+        new_rule = normalize_rule(rule)
+        old_rule = current[index][1]
+        changed = False
+        for field in sorted(set(old_rule) | set(new_rule)):
+            if field not in new_rule:
+                diff_operations.append({'op': 'remove', 'path': f'/rules/{index}/{field}'})
+                changed = True
+            elif old_rule.get(field) != new_rule[field]:
+                op = 'replace' if field in old_rule else 'add'
+                diff_operations.append({'op': op, 'path': f'/rules/{index}/{field}', 'value': new_rule[field]})
+                changed = True
+        counts['modify'] += changed
+    return diff_operations, counts
+
+def update_rule_group(target_cid_api_key, target_group, target_rules, new_rule_group_data):
+    # Patch the target group in place with only the changed fields and rules
+    # rule_versions pins each rule_ids entry to the version read here, so every rule must have been read
+    rule_ids = target_group['rule_ids']
+    if len(target_rules) != len(rule_ids) or any(rule_id not in (rule['id'], rule.get('family'))
+                                                 for rule_id, rule in zip(rule_ids, target_rules)):
+        raise RuntimeError(f'Read {len(target_rules)} of the {len(rule_ids)} rules of target group {target_group["name"]}, '
+                           'not patching it with misaligned rule versions')
+    diff_operations = []
+    for field in ('description', 'enabled'):
+        if target_group.get(field) != new_rule_group_data[field]:
+            diff_operations.append({'op': 'replace', 'path': f'/{field}', 'value': new_rule_group_data[field]})
+    with profiler.phase('diff'):
+        rule_operations, counts = diff_rules(target_rules, new_rule_group_data['rules'])
+    diff_operations.extend(rule_operations)
+    logging.info(f'Updating rule group {target_group["name"]} (ID: {target_group["id"]}) with {len(diff_operations)} operations: {counts}')
+    if not diff_operations:
+        return counts
+    payload = {
+        'id': target_group['id'],
+        'tracking': target_group['tracking'],
+        'rule_ids': rule_ids,
+        'rule_versions': [rule.get('version') for rule in target_rules],
+        'diff_type': 'application/json-patch+json',
+        'diff_operations': diff_operations,
+    }
+    with profiler.phase('submit'):
+        response = session.patch(f'{BASE_URL}/fwmgr/entities/rule-groups/v1', headers=get_headers(target_cid_api_key),
+                                  data=json.dumps(payload))
+    response.raise_for_status()
+    return counts
+
+def sync_rule_group(target_cid_api_key, new_rule_group_data, target_groups_by_name):
+    # Skip groups whose content already matches the target, update the ones that differ,
+    # and only create groups the target does not have
+    with tracer.span(f'sync group {new_rule_group_data["name"]}') as span:
+        target_group = target_groups_by_name.get(new_rule_group_data['name'])
+        if target_group is None:
+            import_response = import_rule_group(target_cid_api_key, new_rule_group_data)
+            span.set('cs.status', 'imported')
+            return {'status': 'imported', 'target_ids': import_response.get('resources', [])}
+        target_rules = export_rule_details(target_cid_api_key, target_group['rule_ids'])
+        target_data = dict(target_group, rules=target_rules)
+        if rule_group_hash(target_data) == rule_group_hash(new_rule_group_data):
+            span.set('cs.status', 'unchanged')
+            return {'status': 'unchanged', 'target_ids': [target_group['id']]}
+        counts = update_rule_group(target_cid_api_key, target_group, target_rules, new_rule_group_data)
+        span.set('cs.status', 'updated')
+        return {'status': 'updated', 'target_ids': [target_group['id']], 'changes': counts}
+
+def copy_rule_group(target_cid_api_key, new_rule_group_data):
+    with tracer.span(f'import group {new_rule_group_data["name"]}'):
+        import_response = import_rule_group(target_cid_api_key, new_rule_group_data)
+    return {'status': 'imported', 'target_ids': import_response.get('resources', [])}
+
+def migrate_rule_groups(source_cid_api_key, target_cid_api_key, rule_groups, sync=False):
+    # Exports run on one bounded pool and imports on another, so the target POST of a
+    # group overlaps with the source exports of the groups after it
+    results = []
+    workers = CONFIG['max_group_workers']
+    if sync:
+        target_groups_by_name = list_target_groups_by_name(target_cid_api_key)
+        deliver = lambda data: sync_rule_group(target_cid_api_key, data, target_groups_by_name)
+    else:
+        deliver = lambda data: copy_rule_group(target_cid_api_key, data)
+    with ThreadPoolExecutor(max_workers=workers) as export_pool, ThreadPoolExecutor(max_workers=workers) as import_pool:
+        exports = {export_pool.submit(tracer.wrap(export_full_rule_group), source_cid_api_key, group['id']): group for group in rule_groups}
+        imports = {}
+        for future in as_completed(exports):
+            group = exports[future]
+            try:
+                new_rule_group_data = future.result()
+            except Exception as e:
+                logging.error(f'Failed to export rule group {group["name"]} (ID: {group["id"]}): {e}')
+                results.append({'name': group['name'], 'source_id': group['id'], 'status': 'export failed', 'error': str(e)})
+                continue
+            imports[import_pool.submit(tracer.wrap(deliver), new_rule_group_data)] = group
+        for future in as_completed(imports):
+            group = imports[future]
+            try:
+                result = future.result()
+                logging.info(f'Rule group {group["name"]}: {result["status"]} (target ID: {result["target_ids"]})')
+                print(f'Rule group {group["name"]}: {result["status"]} -> {result["target_ids"]}')
+                results.append(dict(result, name=group['name'], source_id=group['id']))
+            except Exception as e:
+                logging.error(f'Failed to import rule group {group["name"]} (ID: {group["id"]}): {e}')
+                print(f'Failed to import rule group {group["name"]}: {e}')
+                results.append({'name': group['name'], 'source_id': group['id'], 'status': 'import failed', 'error': str(e)})
+    return results
+
+def export_rule_groups(source_cid_api_key, rule_groups):
+    # Export every selected group once, in selection order
+    with ThreadPoolExecutor(max_workers=CONFIG['max_group_workers']) as pool:
+        futures = [pool.submit(tracer.wrap(export_full_rule_group), source_cid_api_key, group['id']) for group in rule_groups]
+        return [future.result() for future in futures]
+
+def list_target_groups_by_name(target_cid_api_key):
+    target_groups_by_name = {}
+    for chunk in iter_rule_group_details(target_cid_api_key):
+        for target_group in chunk:
+            target_groups_by_name.setdefault(target_group['name'], target_group)
+    return target_groups_by_name
+
+def deliver_group(tokens, new_rule_group_data, sync=False, target_state=None):
+    # Import (or sync) one exported group into one target CID; raises when it cannot be delivered.
+    # Transport retries are RetrySession's job, and it never repeats the import POST on a 5xx. This loop
+    # only re-mints the token after a 401, and after an ambiguous failure (timeout, 5xx, exhausted 429s)
+    # lists the target's groups again before re-sending, so an import that landed is not created twice.
+    # target_state caches the target's groups by name between the groups of one target
+    target_state = {} if target_state is None else target_state
+    name = new_rule_group_data['name']
+    verify = False
+    for attempt in range(CONFIG['target_retries'] + 1):
+        api_key = tokens.get()
+        try:
+            if sync or verify:
+                if target_state.get('groups_by_name') is None:
+                    target_state['groups_by_name'] = list_target_groups_by_name(api_key)
+            if sync:
+                result = sync_rule_group(api_key, new_rule_group_data, target_state['groups_by_name'])
+            elif verify and name in target_state['groups_by_name']:
+                # The earlier import landed despite the error (or a group of that name already existed)
+                result = {'status': 'found after error', 'target_ids': [target_state['groups_by_name'][name]['id']]}
+            else:
+                result = copy_rule_group(api_key, new_rule_group_data)
+            logging.info(f'CID {tokens.member_cid}: rule group {name} {result["status"]}')
+            return result
+        except Exception as e:
+            status = getattr(getattr(e, 'response', None), 'status_code', None)
+            if status == 401:
+                tokens.invalidate(api_key)
+            elif (not isinstance(e, requests.exceptions.RequestException) or isinstance(e, CircuitOpenError)
+                  or (status is not None and status < 500 and status != 429)):
+                # Validation errors, open circuits and bugs would fail the same way again
+                logging.error(f'CID {tokens.member_cid}: rule group {name} failed: {e}')
+                raise
+            else:
+                verify = True
+            target_state['groups_by_name'] = None
+            if attempt == CONFIG['target_retries']:
+                logging.error(f'CID {tokens.member_cid}: rule group {name} failed: {e}')
+                raise
+            delay = backoff_delay(attempt)
+            tracer.current().event('retry', attempt=attempt + 1, error=str(e), delay_s=round(delay, 3))
+            logging.warning(f'CID {tokens.member_cid}: rule group {name} failed ({e}), retrying in {delay:.1f}s')
+            time.sleep(delay)
+
+def fan_out_rule_groups(client_id, client_secret, exported_groups, target_cids, sync=False):
+    # Deliver the exported groups to many target CIDs with one member-CID token per target.
+    # Targets take turns on one pool, one group per target at a time, and a target whose groups
+    # keep failing is stopped so it does not hold slots the other targets could use
+    tokens = {cid: TokenManager(client_id, client_secret, member_cid=cid) for cid in target_cids}
+    target_states = {cid: {} for cid in target_cids}
+    results = {cid: [] for cid in target_cids}
+
+    def on_result(cid, new_rule_group_data, result, error):
+        if error:
+            result = {'status': 'failed', 'target_ids': [], 'error': str(error)}
+        results[cid].append(dict(result, name=new_rule_group_data['name']))
+
+    def on_abandon(cid, new_rule_group_data):
+        results[cid].append({'name': new_rule_group_data['name'], 'status': 'failed', 'target_ids': [],
+                             'error': 'not attempted, target stopped after repeated failures'})
+
+    # Targets that took longest on earlier fan-outs start first
+    run_stats = RunStats('firewall_fanout')
+    priority = run_stats.priorities(target_cids, {cid: len(exported_groups) for cid in target_cids})
+    if priority:
+        print(f"Estimated fan-out time from earlier runs: {run_stats.eta(priority, CONFIG['max_target_workers'], 1):.0f}s")
+    scheduler = TenantScheduler(CONFIG['max_target_workers'], 1, CONFIG['max_consecutive_target_failures'])
+    stats = scheduler.run({cid: exported_groups for cid in target_cids},
+                          lambda cid, data: deliver_group(tokens[cid], data, sync, target_states[cid]), on_result, on_abandon, priority)
+    run_stats.record_run(stats)
+    for cid in target_cids:
+        failed = sum(1 for result in results[cid] if result['status'] == 'failed')
+        print(f'CID {cid}: {len(results[cid]) - failed} of {len(results[cid])} rule groups delivered')
+    with open(FANOUT_RESULTS_FILE, 'w', newline='') as file, profiler.phase('write'):
+        writer = csv.writer(file)
+        writer.writerow(['cid', 'rule_group', 'status', 'target_ids', 'error'])
+        for cid, cid_results in results.items():
+            for result in cid_results:
+                writer.writerow([cid, result['name'], result['status'], ' '.join(map(str, result['target_ids'])), result.get('error', '')])
+    print(f'Per-target results written to {FANOUT_RESULTS_FILE}')
+    return results
+
+def parse_selection(selection, count):
+    # "all", or comma-separated numbers and ranges such as "1,3,5-7" (1-based)
+    selection = selection.strip().lower()
+    if selection == 'all':
+        return list(range(count))
+    indices = []
+    for part in selection.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = (int(value) for value in part.split('-', 1))
+            indices.extend(range(first - 1, last))
+        else:
+            indices.append(int(part) - 1)
+    invalid = [index + 1 for index in indices if not 0 <= index < count]
+    if invalid:
+        raise ValueError(f'Invalid rule group numbers: {invalid}')
+    return list(dict.fromkeys(indices))
+
+def add_export_calls(plan, rule_groups, listed_count):
+    # Source side: listing every group, then exporting the selected groups and their rules
+    plan.add('GET', f'{BASE_URL}/fwmgr/queries/rule-groups/v1', max(1, -(-listed_count // FETCH_CONFIG['page_size'])))
+    plan.add('GET', f'{BASE_URL}/fwmgr/entities/rule-groups/v1', -(-listed_count // CONFIG['rule_chunk_size']), workers=CONFIG['max_workers'])
+    plan.add('GET', f'{BASE_URL}/fwmgr/entities/rule-groups/v1', len(rule_groups), workers=CONFIG['max_group_workers'])
+    chunks = sum(-(-len(group.get('rule_ids', [])) // CONFIG['rule_chunk_size']) for group in rule_groups)
+    plan.add('GET', f'{BASE_URL}/fwmgr/entities/rules/v1', chunks, workers=CONFIG['max_workers'] * CONFIG['max_group_workers'])
+
+def plan_migration(rule_groups, listed_count):
+    # Calls main() makes for the selected rule groups, taken from the details already listed
+    rule_count = sum(len(group.get('rule_ids', [])) for group in rule_groups)
+    plan = ApiPlan(f"migrate {len(rule_groups)} rule group(s), {rule_count} rules")
+    plan.add('POST', f'{BASE_URL}/oauth2/token', 2)
+    add_export_calls(plan, rule_groups, listed_count)
+    plan.add('POST', f'{BASE_URL}/fwmgr/entities/rule-groups/v1', len(rule_groups), workers=CONFIG['max_group_workers'])
+    plan.report()
+    return plan
+
+def plan_fan_out(rule_groups, listed_count, target_cids, sync=False):
+    # Calls fan_out_main() makes: the source export once, then the same delivery plan for every target.
+    # With --sync the target reads are a lower bound (changed groups also fetch their rules) and the
+    # writes an upper bound (unchanged groups send nothing)
+    rule_count = sum(len(group.get('rule_ids', [])) for group in rule_groups)
+    target_plan = ApiPlan(f"each target CID: deliver {len(rule_groups)} rule group(s){' with --sync' if sync else ''}")
+    target_plan.add('POST', f'{BASE_URL}/oauth2/token')
+    if sync:
+        target_plan.add('GET', f'{BASE_URL}/fwmgr/queries/rule-groups/v1')
+        target_plan.add('GET', f'{BASE_URL}/fwmgr/entities/rule-groups/v1')
+    target_plan.add('POST', f'{BASE_URL}/fwmgr/entities/rule-groups/v1', len(rule_groups), workers=CONFIG['max_target_workers'])
+    target_plan.report()
+
+    plan = ApiPlan(f"fan out {len(rule_groups)} rule group(s), {rule_count} rules, to {len(target_cids)} target CID(s)")
+    plan.add('POST', f'{BASE_URL}/oauth2/token')
+    add_export_calls(plan, rule_groups, listed_count)
+    for _ in target_cids:
+        plan.merge(target_plan)
+    plan.report()
+    return plan
 
 def main():
+    parser = argparse.ArgumentParser(description='Copy firewall rule groups from one CID to another.')
+    parser.add_argument('--plan', action='store_true', help='Only count the API calls and estimate wall time')
+    parser.add_argument('--groups', help='Rule groups to migrate: "all" or numbers like "1,3,5-7" (prompted if omitted)')
+    parser.add_argument('--sync', action='store_true', help='Skip groups identical in the target and update changed ones instead of creating duplicates')
+    parser.add_argument('--workers', type=int, default=CONFIG['max_group_workers'], help='Rule groups migrated concurrently')
+    parser.add_argument('--targets', help='Fan-out mode: CSV with a "cid" column; uses PARENT_CLIENT_ID/PARENT_CLIENT_SECRET and member CID tokens')
+    parser.add_argument('--source-cid', help='Fan-out mode: member CID to export the rule groups from')
+    add_profile_arguments(parser)
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    start_from_args(args, 'firewall_migration')
+    cstrace.start_from_args(args, 'firewall_migration')
+
+    # Load environment variables from .env file
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    # Configure logging
+    logging.basicConfig(filename='firewall_migration.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    CONFIG['max_group_workers'] = args.workers
+
+    if args.targets:
+        fan_out_main(args)
+        return
+
     # Get client IDs and secrets from environment variables
     SOURCE_CLIENT_ID = os.getenv('SOURCE_CLIENT_ID')
     SOURCE_CLIENT_SECRET = os.getenv('SOURCE_CLIENT_SECRET')
@@ -78,47 +509,62 @@ def main():
     
     # Get bearer tokens for both source and target CIDs
     source_bearer_token = get_bearer_token(SOURCE_CLIENT_ID, SOURCE_CLIENT_SECRET)
-    target_bearer_token = get_bearer_token(TARGET_CLIENT_ID, TARGET_CLIENT_SECRET)
+    target_bearer_token = None if args.plan else get_bearer_token(TARGET_CLIENT_ID, TARGET_CLIENT_SECRET)
     
-    # List rule group IDs from the source CID
-    rule_group_ids = list_rule_group_ids(source_bearer_token)
-    rule_group_details = get_rule_group_details(source_bearer_token, rule_group_ids)
-    
-    # Display rule groups and allow user to select one
+    # List rule groups from the source CID, printing each chunk as soon as it arrives
     print("Available Rule Groups:")
-    for idx, rule_group in enumerate(rule_group_details):
-        print(f"{idx + 1}. {rule_group['name']} (ID: {rule_group['id']})")
-    
-    selected_index = int(input("Enter the number of the rule group you want to migrate: ")) - 1
-    selected_rule_group_id = rule_group_details[selected_index]['id']
-    selected_rule_group_name = rule_group_details[selected_index]['name']
-    
-    logging.info(f'Starting migration of rule group {selected_rule_group_name} (ID: {selected_rule_group_id}) from source CID {SOURCE_CLIENT_ID} to target CID {TARGET_CLIENT_ID}')
+    rule_group_details = []
+    for chunk in iter_rule_group_details(source_bearer_token):
+        for rule_group in chunk:
+            rule_group_details.append(rule_group)
+            print(f"{len(rule_group_details)}. {rule_group['name']} (ID: {rule_group['id']})")
     
-    # Export the selected rule group from the source CID
-    rule_group_data = export_rule_group(source_bearer_token, selected_rule_group_id)
-    logging.info(f'Exported rule group: {rule_group_data["name"]} (ID: {selected_rule_group_id}) from source CID {SOURCE_CLIENT_ID}')
+    selection = args.groups or input("Enter the numbers of the rule groups to migrate (e.g. 1,3,5-7 or all): ")
+    selected_groups = [rule_group_details[idx] for idx in parse_selection(selection, len(rule_group_details))]
     
-    # Export individual rule details
-    rule_ids = rule_group_data['rule_ids']
-    rules = export_rule_details(source_bearer_token, rule_ids)
-    rule_names = [rule['name'] for rule in rules]
-    logging.info(f'Exported rules: {rule_names}')
-    
-    # Prepare the data for the new rule group
-    new_rule_group_data = {
-        "description": rule_group_data['description'],
-        "enabled": rule_group_data['enabled'],
-        "name": rule_group_data['name'],
-        "platform": rule_group_data['platform'],
-        "rules": rules
-    }
+    if args.plan:
+        plan_migration(selected_groups, len(rule_group_details))
+        return
     
-    # Import the rule group to the target CID
-    import_response = import_rule_group(target_bearer_token, new_rule_group_data)
-    logging.info(f'Imported rule group: {new_rule_group_data["name"]} to target CID {TARGET_CLIENT_ID}')
+    logging.info(f'Starting migration of {len(selected_groups)} rule groups from source CID {SOURCE_CLIENT_ID} to target CID {TARGET_CLIENT_ID}: {[group["name"] for group in selected_groups]}')
+    results = migrate_rule_groups(source_bearer_token, target_bearer_token, selected_groups, sync=args.sync)
     
-    print('Rule group copied successfully:', import_response)
+    statuses = {}
+    for result in results:
+        statuses[result['status']] = statuses.get(result['status'], 0) + 1
+    print(f'Migration finished for {len(selected_groups)} rule groups: {statuses}')
+    logging.info(f'Migration finished for {len(selected_groups)} rule groups: {statuses} {results}')
+
+def fan_out_main(args):
+    PARENT_CLIENT_ID = os.getenv('PARENT_CLIENT_ID')
+    PARENT_CLIENT_SECRET = os.getenv('PARENT_CLIENT_SECRET')
+    source_cid = args.source_cid or input('Enter the source member CID: ')
+    target_cids = read_cids(args.targets)
+
+    source_tokens = TokenManager(PARENT_CLIENT_ID, PARENT_CLIENT_SECRET, member_cid=source_cid)
+    source_bearer_token = source_tokens.get()
+
+    print("Available Rule Groups:")
+    rule_group_details = []
+    for chunk in iter_rule_group_details(source_bearer_token):
+        for rule_group in chunk:
+            rule_group_details.append(rule_group)
+            print(f"{len(rule_group_details)}. {rule_group['name']} (ID: {rule_group['id']})")
+
+    selection = args.groups or input("Enter the numbers of the rule groups to copy (e.g. 1,3,5-7 or all): ")
+    selected_groups = [rule_group_details[idx] for idx in parse_selection(selection, len(rule_group_details))]
+
+    if args.plan:
+        plan_fan_out(selected_groups, len(rule_group_details), target_cids, sync=args.sync)
+        return
+
+    logging.info(f'Fan-out of {[group["name"] for group in selected_groups]} from CID {source_cid} to {len(target_cids)} target CIDs')
+    exported_groups = export_rule_groups(source_bearer_token, selected_groups)
+    results = fan_out_rule_groups(PARENT_CLIENT_ID, PARENT_CLIENT_SECRET, exported_groups, target_cids, sync=args.sync)
+
+    failed_targets = [cid for cid, cid_results in results.items() if any(result['status'] == 'failed' for result in cid_results)]
+    print(f'Fan-out finished: {len(target_cids) - len(failed_targets)} of {len(target_cids)} target CIDs fully delivered')
+    logging.info(f'Fan-out finished, targets with failures: {failed_targets}')
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -1,79 +1,131 @@
 import requests
 import os
-from dotenv import load_dotenv
+import sys
+import csv
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-load_dotenv()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth.csoauth import TokenManager
+from oauth.cscids import read_cids
+from oauth.csfetch import iter_query_pages, iter_entities
+from oauth.csprofile import profiler, add_profile_arguments, start_from_args
+from oauth import cstrace
+from oauth.cstrace import tracer, add_trace_arguments
 
-client_id = os.getenv('CLIENT_ID')
-client_secret = os.getenv('CLIENT_SECRET')
 base_url = 'https://api.eu-1.crowdstrike.com'
 
-def get_bearer_token():
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
-    data = {
-        'client_id': client_id,
-        'client_secret': client_secret
-    }
-    response = requests.post(f'{base_url}/oauth2/token', headers=headers, data=data)
-    if response.status_code == 201:
-        return response.json()['access_token']
-    else:
-        raise Exception(f"Failed to get token: {response.status_code} {response.text}")
+INVENTORY_FIELDS = ['cid', 'group_id', 'name', 'platform', 'enabled', 'rule_count']
+INVENTORY_WORKERS = 8  # CIDs inventoried at the same time
 
-# Example usage
-try:
-    token = get_bearer_token()
-    #print(f"Bearer token: {token}")
-except Exception as e:
-    print(e)
-
-# Define your API credentials and endpoints
-api_token = token 
+def get_bearer_token():
+    # Minted in the tenant's own cloud; calls made with the token are routed there (oauth/csretry.py)
+    return TokenManager(os.getenv('CLIENT_ID'), os.getenv('CLIENT_SECRET')).get()
 
-# Function to list rule group IDs
-def list_rule_group_ids():
+# Function to list rule group IDs, page by page
+def list_rule_group_ids(api_token):
     headers = {
         'Authorization': f'Bearer {api_token}'
     }
-    response = requests.get(f'{base_url}/fwmgr/queries/rule-groups/v1', headers=headers)
-    if response.status_code == 200:
-        return response.json()['resources']
-    else:
-        raise Exception(f"Failed to list rule group IDs: {response.status_code} {response.text}")
+    try:
+        yield from iter_query_pages(f'{base_url}/fwmgr/queries/rule-groups/v1', headers)
+    except requests.exceptions.HTTPError as e:
+        raise Exception(f"Failed to list rule group IDs: {e.response.status_code} {e.response.text}")
 
-# Function to get rule group details by ID
-def get_rule_group_details(rule_group_ids):
+# Function to get rule group details for pages of IDs, in concurrent chunks
+def get_rule_group_details(api_token, rule_group_id_pages):
     headers = {
         'Authorization': f'Bearer {api_token}'
     }
-    params = {
-        'ids': rule_group_ids
-    }
-    response = requests.get(f'{base_url}/fwmgr/entities/rule-groups/v1', headers=headers, params=params)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise Exception(f"Failed to get rule group details: {response.status_code} {response.text}")
+    try:
+        for rule_groups in iter_entities(f'{base_url}/fwmgr/entities/rule-groups/v1', headers, rule_group_id_pages):
+            yield from rule_groups
+    except requests.exceptions.HTTPError as e:
+        raise Exception(f"Failed to get rule group details: {e.response.status_code} {e.response.text}")
+
+# Function to collect the inventory rows of one CID
+def inventory_cid(parent_client_id, parent_client_secret, cid):
+    with tracer.span(f'CID {cid}', **{'cs.cid': cid}):
+        return _inventory_rows(parent_client_id, parent_client_secret, cid)
+
+def _inventory_rows(parent_client_id, parent_client_secret, cid):
+    api_token = TokenManager(parent_client_id, parent_client_secret, member_cid=cid).get()
+    return [{
+        'cid': cid,
+        'group_id': rule_group['id'],
+        'name': rule_group['name'],
+        'platform': rule_group.get('platform'),
+        'enabled': rule_group.get('enabled'),
+        'rule_count': len(rule_group.get('rule_ids') or []),
+    } for rule_group in get_rule_group_details(api_token, list_rule_group_ids(api_token))]
+
+# Function to inventory many CIDs concurrently into a single CSV or JSONL file
+def write_inventory(parent_client_id, parent_client_secret, cids, output_path):
+    jsonl = output_path.lower().endswith(('.jsonl', '.json'))
+    total = 0
+    failed = []
+    # One writer, owned by this thread; workers only return rows
+    with open(output_path, 'w', newline='', buffering=1 << 20) as file:
+        writer = None if jsonl else csv.DictWriter(file, fieldnames=INVENTORY_FIELDS)
+        if writer:
+            writer.writeheader()
+        with ThreadPoolExecutor(max_workers=INVENTORY_WORKERS) as executor:
+            futures = {executor.submit(tracer.wrap(inventory_cid), parent_client_id, parent_client_secret, cid): cid for cid in cids}
+            for future in as_completed(futures):
+                cid = futures[future]
+                try:
+                    rows = future.result()
+                except Exception as e:
+                    print(f"CID {cid}: {e}")
+                    failed.append(cid)
+                    continue
+                with profiler.phase('write'):
+                    if jsonl:
+                        file.writelines(json.dumps(row) + "\n" for row in rows)
+                    else:
+                        writer.writerows(rows)
+                total += len(rows)
+                print(f"CID {cid}: {len(rows)} rule groups")
+    print(f"Inventory written to {output_path}: {total} rule groups from {len(cids) - len(failed)} of {len(cids)} CIDs")
+    if failed:
+        print(f"Failed CIDs: {failed}")
+
+def main():
+    parser = argparse.ArgumentParser(description='List firewall rule groups of one tenant, or inventory many CIDs.')
+    parser.add_argument('--inventory', help='CSV with a "cid" column; uses PARENT_CLIENT_ID/PARENT_CLIENT_SECRET and member CID tokens')
+    parser.add_argument('--output', default='firewall_inventory.csv', help='Inventory file, .csv or .jsonl')
+    add_profile_arguments(parser)
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    run_name = 'firewall_inventory' if args.inventory else 'firewall_rule_groups'
+    start_from_args(args, run_name)
+    cstrace.start_from_args(args, run_name)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    if args.inventory:
+        write_inventory(os.getenv('PARENT_CLIENT_ID'), os.getenv('PARENT_CLIENT_SECRET'), read_cids(args.inventory), args.output)
+        return
 
-# Example usage
-try:
-    rule_group_ids = list_rule_group_ids()
-    output_text = f"Rule Group IDs: {rule_group_ids}"
-    print(output_text)
-    
     with open("RuleGroupIDs.txt", "a") as file:
-        file.write(output_text + "\n")
-    
-    rule_group_details = get_rule_group_details(rule_group_ids)
-    for rule_group in rule_group_details['resources']:
-        output_text = f"Rule Group ID: {rule_group['id']}, Name: {rule_group['name']}"
-        print(output_text)
-        
-        with open("RuleGroupIDs.txt", "a") as file:
+        try:
+            api_token = get_bearer_token()
+            rule_group_count = 0
+            # Details are printed as soon as the first chunk arrives, while later pages are still listed
+            for rule_group in get_rule_group_details(api_token, list_rule_group_ids(api_token)):
+                rule_group_count += 1
+                output_text = f"Rule Group ID: {rule_group['id']}, Name: {rule_group['name']}"
+                print(output_text)
+                file.write(output_text + "\n")
+
+            output_text = f"Rule Groups listed: {rule_group_count}"
+            print(output_text)
             file.write(output_text + "\n")
-except Exception as e:
-    print(e)
-    with open("RuleGroupIDs.txt", "a") as file:
-        file.write(str(e) + "\n")
\ No newline at end of file
+        except Exception as e:
+            print(e)
+            file.write(str(e) + "\n")
+
+if __name__ == '__main__':
+    main()
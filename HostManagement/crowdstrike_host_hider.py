@@ -1,86 +1,576 @@
 import requests
 import csv
 import logging
+import math
+import os
+import re
+import sys
+import time
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth.csoauth import TokenManager
+from oauth.csplan import ApiPlan
+from oauth.csprofile import profiler, add_profile_arguments, start_from_args
+from oauth import cstrace
+from oauth.cstrace import tracer, add_trace_arguments
+from oauth.csratelimit import RateLimiter
+from oauth.csregion import route
+from oauth.csjson import decode
+from oauth.csscheduler import TenantScheduler
+from oauth.csstats import RunStats
 
 # --- Configuration ---
-client_id = ""  # Replace with your actual client ID
+client_id = ""  # Replace with your actual client ID (parent CID credentials for multi-CID runs)
 client_secret = ""  # Replace with your actual client secret
-base_url = "https://api.eu-1.crowdstrike.com"  # You can change this if you're using a different CrowdStrike region
-auth_url = "https://api.crowdstrike.com/oauth2/token"
-devices_url = f"{base_url}/devices/entities/devices-actions/v2?action_name=unhide_host"
+base_url = "https://api.eu-1.crowdstrike.com"  # Default region; each CID's real region is discovered from its token response
+auth_url = f"{base_url}/oauth2/token"
+devices_actions_url = f"{base_url}/devices/entities/devices-actions/v2"
+device_entities_url = f"{base_url}/devices/entities/devices/v2"
+hidden_devices_url = f"{base_url}/devices/queries/devices-hidden/v1"
+devices_scroll_url = f"{base_url}/devices/queries/devices-scroll/v1"
 csv_file_path = "host_ids.csv"  # Replace with the path to your CSV file
 log_file_path = "host_hiding.log"  # Path to the log file
+failed_file_path = "failed_host_ids.csv"  # IDs the API rejected even when sent on their own
+ledger_file_path = "host_action_ledger.csv"  # One row per input ID: host_id, cid, action, result, detail
+
+CONFIG = {
+    "max_in_flight": 8,  # Batch POSTs kept in flight at once
+    "max_in_flight_per_cid": 4,  # Multi-CID runs: cap per tenant so one large CID cannot take every slot
+    "max_consecutive_failures": 3,  # Multi-CID runs: stop a CID after this many failed batches in a row
+    "max_requests_per_minute": 3000,  # Per CID, shared by all threads, half the Falcon per-CID limit
+    "preflight_chunk": 5000,  # IDs per device-entity lookup (API maximum)
+    "hidden_query_chunk": 100,  # IDs per devices-hidden FQL filter (keeps the URL short)
+    "scroll_page_size": 5000,  # IDs per devices-scroll page (API maximum)
+}
+
+# Supported devices-actions. batch_size is the most IDs sent per POST for the action.
+# lookup/needs_action drive --preflight: "visible" hosts come from the entities API
+# (hidden hosts are not returned there), "hidden" hosts from the devices-hidden query.
+ACTIONS = {
+    "hide_host": {"batch_size": 100, "lookup": "visible", "needs_action": lambda device: True},
+    "unhide_host": {"batch_size": 100, "lookup": "hidden", "needs_action": lambda device: True},
+    "contain": {"batch_size": 100, "lookup": "visible",
+                "needs_action": lambda device: device.get("status") in ("normal", "lift_containment_pending")},
+    "lift_containment": {"batch_size": 100, "lookup": "visible",
+                         "needs_action": lambda device: device.get("status") in ("contained", "containment_pending")},
+}
 
-# --- Logging setup ---
-logging.basicConfig(filename=log_file_path, level=logging.INFO,
-                    format="%(asctime)s - %(levelname)s - %(message)s")
+AID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
 
 # --- Functions ---
 
-def get_access_token():
-    """Retrieves an access token from the CrowdStrike API."""
+def get_token_manager(member_cid=None):
+    """Returns a token manager that mints and refreshes access tokens on demand.
 
-    headers = {
-        "Content-Type": "application/x-www-form-urlencoded"
-    }
-    data = {
-        "client_id": client_id,
-        "client_secret": client_secret
-    }
+    The token response tells the manager which cloud the CID lives in (cached in cs_regions.json).
+    """
 
-    try:
-        response = requests.post(auth_url, headers=headers, data=data)
+    return TokenManager(client_id, client_secret, member_cid=member_cid)
+
+def get_rate_limiter(member_cid):
+    """Returns the rate limiter of a CID; the Falcon limit applies per CID."""
+
+    with _rate_limiters_lock:
+        if member_cid not in _rate_limiters:
+            _rate_limiters[member_cid] = RateLimiter(CONFIG["max_requests_per_minute"])
+        return _rate_limiters[member_cid]
+
+def action_url(action):
+    return f"{devices_actions_url}?action_name={action}"
+
+class ResultLedger:
+    """Thread-safe per-ID result log, written as CSV while the run progresses."""
+
+    def __init__(self, file_path, action, failed_path=None):
+        self.action = action
+        self.failed_path = failed_path or failed_file_path
+        self.counts = {"succeeded": 0, "failed": 0, "skipped": 0}
+        self.cid_counts = {}
+        self.failed_ids = []
+        self._lock = threading.Lock()
+        self._file = open(file_path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(["host_id", "cid", "action", "result", "detail"])
+
+    def record(self, host_ids, result, detail="", cid=None):
+        with self._lock:
+            self.counts[result] += len(host_ids)
+            cid_counts = self.cid_counts.setdefault(cid or "", {"succeeded": 0, "failed": 0, "skipped": 0})
+            cid_counts[result] += len(host_ids)
+            if result == "failed":
+                self.failed_ids.extend(host_ids)
+            self._writer.writerows([host_id, cid or "", self.action, result, detail] for host_id in host_ids)
+
+    def close(self):
+        with profiler.phase("write"):
+            self._file.close()
+            if self.failed_ids:
+                with open(self.failed_path, 'w', newline='') as file:
+                    csv.writer(file).writerows([host_id] for host_id in self.failed_ids)
+
+def read_host_ids(file_path):
+    """Streams host IDs from the CSV, skipping malformed and duplicate AIDs."""
+
+    seen = set()
+    invalid = 0
+    duplicates = 0
+    with open(file_path, 'r', newline='') as file:
+        for row in csv.reader(file):
+            if not row:
+                continue
+            host_id = row[0].strip().lower()
+            if not AID_PATTERN.match(host_id):
+                invalid += 1
+                logging.warning(f"Skipping malformed host ID: {row[0]!r}")
+                continue
+            if host_id in seen:
+                duplicates += 1
+                continue
+            seen.add(host_id)
+            yield host_id
+    print(f"Read {len(seen)} unique host IDs ({invalid} malformed, {duplicates} duplicates skipped)")
+    logging.info(f"Read {len(seen)} unique host IDs ({invalid} malformed, {duplicates} duplicates skipped)")
+
+def batched(iterable, size):
+    """Yields lists of up to `size` items without materialising the whole input."""
+
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def api_request(tokens, method, url, **kwargs):
+    """Sends a rate-limited request, re-minting the token once on 401.
+
+    `url` may name any region; it is sent to the CID's own region over that region's connection pool,
+    whose session retries 429s and transient errors (oauth/csretry.py).
+    """
+
+    for attempt in range(2):
+        token = tokens.get()
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        }
+        get_rate_limiter(tokens.member_cid).acquire()
+        response = tokens.session().request(method, route(url, tokens.region), headers=headers, **kwargs)
+        if response.status_code == 401 and attempt == 0:
+            tokens.invalidate(token)
+            continue
         response.raise_for_status()
-        access_token = response.json()["access_token"]
-        logging.info("Access token obtained successfully.")
-        return access_token
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error getting access token: {e}")
-        raise  # Re-raise the exception after logging
-
-def hide_hosts(access_token, host_ids):
-    """Hides a batch of hosts and logs the results."""
-
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-    data = {"ids": host_ids}
+        return response
+
+def submit_action(tokens, action, host_ids):
+    """Submits one batch of host IDs to the devices-actions endpoint."""
+
+    with profiler.phase("submit"), tracer.span(f"{action} batch", **{"cs.cid": tokens.member_cid, "cs.batch_size": len(host_ids)}):
+        response = api_request(tokens, "POST", action_url(action), json={"ids": host_ids})
+    for host_id in host_ids:
+        if response.status_code == 202:  # Log success with 202 status
+            logging.info(f"Host action {action} succeeded: {host_id}")
+        else:
+            logging.warning(f"Unexpected status code for {host_id}: {response.status_code}")
+    return decode(response)
+
+def lookup_visible_hosts(tokens, host_ids):
+    """Returns {device_id: entity} for IDs that exist and are not hidden."""
+
+    with profiler.phase("fetch"):
+        try:
+            response = api_request(tokens, "POST", device_entities_url, json={"ids": host_ids})
+        except requests.exceptions.HTTPError as e:
+            # 404 means none of the IDs resolved; partial misses come back as 200 with errors
+            if e.response is None or e.response.status_code != 404:
+                raise
+            response = e.response
+        return {device["device_id"]: device for device in decode(response).get("resources") or []}
+
+def lookup_hidden_hosts(tokens, host_ids):
+    """Returns {device_id: {}} for IDs that exist and are currently hidden."""
+
+    hidden = {}
+    chunk = CONFIG["hidden_query_chunk"]
+    for i in range(0, len(host_ids), chunk):
+        id_filter = ",".join(f"'{host_id}'" for host_id in host_ids[i:i + chunk])
+        params = {"filter": f"device_id:[{id_filter}]", "limit": chunk}
+        with profiler.phase("fetch"):
+            response = api_request(tokens, "GET", hidden_devices_url, params=params)
+        hidden.update({host_id: {} for host_id in decode(response).get("resources") or []})
+    return hidden
+
+def preflight_filter(tokens, action, host_ids, ledger, skip_lookup=None):
+    """Drops IDs whose state would not change, resolving state in large batched lookups.
+
+    Once skip_lookup() returns True the remaining IDs pass through unchecked; multi-CID runs
+    use it so draining a stopped CID into the ledger makes no more lookups.
+    """
+
+    spec = ACTIONS[action]
+    for chunk in batched(host_ids, CONFIG["preflight_chunk"]):
+        if skip_lookup and skip_lookup():
+            yield from chunk
+            continue
+        if spec["lookup"] == "visible":
+            devices = lookup_visible_hosts(tokens, chunk)
+        else:
+            devices = lookup_hidden_hosts(tokens, chunk)
+        with profiler.phase("diff"):
+            actionable = []
+            for host_id in chunk:
+                if host_id in devices and spec["needs_action"](devices[host_id]):
+                    actionable.append(host_id)
+                elif host_id in devices:
+                    ledger.record([host_id], "skipped", f"already {devices[host_id].get('status')}", tokens.member_cid)
+                else:
+                    ledger.record([host_id], "skipped", "unknown or not in a state this action applies to", tokens.member_cid)
+        yield from actionable
+
+def submit_with_isolation(tokens, action, host_ids, ledger):
+    """Submits a batch; if it is rejected, splits it in halves until the bad IDs are isolated.
+
+    Returns the error when the batch failed for a reason that is not about the IDs
+    (token, throttling, server or network errors), None otherwise.
+    """
 
     try:
-        print(f"Hiding {len(host_ids)} hosts...")  # Added print statement
-        response = requests.post(devices_url, headers=headers, json=data)
-        response.raise_for_status()
-        for host_id in host_ids:
-            if response.status_code == 202:  # Log success with 202 status
-                logging.info(f"Host hidden successfully: {host_id}")
-            else:
-                logging.warning(f"Unexpected status code for {host_id}: {response.status_code}")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error hiding hosts: {e}")
-        raise
+        submit_action(tokens, action, host_ids)
+        ledger.record(host_ids, "succeeded", cid=tokens.member_cid)
+        return None
+    except (requests.exceptions.RequestException, RuntimeError) as e:
+        status = getattr(getattr(e, "response", None), "status_code", None)
+        if status is None or status in (401, 429) or status >= 500:
+            # Not caused by the IDs themselves, splitting would only multiply the failing calls
+            logging.error(f"Batch of {len(host_ids)} failed with a non-ID error: {e}")
+            ledger.record(host_ids, "failed", str(e), tokens.member_cid)
+            return e
+        if len(host_ids) == 1:
+            logging.error(f"Host action {action} failed for {host_ids[0]}: {e}")
+            ledger.record(host_ids, "failed", str(e), tokens.member_cid)
+            return None
+        logging.warning(f"Batch of {len(host_ids)} failed ({e}), splitting to isolate bad IDs")
+    middle = len(host_ids) // 2
+    # Both halves are always submitted, so every ID gets a ledger row even if the left half hits a non-ID error
+    left = submit_with_isolation(tokens, action, host_ids[:middle], ledger)
+    right = submit_with_isolation(tokens, action, host_ids[middle:], ledger)
+    return left or right
+
+def submit_batch(tokens, action, host_ids, ledger):
+    """Multi-CID worker: like submit_with_isolation, but raises non-ID errors so the scheduler counts them."""
+
+    error = submit_with_isolation(tokens, action, host_ids, ledger)
+    if error:
+        raise error
+
+def run_pipeline(tokens, action, host_ids, ledger, batch_size=None, max_in_flight=None):
+    """Submits batches from any iterable of host IDs, keeping several POSTs in flight."""
+
+    batch_size = min(batch_size or ACTIONS[action]["batch_size"], ACTIONS[action]["batch_size"])
+    max_in_flight = max_in_flight or CONFIG["max_in_flight"]
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        in_flight = set()
+        for batch_ids in batched(host_ids, batch_size):
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            in_flight.add(executor.submit(tracer.wrap(submit_with_isolation), tokens, action, batch_ids, ledger))
+        for future in wait(in_flight).done:
+            future.result()
+
+def scroll_host_ids(tokens, fql_filter):
+    """Streams the IDs of hosts matching an FQL filter through the devices scroll query.
+
+    Only one page is held at a time, and the scroll snapshot is not affected by hosts
+    being hidden while it is still being read.
+    """
+
+    offset = None
+    while True:
+        params = {"filter": fql_filter, "limit": CONFIG["scroll_page_size"]}
+        if offset:
+            params["offset"] = offset
+        with profiler.phase("list"):
+            body = decode(api_request(tokens, "GET", devices_scroll_url, params=params))
+        host_ids = body.get("resources") or []
+        logging.info(f"Scroll page with {len(host_ids)} hosts for filter {fql_filter}")
+        yield from host_ids
+        offset = body.get("meta", {}).get("pagination", {}).get("offset")
+        if not host_ids or not offset:
+            break
+
+def count_matching_hosts(tokens, fql_filter):
+    """Returns the number of hosts matching an FQL filter from a single one-item page."""
+
+    params = {"filter": fql_filter, "limit": 1}
+    body = decode(api_request(tokens, "GET", devices_scroll_url, params=params))
+    return body.get("meta", {}).get("pagination", {}).get("total", 0)
+
+def stale_filter(days):
+    """FQL filter for hosts not seen for `days` days."""
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    return f"last_seen:<='{cutoff.strftime('%Y-%m-%dT%H:%M:%SZ')}'"
+
+def run_action(tokens, host_ids, action, source, batch_size=None, max_in_flight=None, preflight=False,
+               ledger_path=None, failed_path=None):
+    """Runs `action` on a stream of host IDs and reports the ledger counts.
+
+    With preflight, hosts already in the target state (or unknown) are skipped before any POST.
+    ledger_path/failed_path override the result files, so concurrent runs do not share them.
+    """
+
+    if action not in ACTIONS:
+        raise ValueError(f"Unsupported host action: {action}")
+    start_time = time.time()
+    ledger_path = ledger_path or ledger_file_path
+    ledger = ResultLedger(ledger_path, action, failed_path)
+
+    if preflight:
+        host_ids = preflight_filter(tokens, action, host_ids, ledger)
+
+    print(f"Running {action} on hosts from {source} ({max_in_flight or CONFIG['max_in_flight']} batches in flight)...")
+    try:
+        run_pipeline(tokens, action, host_ids, ledger, batch_size, max_in_flight)
+    finally:
+        ledger.close()
+
+    elapsed = time.time() - start_time
+    summary = (f"Host action {action} completed: {ledger.counts['succeeded']} succeeded, "
+               f"{ledger.counts['failed']} failed, {ledger.counts['skipped']} skipped as no-ops in {elapsed:.1f}s")
+    print(summary)
+    logging.info(summary)
+    print(f"Per-host results written to {ledger_path}")
+    if ledger.failed_ids:
+        print(f"Failed IDs written to {ledger.failed_path}")
+    return ledger.counts
+
+def process_csv(tokens, file_path, action, batch_size=None, max_in_flight=None, preflight=False):
+    """Streams host IDs from a CSV and runs `action` on them."""
+
+    return run_action(tokens, read_host_ids(file_path), action, file_path, batch_size, max_in_flight, preflight)
+
+def sweep_hosts(tokens, fql_filter, action, batch_size=None, max_in_flight=None, preflight=False):
+    """Runs `action` on every host matching `fql_filter`, submitting batches while the scroll is still running."""
+
+    return run_action(tokens, scroll_host_ids(tokens, fql_filter), action, f"filter {fql_filter}",
+                      batch_size, max_in_flight, preflight)
+
+def read_cid_host_pairs(file_path):
+    """Reads a (cid, host_id) CSV and groups the valid, unique host IDs by CID."""
+
+    cid_host_ids = {}
+    seen = set()
+    skipped = 0
+    with open(file_path, 'r', newline='') as file, profiler.phase("read"):
+        for row in csv.reader(file):
+            if len(row) < 2:
+                continue
+            cid = row[0].strip().lower().split("-")[0]  # Drop the checksum suffix of the console CID
+            host_id = row[1].strip().lower()
+            if not AID_PATTERN.match(cid) or not AID_PATTERN.match(host_id):
+                skipped += 1
+                logging.warning(f"Skipping malformed (cid, host_id) row: {row!r}")
+                continue
+            if (cid, host_id) in seen:
+                skipped += 1
+                continue
+            seen.add((cid, host_id))
+            cid_host_ids.setdefault(cid, []).append(host_id)
+    print(f"Read {len(seen)} host IDs across {len(cid_host_ids)} CIDs ({skipped} malformed or duplicate rows skipped)")
+    logging.info(f"Read {len(seen)} host IDs across {len(cid_host_ids)} CIDs ({skipped} malformed or duplicate rows skipped)")
+    return cid_host_ids
+
+def read_cid_directory(dir_path):
+    """Maps every <cid>.csv in a directory to a stream of its host IDs."""
+
+    cid_host_ids = {}
+    for name in sorted(os.listdir(dir_path)):
+        cid, ext = os.path.splitext(name)
+        if ext.lower() == ".csv":
+            cid_host_ids[cid.strip().lower().split("-")[0]] = read_host_ids(os.path.join(dir_path, name))
+    return cid_host_ids
+
+def run_multi_cid(cid_host_ids, action, batch_size=None, max_in_flight=None, preflight=False):
+    """Runs `action` across many child CIDs with parent credentials and member-CID tokens.
+
+    Batches are taken from the CIDs round-robin, each CID is capped at max_in_flight_per_cid,
+    and a CID whose batches keep failing is stopped, so one huge or broken tenant cannot
+    starve the others.
+    """
+
+    if action not in ACTIONS:
+        raise ValueError(f"Unsupported host action: {action}")
+    batch_size = min(batch_size or ACTIONS[action]["batch_size"], ACTIONS[action]["batch_size"])
+    max_in_flight = max_in_flight or CONFIG["max_in_flight"]
+    per_cid_cap = CONFIG["max_in_flight_per_cid"]
+    start_time = time.time()
+    ledger = ResultLedger(ledger_file_path, action)
+
+    queues = {}
+    tokens_by_cid = {}
+    stopped = set()
+    for cid, host_ids in cid_host_ids.items():
+        tokens = get_token_manager(cid)  # One token per CID, minted on first use and refreshed as needed
+        tokens_by_cid[cid] = tokens
+        if preflight:
+            host_ids = preflight_filter(tokens, action, host_ids, ledger, skip_lookup=lambda cid=cid: cid in stopped)
+        queues[cid] = batched(host_ids, batch_size)
+
+    def on_stop(cid, reason):
+        stopped.add(cid)
+
+    def on_abandon(cid, batch_ids):
+        ledger.record(batch_ids, "failed", "not sent, CID stopped after repeated failures", cid)
+
+    # CIDs with the most expected work (from earlier runs) start first
+    run_stats = RunStats("host_action")
+    batch_counts = {cid: math.ceil(len(host_ids) / batch_size) for cid, host_ids in cid_host_ids.items() if isinstance(host_ids, list)}
+    priority = run_stats.priorities(queues, batch_counts)
+    print(f"Running {action} across {len(queues)} CIDs ({max_in_flight} batches in flight, {per_cid_cap} per CID)...")
+    if priority:
+        print(f"Largest CIDs first, estimated {run_stats.eta(priority, max_in_flight, per_cid_cap):.0f}s from earlier runs")
+    scheduler = TenantScheduler(max_in_flight, per_cid_cap, CONFIG["max_consecutive_failures"])
+    try:
+        stats = scheduler.run(queues, lambda cid, batch_ids: submit_batch(tokens_by_cid[cid], action, batch_ids, ledger),
+                              on_abandon=on_abandon, priority=priority, on_stop=on_stop)
+    finally:
+        ledger.close()
+    run_stats.record_run(stats)
+    for cid, cid_stats in stats.items():
+        if cid_stats["stopped"]:
+            print(f"Stopped CID {cid}: {cid_stats['stopped']}")
+
+    elapsed = time.time() - start_time
+    for cid, counts in sorted(ledger.cid_counts.items()):
+        line = f"CID {cid}: {counts['succeeded']} succeeded, {counts['failed']} failed, {counts['skipped']} skipped"
+        print(line)
+        logging.info(line)
+    summary = (f"Host action {action} across {len(queues)} CIDs completed: {ledger.counts['succeeded']} succeeded, "
+               f"{ledger.counts['failed']} failed, {ledger.counts['skipped']} skipped as no-ops in {elapsed:.1f}s")
+    print(summary)
+    logging.info(summary)
+    print(f"Per-host results written to {ledger_file_path}")
+    return ledger.cid_counts
+
+def plan_csv(file_path, action, batch_size=None, preflight=False):
+    """Counts the calls process_csv would make without touching the API.
+
+    With preflight the POST count is an upper bound, since skipped hosts are only known at run time.
+    """
+
+    batch_size = min(batch_size or ACTIONS[action]["batch_size"], ACTIONS[action]["batch_size"])
+    total_hosts = sum(1 for _ in read_host_ids(file_path))
+
+    plan = ApiPlan(f"{action} on {total_hosts} hosts from {file_path}")
+    plan.add("POST", auth_url)
+    if preflight:
+        add_preflight_calls(plan, action, total_hosts)
+    plan.add("POST", action_url(action), math.ceil(total_hosts / batch_size), workers=CONFIG["max_in_flight"])
+    plan.report()
+    return plan
+
+def add_preflight_calls(plan, action, host_count, workers=1):
+    """Adds the state lookups preflight_filter makes for `host_count` hosts of one CID."""
+
+    if ACTIONS[action]["lookup"] == "visible":
+        plan.add("POST", device_entities_url, math.ceil(host_count / CONFIG["preflight_chunk"]), workers=workers)
+    else:
+        plan.add("GET", hidden_devices_url, math.ceil(host_count / CONFIG["hidden_query_chunk"]), workers=workers)
+
+def plan_multi_cid(cid_host_ids, action, batch_size=None, preflight=False):
+    """Counts the calls run_multi_cid would make without touching the API.
+
+    With preflight the POST count is an upper bound, as in plan_csv.
+    """
 
-def process_csv(access_token, file_path, batch_size=100):
-    """Reads host IDs from a CSV and hides them in batches."""
+    batch_size = min(batch_size or ACTIONS[action]["batch_size"], ACTIONS[action]["batch_size"])
+    counts = {cid: sum(1 for _ in host_ids) for cid, host_ids in cid_host_ids.items()}
 
-    with open(file_path, 'r') as file:
-        reader = csv.reader(file)
-        host_ids = [row[0] for row in reader]
+    plan = ApiPlan(f"{action} on {sum(counts.values())} hosts across {len(counts)} CIDs")
+    plan.add("POST", auth_url, len(counts))
+    if preflight:
+        # Each CID runs its own lookups, per_cid_cap of them at once, alongside the other CIDs
+        workers = min(CONFIG["max_in_flight"], CONFIG["max_in_flight_per_cid"] * len(counts))
+        for count in counts.values():
+            add_preflight_calls(plan, action, count, workers)
+    plan.add("POST", action_url(action), sum(math.ceil(count / batch_size) for count in counts.values()),
+             workers=CONFIG["max_in_flight"])
+    plan.report()
+    return plan
 
-    total_hosts = len(host_ids)
-    print(f"Processing {total_hosts} hosts from CSV...")  # Added print statement
+def plan_sweep(tokens, fql_filter, action, batch_size=None):
+    """Counts the calls sweep_hosts would make, using a single count query."""
 
-    for i in range(0, total_hosts, batch_size):
-        batch_ids = host_ids[i: i + batch_size]
-        hide_hosts(access_token, batch_ids)
+    batch_size = min(batch_size or ACTIONS[action]["batch_size"], ACTIONS[action]["batch_size"])
+    total_hosts = count_matching_hosts(tokens, fql_filter)
 
-    print("Host hiding completed.")  # Added print statement
+    plan = ApiPlan(f"{action} on {total_hosts} hosts matching {fql_filter}")
+    plan.add("POST", auth_url)
+    plan.add("GET", devices_scroll_url, math.ceil(total_hosts / CONFIG["scroll_page_size"]) + 1)
+    plan.add("POST", action_url(action), math.ceil(total_hosts / batch_size), workers=CONFIG["max_in_flight"])
+    plan.report()
+    return plan
 
 # --- Main execution ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a CrowdStrike host action on the hosts listed in a CSV.")
+    parser.add_argument("--action", choices=sorted(ACTIONS), required=True,
+                        help="devices-actions action_name (required, there is no default action)")
+    parser.add_argument("--csv", default=csv_file_path, help="CSV with one host ID per row")
+    parser.add_argument("--filter", help="Sweep all hosts matching this FQL filter instead of reading the CSV")
+    parser.add_argument("--stale-days", type=int, help="Sweep hosts not seen for this many days")
+    parser.add_argument("--cid-pairs", help="Multi-CID run: CSV of (cid, host_id) rows, parent credentials required")
+    parser.add_argument("--cid-dir", help="Multi-CID run: directory with one <cid>.csv of host IDs per child CID")
+    parser.add_argument("--yes", action="store_true", help="Do not ask for confirmation before a sweep")
+    parser.add_argument("--plan", action="store_true", help="Only count the API calls and estimate wall time")
+    parser.add_argument("--workers", type=int, default=CONFIG["max_in_flight"], help="Batch POSTs kept in flight")
+    parser.add_argument("--batch-size", type=int, help="IDs per POST, capped at the action's limit")
+    parser.add_argument("--preflight", action="store_true", help="Look up host state first and skip no-op hosts")
+    add_profile_arguments(parser)
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    if args.stale_days is not None and args.stale_days < 1:
+        parser.error("--stale-days must be at least 1")
+    start_from_args(args, "host_action")
+    cstrace.start_from_args(args, "host_action")
+    logging.basicConfig(filename=log_file_path, level=logging.INFO,
+                        format="%(asctime)s - %(levelname)s - %(message)s")
+    CONFIG["max_in_flight"] = args.workers
+    fql_filter = args.filter or (stale_filter(args.stale_days) if args.stale_days is not None else None)
+    if args.cid_pairs or args.cid_dir:
+        cid_host_ids = read_cid_host_pairs(args.cid_pairs) if args.cid_pairs else read_cid_directory(args.cid_dir)
+        if args.plan:
+            plan_multi_cid(cid_host_ids, args.action, args.batch_size, preflight=args.preflight)
+            sys.exit(0)
+        try:
+            run_multi_cid(cid_host_ids, args.action, args.batch_size, preflight=args.preflight)
+        except Exception as e:
+            logging.exception(f"An unexpected error occurred: {e}")
+        sys.exit(0)
+    if args.plan and not fql_filter:
+        plan_csv(args.csv, args.action, args.batch_size, preflight=args.preflight)
+        sys.exit(0)
     try:
-        access_token = get_access_token()
-        process_csv(access_token, csv_file_path)
+        tokens = get_token_manager()
+        if not fql_filter:
+            process_csv(tokens, args.csv, args.action, args.batch_size, preflight=args.preflight)
+        elif args.plan:
+            plan_sweep(tokens, fql_filter, args.action, args.batch_size)
+        else:
+            matching = count_matching_hosts(tokens, fql_filter)
+            print(f"{matching} hosts match {fql_filter}")
+            if args.yes or input(f"Run {args.action} on all of them? (yes/no): ").strip().lower() == "yes":
+                sweep_hosts(tokens, fql_filter, args.action, args.batch_size, preflight=args.preflight)
     except Exception as e:
         logging.exception(f"An unexpected error occurred: {e}")
@@ -0,0 +1,213 @@
+#Author: kshitijshukla345@gmail.com
+#Description: Incremental drift detection between a golden CID and its children. Keeps a per-entity
+#content hash and a per-(cid, kind) modified high-water mark, so each run only fetches what changed.
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth.csoauth import TokenManager
+from oauth.cscids import read_cids
+from oauth.csfetch import iter_query_pages
+from oauth.csload import load_script
+from oauth.csprofile import profiler, add_profile_arguments, start_from_args
+from oauth import cstrace
+from oauth.cstrace import tracer, add_trace_arguments
+
+# csinventory.py is a script like the others, so it is loaded by path rather than from Inventory/ on sys.path
+inventory = load_script("Inventory/csinventory.py")
+BASE_URL, DB_PATH, KIND_SCRIPTS = inventory.BASE_URL, inventory.DB_PATH, inventory.KIND_SCRIPTS
+open_store, auth_headers = inventory.open_store, inventory.auth_headers
+
+REPORT_PATH = "drift_report.csv"
+
+CONFIG = {
+    "max_workers": 8,  # (cid, kind) refreshes running at the same time
+}
+
+DRIFT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS drift_entities (
+    cid TEXT NOT NULL, kind TEXT NOT NULL, entity_id TEXT NOT NULL, name TEXT,
+    modified TEXT, content_hash TEXT, PRIMARY KEY (cid, kind, entity_id));
+CREATE TABLE IF NOT EXISTS drift_marks (
+    cid TEXT NOT NULL, kind TEXT NOT NULL, high_water TEXT, PRIMARY KEY (cid, kind));
+CREATE INDEX IF NOT EXISTS idx_drift_entities_name ON drift_entities (kind, name);
+"""
+
+# Query endpoint and modified-timestamp field used in the FQL filter, per kind
+KIND_QUERIES = {
+    "ioa": ("/ioarules/queries/rule-groups/v1", "modified_on"),
+    "firewall": ("/fwmgr/queries/rule-groups/v1", "modified_on"),
+    "device_control": ("/policy/queries/device-control/v1", "modified_timestamp"),
+}
+
+# Tenant-specific or server-managed fields, dropped at every level before hashing
+VOLATILE_FIELDS = {"id", "instance_id", "family", "rulegroup_id", "rule_group", "rule_ids", "rule_versions",
+                   "customer_id", "cid", "version", "instance_version", "tracking", "groups", "deleted",
+                   "created_by", "created_on", "created_timestamp", "modified_by", "modified_on",
+                   "modified_timestamp", "committed_on"}
+
+def strip_volatile(value):
+    if isinstance(value, dict):
+        return {key: strip_volatile(item) for key, item in value.items() if key not in VOLATILE_FIELDS}
+    if isinstance(value, list):
+        return [strip_volatile(item) for item in value]
+    return value
+
+
+def content_hash(entity):
+    return hashlib.sha256(json.dumps(strip_volatile(entity), sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+# --- Entity fetchers: return full entities (with rules where they live separately) for the given IDs ---
+
+def fetch_ioa(api_token, ids):
+    ioa = load_script("CustomIOA/ioaMTv1.4.0.py")
+    return [ioa.get_custom_ioa_rule_group_details(api_token, rule_group_id) for rule_group_id in ids]
+
+
+def fetch_firewall(api_token, ids):
+    migration = load_script("FirewallManagement/FirewallRuleGroupAPIMigration.py")
+    groups = migration.get_rule_group_details(api_token, ids)
+    for group in groups:
+        group["rules"] = migration.export_rule_details(api_token, group.get("rule_ids") or [])
+    return groups
+
+
+def fetch_device_control(api_token, ids):
+    exceptions_script = load_script("DeviceControlExceptions/exceptionV1.4.1.py")
+    return [exceptions_script.get_policy_details(api_token, policy_id) for policy_id in ids]
+
+
+FETCHERS = {"ioa": fetch_ioa, "firewall": fetch_firewall, "device_control": fetch_device_control}
+
+
+def list_ids(api_token, kind, fql_filter=None):
+    path, _ = KIND_QUERIES[kind]
+    params = {"filter": fql_filter} if fql_filter else None
+    return [entity_id for page in iter_query_pages(f"{BASE_URL}{path}", auth_headers(api_token), params) for entity_id in page]
+
+
+def refresh_kind(tokens, cid, kind, known_ids, high_water):
+    """Returns (changed entities, removed ids, new high-water mark, entity fetches made) for one (cid, kind)."""
+    with tracer.span(f"CID {cid} / {kind}", **{"cs.cid": cid, "cs.kind": kind}) as span:
+        result = _refresh_kind(tokens, cid, kind, known_ids, high_water)
+        span.set("cs.fetched", result[3])
+        span.set("cs.entities", result[4])
+        return result
+
+
+def _refresh_kind(tokens, cid, kind, known_ids, high_water):
+    api_token = tokens.get()
+    _, modified_field = KIND_QUERIES[kind]
+    # ID listings are cheap; they reveal deletions, which a modified filter never returns
+    all_ids = set(list_ids(api_token, kind))
+    removed = known_ids - all_ids
+    # >= so an edit made in the same second as the last run's newest entity is not missed; the
+    # entities at the mark itself are fetched again and deduplicated by ID
+    changed_ids = set(list_ids(api_token, kind, f"{modified_field}:>='{high_water}'")) if high_water else set(all_ids)
+    changed_ids |= all_ids - known_ids
+    entities = FETCHERS[kind](api_token, sorted(changed_ids)) if changed_ids else []
+    rows = {}
+    with profiler.phase("diff"):
+        for entity in entities:
+            modified = entity.get(modified_field) or ""
+            rows[entity["id"]] = (cid, kind, entity["id"], entity.get("name"), modified, content_hash(entity))
+            high_water = max(high_water or "", modified)
+    return list(rows.values()), removed, high_water, len(changed_ids), len(all_ids)
+
+
+def refresh(client_id, client_secret, cids, kinds, conn):
+    tokens = {cid: TokenManager(client_id, client_secret, member_cid=cid) for cid in cids}
+    for kind in kinds:
+        for script in KIND_SCRIPTS[kind]:
+            load_script(script)
+    marks = {(cid, kind): high_water for cid, kind, high_water in conn.execute("SELECT cid, kind, high_water FROM drift_marks")}
+    known = {}
+    for cid, kind, entity_id in conn.execute("SELECT cid, kind, entity_id FROM drift_entities"):
+        known.setdefault((cid, kind), set()).add(entity_id)
+
+    fetched = total = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=CONFIG["max_workers"]) as executor:
+        futures = {executor.submit(tracer.wrap(refresh_kind), tokens[cid], cid, kind, known.get((cid, kind), set()), marks.get((cid, kind))): (cid, kind)
+                   for cid in cids for kind in kinds}
+        for future in as_completed(futures):
+            cid, kind = futures[future]
+            try:
+                rows, removed, high_water, changed_count, entity_count = future.result()
+            except Exception as e:
+                logging.error(f"Drift refresh of {kind} for CID {cid} failed: {e}")
+                print(f"Drift refresh of {kind} for CID {cid} failed: {e}")
+                failed.append((cid, kind))
+                continue
+            # Single writer: only this thread touches SQLite
+            with conn, profiler.phase("write"):
+                conn.executemany("DELETE FROM drift_entities WHERE cid = ? AND kind = ? AND entity_id = ?",
+                                 [(cid, kind, entity_id) for entity_id in removed])
+                conn.executemany("INSERT OR REPLACE INTO drift_entities VALUES (?, ?, ?, ?, ?, ?)", rows)
+                conn.execute("INSERT OR REPLACE INTO drift_marks VALUES (?, ?, ?)", (cid, kind, high_water))
+            fetched += changed_count
+            total += entity_count
+            logging.info(f"CID {cid} {kind}: {changed_count} of {entity_count} entities fetched, {len(removed)} removed")
+    print(f"Fetched {fetched} of {total} entities ({(fetched / total * 100) if total else 0:.1f}% of a full crawl)")
+    return failed
+
+
+def drift_report(conn, golden_cid, cids, kinds, report_path=REPORT_PATH):
+    """Compares every child with the golden CID by entity name and content hash."""
+    rows = []
+    for kind in kinds:
+        with profiler.phase("diff"):
+            golden = {name: content_hash for name, content_hash in conn.execute(
+                "SELECT name, content_hash FROM drift_entities WHERE cid = ? AND kind = ?", (golden_cid, kind))}
+            for cid in cids:
+                if cid == golden_cid:
+                    continue
+                child = {name: content_hash for name, content_hash in conn.execute(
+                    "SELECT name, content_hash FROM drift_entities WHERE cid = ? AND kind = ?", (cid, kind))}
+                for name, golden_hash in golden.items():
+                    if name not in child:
+                        rows.append((cid, kind, name, "missing"))
+                    elif child[name] != golden_hash:
+                        rows.append((cid, kind, name, "different"))
+                rows.extend((cid, kind, name, "extra") for name in child if name not in golden)
+    with open(report_path, "w", newline="") as file, profiler.phase("report"):
+        writer = csv.writer(file)
+        writer.writerow(["cid", "kind", "name", "drift"])
+        writer.writerows(sorted(rows))
+    print(f"Drift report written to {report_path}: {len(rows)} differences")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect configuration drift from a golden CID, fetching only modified entities.")
+    parser.add_argument("--golden", required=True, help="Golden CID that the children should match")
+    parser.add_argument("--cids", default="target_cids.csv", help="CSV with a \"cid\" column")
+    parser.add_argument("--kinds", default=",".join(KIND_QUERIES), help=f"Comma-separated subset of {','.join(KIND_QUERIES)}")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite file (shared with csinventory.py)")
+    parser.add_argument("--report", default=REPORT_PATH, help="Drift report CSV")
+    add_profile_arguments(parser)
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    start_from_args(args, "drift")
+    cstrace.start_from_args(args, "drift")
+    logging.basicConfig(filename="cs_drift.log", level=logging.INFO,
+                        format="%(asctime)s - %(levelname)s - %(message)s")
+
+    kinds = [kind.strip() for kind in args.kinds.split(",") if kind.strip() in KIND_QUERIES]
+    cids = list(dict.fromkeys([args.golden] + read_cids(args.cids)))
+    conn = open_store(args.db)
+    conn.executescript(DRIFT_SCHEMA)
+    refresh(os.getenv("PARENT_CLIENT_ID"), os.getenv("PARENT_CLIENT_SECRET"), cids, kinds, conn)
+    drift_report(conn, args.golden, cids, kinds, args.report)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+#Author: kshitijshukla345@gmail.com
+#Description: Local SQLite inventory of custom IOA rule groups/rules, firewall rule groups/rules and
+#device control policies/exceptions across CIDs, crawled concurrently with the existing fetch functions.
+import argparse
+import csv
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth.csoauth import TokenManager
+from oauth.cscids import read_cids
+from oauth.csfetch import iter_query_pages
+from oauth.csload import load_script
+from oauth.csprofile import profiler, add_profile_arguments, start_from_args
+from oauth import cstrace
+from oauth.cstrace import tracer, add_trace_arguments
+
+BASE_URL = "https://api.eu-1.crowdstrike.com"
+DB_PATH = "cs_inventory.db"
+
+CONFIG = {
+    "max_workers": 8,  # (cid, kind) crawls running at the same time
+}
+
+KINDS = ("ioa", "firewall", "device_control")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawls (
+    cid TEXT NOT NULL, kind TEXT NOT NULL, refreshed_at REAL NOT NULL, item_count INTEGER,
+    PRIMARY KEY (cid, kind));
+CREATE TABLE IF NOT EXISTS ioa_rule_groups (
+    cid TEXT NOT NULL, id TEXT NOT NULL, name TEXT, platform TEXT, enabled INTEGER,
+    modified_on TEXT, raw TEXT, PRIMARY KEY (cid, id));
+CREATE TABLE IF NOT EXISTS ioa_rules (
+    cid TEXT NOT NULL, id TEXT NOT NULL, rulegroup_id TEXT, name TEXT, ruletype_id TEXT,
+    pattern_severity TEXT, disposition_id INTEGER, enabled INTEGER, modified_on TEXT, raw TEXT,
+    PRIMARY KEY (cid, id));
+CREATE TABLE IF NOT EXISTS fw_rule_groups (
+    cid TEXT NOT NULL, id TEXT NOT NULL, name TEXT, platform TEXT, enabled INTEGER,
+    rule_count INTEGER, modified_on TEXT, raw TEXT, PRIMARY KEY (cid, id));
+CREATE TABLE IF NOT EXISTS fw_rules (
+    cid TEXT NOT NULL, id TEXT NOT NULL, rule_group_id TEXT, name TEXT, action TEXT,
+    direction TEXT, enabled INTEGER, precedence INTEGER, modified_on TEXT, raw TEXT,
+    PRIMARY KEY (cid, rule_group_id, id));
+CREATE TABLE IF NOT EXISTS dc_policies (
+    cid TEXT NOT NULL, id TEXT NOT NULL, name TEXT, platform_name TEXT, enabled INTEGER,
+    modified_timestamp TEXT, raw TEXT, PRIMARY KEY (cid, id));
+CREATE TABLE IF NOT EXISTS dc_exceptions (
+    cid TEXT NOT NULL, policy_id TEXT NOT NULL, class_id TEXT, combined_id TEXT,
+    action TEXT, description TEXT);
+CREATE INDEX IF NOT EXISTS idx_ioa_rule_groups_name ON ioa_rule_groups (name);
+CREATE INDEX IF NOT EXISTS idx_ioa_rules_group ON ioa_rules (cid, rulegroup_id);
+CREATE INDEX IF NOT EXISTS idx_fw_rule_groups_name ON fw_rule_groups (name);
+CREATE INDEX IF NOT EXISTS idx_fw_rules_group ON fw_rules (cid, rule_group_id);
+CREATE INDEX IF NOT EXISTS idx_dc_policies_name ON dc_policies (name);
+CREATE INDEX IF NOT EXISTS idx_dc_exceptions_combined_id ON dc_exceptions (combined_id);
+CREATE INDEX IF NOT EXISTS idx_dc_exceptions_policy ON dc_exceptions (cid, policy_id);
+"""
+
+# Scripts whose fetch functions each crawler reuses
+KIND_SCRIPTS = {
+    "ioa": ("CustomIOA/ioaMTv1.4.0.py",),
+    "firewall": ("FirewallManagement/FwRgId.py", "FirewallManagement/FirewallRuleGroupAPIMigration.py"),
+    "device_control": ("DeviceControlExceptions/exceptionV1.4.1.py",),
+}
+
+# Tables rewritten when a (cid, kind) is refreshed
+KIND_TABLES = {
+    "ioa": ("ioa_rule_groups", "ioa_rules"),
+    "firewall": ("fw_rule_groups", "fw_rules"),
+    "device_control": ("dc_policies", "dc_exceptions"),
+}
+
+def open_store(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def auth_headers(api_token):
+    return {"Authorization": f"Bearer {api_token}"}
+
+
+# --- Crawlers: each returns {table: [row tuples]} for one CID, reusing the scripts' fetch functions ---
+
+def crawl_ioa(api_token, cid):
+    ioa = load_script("CustomIOA/ioaMTv1.4.0.py")
+    groups, rules = [], []
+    for page in iter_query_pages(f"{BASE_URL}/ioarules/queries/rule-groups/v1", auth_headers(api_token)):
+        for rule_group_id in page:
+            group = ioa.get_custom_ioa_rule_group_details(api_token, rule_group_id)
+            groups.append((cid, group["id"], group.get("name"), group.get("platform"), int(bool(group.get("enabled"))),
+                           group.get("modified_on"), json.dumps(group)))
+            # Rule group entities embed their rules; fall back to per-rule fetches if they do not
+            group_rules = group.get("rules")
+            if group_rules is None:
+                group_rules = [rule for rule_id in group.get("rule_ids", []) for rule in ioa.fetch_rule(api_token, rule_id)]
+            for rule in group_rules:
+                rules.append((cid, rule.get("instance_id") or rule.get("id"), group["id"], rule.get("name"),
+                              rule.get("ruletype_id"), rule.get("pattern_severity"), rule.get("disposition_id"),
+                              int(bool(rule.get("enabled"))), rule.get("modified_on"), json.dumps(rule)))
+    return {"ioa_rule_groups": groups, "ioa_rules": rules}
+
+
+def crawl_firewall(api_token, cid):
+    fwrg = load_script("FirewallManagement/FwRgId.py")
+    migration = load_script("FirewallManagement/FirewallRuleGroupAPIMigration.py")
+    groups, rules = [], []
+    for group in fwrg.get_rule_group_details(api_token, fwrg.list_rule_group_ids(api_token)):
+        rule_ids = group.get("rule_ids") or []
+        groups.append((cid, group["id"], group.get("name"), group.get("platform"), int(bool(group.get("enabled"))),
+                       len(rule_ids), group.get("modified_on"), json.dumps(group)))
+        for precedence, rule in enumerate(migration.export_rule_details(api_token, rule_ids)):
+            rules.append((cid, rule.get("family") or rule["id"], group["id"], rule.get("name"), rule.get("action"),
+                          rule.get("direction"), int(bool(rule.get("enabled"))), precedence,
+                          rule.get("modified_on"), json.dumps(rule)))
+    return {"fw_rule_groups": groups, "fw_rules": rules}
+
+
+def crawl_device_control(api_token, cid):
+    exceptions_script = load_script("DeviceControlExceptions/exceptionV1.4.1.py")
+    policies, exceptions = [], []
+    for page in iter_query_pages(f"{BASE_URL}/policy/queries/device-control/v1", auth_headers(api_token)):
+        for policy_id in page:
+            policy = exceptions_script.get_policy_details(api_token, policy_id)
+            policies.append((cid, policy["id"], policy.get("name"), policy.get("platform_name"),
+                             int(bool(policy.get("enabled"))), policy.get("modified_timestamp"), json.dumps(policy)))
+            for device_class in policy.get("settings", {}).get("classes", []):
+                for exception in device_class.get("exceptions", []):
+                    exceptions.append((cid, policy["id"], device_class.get("id"), exception.get("combined_id"),
+                                       exception.get("action"), exception.get("description")))
+    return {"dc_policies": policies, "dc_exceptions": exceptions}
+
+
+CRAWLERS = {"ioa": crawl_ioa, "firewall": crawl_firewall, "device_control": crawl_device_control}
+
+
+def crawl(tokens, cid, kind):
+    with tracer.span(f"CID {cid} / {kind}", **{"cs.cid": cid, "cs.kind": kind}):
+        return CRAWLERS[kind](tokens.get(), cid)
+
+
+def store_crawl(conn, cid, kind, tables):
+    # Replace everything known about (cid, kind) in one transaction, so readers never see half a refresh
+    with conn, profiler.phase("write"):
+        for table in KIND_TABLES[kind]:
+            conn.execute(f"DELETE FROM {table} WHERE cid = ?", (cid,))
+        for table, rows in tables.items():
+            if rows:
+                placeholders = ",".join("?" * len(rows[0]))
+                conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})", rows)
+        item_count = sum(len(rows) for rows in tables.values())
+        conn.execute("INSERT OR REPLACE INTO crawls VALUES (?, ?, ?, ?)", (cid, kind, time.time(), item_count))
+
+
+def stale_targets(conn, cids, kinds, max_age_hours):
+    # (cid, kind) pairs that were never crawled or are older than max_age_hours
+    if max_age_hours is None:
+        return [(cid, kind) for cid in cids for kind in kinds]
+    cutoff = time.time() - max_age_hours * 3600
+    fresh = {(cid, kind) for cid, kind in conn.execute("SELECT cid, kind FROM crawls WHERE refreshed_at >= ?", (cutoff,))}
+    return [(cid, kind) for cid in cids for kind in kinds if (cid, kind) not in fresh]
+
+
+def refresh(client_id, client_secret, cids, kinds=KINDS, max_age_hours=None, db_path=DB_PATH):
+    """Crawls the given CIDs concurrently and writes each (cid, kind) into the store as it completes."""
+    conn = open_store(db_path)
+    targets = stale_targets(conn, cids, kinds, max_age_hours)
+    print(f"Refreshing {len(targets)} (cid, kind) pairs, {len(cids) * len(kinds) - len(targets)} still fresh")
+    for kind in kinds:
+        # Load the scripts up front, from this thread only
+        for script in KIND_SCRIPTS[kind]:
+            load_script(script)
+    tokens = {cid: TokenManager(client_id, client_secret, member_cid=cid) for cid in {cid for cid, _ in targets}}
+    failed = []
+    # Workers only fetch; this thread is the single SQLite writer
+    with ThreadPoolExecutor(max_workers=CONFIG["max_workers"]) as executor:
+        futures = {executor.submit(tracer.wrap(crawl), tokens[cid], cid, kind): (cid, kind) for cid, kind in targets}
+        for future in as_completed(futures):
+            cid, kind = futures[future]
+            try:
+                tables = future.result()
+            except Exception as e:
+                logging.error(f"Crawl of {kind} for CID {cid} failed: {e}")
+                print(f"Crawl of {kind} for CID {cid} failed: {e}")
+                failed.append((cid, kind))
+                continue
+            store_crawl(conn, cid, kind, tables)
+            print(f"CID {cid}: {kind} refreshed ({sum(len(rows) for rows in tables.values())} rows)")
+    conn.close()
+    return failed
+
+
+# --- Offline queries ---
+
+def cids_missing_group(conn, group_name, kind="ioa"):
+    # CIDs with a completed crawl of `kind` that have no rule group called group_name
+    table = "ioa_rule_groups" if kind == "ioa" else "fw_rule_groups"
+    return [row[0] for row in conn.execute(
+        f"SELECT c.cid FROM crawls c WHERE c.kind = ? AND NOT EXISTS "
+        f"(SELECT 1 FROM {table} g WHERE g.cid = c.cid AND g.name = ?) ORDER BY c.cid", (kind, group_name))]
+
+
+def where_excepted(conn, combined_id):
+    return conn.execute(
+        "SELECT e.cid, p.name, e.class_id, e.action, e.description FROM dc_exceptions e "
+        "JOIN dc_policies p ON p.cid = e.cid AND p.id = e.policy_id WHERE e.combined_id = ? ORDER BY e.cid",
+        (combined_id,)).fetchall()
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local inventory of IOA, firewall and device control configuration across CIDs.")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    refresh_parser = subparsers.add_parser("refresh", help="Crawl CIDs into the store (PARENT_CLIENT_ID/PARENT_CLIENT_SECRET)")
+    refresh_parser.add_argument("--cids", default="target_cids.csv", help="CSV with a \"cid\" column")
+    refresh_parser.add_argument("--kinds", default=",".join(KINDS), help=f"Comma-separated subset of {','.join(KINDS)}")
+    refresh_parser.add_argument("--max-age", type=float, help="Only re-crawl (cid, kind) pairs older than this many hours")
+    refresh_parser.add_argument("--workers", type=int, default=CONFIG["max_workers"], help="Concurrent crawls")
+
+    missing_parser = subparsers.add_parser("missing-group", help="Which CIDs lack a rule group")
+    missing_parser.add_argument("name")
+    missing_parser.add_argument("--kind", choices=("ioa", "firewall"), default="ioa")
+
+    excepted_parser = subparsers.add_parser("excepted", help="Where is a combined ID excepted")
+    excepted_parser.add_argument("combined_id")
+
+    sql_parser = subparsers.add_parser("sql", help="Run a read-only SQL query against the store")
+    sql_parser.add_argument("query")
+
+    add_profile_arguments(parser)
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    run_name = f"inventory_{args.command.replace('-', '_')}"
+    start_from_args(args, run_name)
+    cstrace.start_from_args(args, run_name)
+    logging.basicConfig(filename="cs_inventory.log", level=logging.INFO,
+                        format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.command == "refresh":
+        CONFIG["max_workers"] = args.workers
+        kinds = [kind.strip() for kind in args.kinds.split(",") if kind.strip() in KINDS]
+        refresh(os.getenv("PARENT_CLIENT_ID"), os.getenv("PARENT_CLIENT_SECRET"), read_cids(args.cids),
+                kinds, args.max_age, args.db)
+        return
+
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    if args.command == "missing-group":
+        for cid in cids_missing_group(conn, args.name, args.kind):
+            print(cid)
+    elif args.command == "excepted":
+        for row in where_excepted(conn, args.combined_id):
+            print(",".join("" if value is None else str(value) for value in row))
+    else:
+        writer = csv.writer(sys.stdout)
+        cursor = conn.execute(args.query)
+        writer.writerow([column[0] for column in cursor.description])
+        writer.writerows(cursor)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+#Author: kshitijshukla345@gmail.com
+#Description: Resident local job service. Loads the scripts once and keeps member-CID tokens and HTTP connection
+#pools warm, so IOA copies, exception pushes, firewall migrations and host actions run as jobs without a cold start.
+import argparse
+import getpass
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth.csoauth import TokenManager
+from oauth.csload import load_script
+from oauth.csprofile import profiler, add_profile_arguments, start_from_args
+from oauth import cstrace
+from oauth.cstrace import tracer, add_trace_arguments
+
+CONFIG = {
+    "host": "127.0.0.1",  # Local only; the service acts with parent credentials
+    "port": 8765,
+    "max_jobs": 4,  # Jobs running at the same time, the rest wait in the queue
+    "job_history": 500,  # Finished jobs kept for GET /jobs
+    "job_dir": "service_jobs",  # Per-job result files (host action ledgers)
+}
+
+SCRIPTS = {
+    "host": "HostManagement/crowdstrike_host_hider.py",
+    "exceptions": "DeviceControlExceptions/exceptionV1.4.1.py",
+    "ioa": "CustomIOA/ioaMTv1.4.0.py",
+    "firewall": "FirewallManagement/FirewallRuleGroupAPIMigration.py",
+}
+
+class JobService:
+    """Runs jobs on a bounded pool with one cached TokenManager per CID."""
+
+    def __init__(self, client_id, client_secret, max_jobs=None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.started = time.time()
+        self.scripts = {name: load_script(path) for name, path in SCRIPTS.items()}
+        self.handlers = {
+            "host_action": self.run_host_action,
+            "exception_push": self.run_exception_push,
+            "ioa_copy": self.run_ioa_copy,
+            "firewall_migration": self.run_firewall_migration,
+        }
+        self._tokens = {}
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._excluded_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs or CONFIG["max_jobs"])
+        os.makedirs(CONFIG["job_dir"], exist_ok=True)
+
+    def tokens(self, cid):
+        with self._lock:
+            if cid not in self._tokens:
+                self._tokens[cid] = TokenManager(self.client_id, self.client_secret, member_cid=cid)
+            return self._tokens[cid]
+
+    # --- Job handlers: params dict in, JSON-serializable result out ---
+
+    def run_host_action(self, job_id, params):
+        host = self.scripts["host"]
+        host_ids = list(dict.fromkeys(host_id.strip().lower() for host_id in params["host_ids"]))
+        valid_ids = [host_id for host_id in host_ids if host.AID_PATTERN.match(host_id)]
+        ledger_path = os.path.join(CONFIG["job_dir"], f"{job_id}_ledger.csv")
+        counts = host.run_action(self.tokens(params["cid"]), valid_ids, params["action"],
+                                 f"job {job_id}", preflight=params.get("preflight", False), ledger_path=ledger_path,
+                                 failed_path=os.path.join(CONFIG["job_dir"], f"{job_id}_failed.csv"))
+        return {"counts": counts, "invalid": len(host_ids) - len(valid_ids), "ledger": ledger_path}
+
+    def run_exception_push(self, job_id, params):
+        exceptions_script = self.scripts["exceptions"]
+        combined_ids = [combined_id for combined_id in params["combined_ids"] if exceptions_script.pattern.match(combined_id)]
+        results = []
+        excluded_ids = []
+        for cid in params["cids"]:
+            try:
+                cid_results, cid_excluded_ids = exceptions_script.push_cid_exceptions(
+                    self.tokens(cid).get(), cid, combined_ids, params["description"])
+                results.extend(cid_results)
+                excluded_ids.extend(cid_excluded_ids)
+            except Exception as e:
+                logging.error(f"Job {job_id}: exception push to CID {cid} failed: {e}")
+                results.append({"cid": cid, "status": "failed", "error": str(e)})
+        with self._excluded_lock:
+            exceptions_script.save_excluded_ids(excluded_ids)
+        return {"results": results, "skipped_non_standard": len(params["combined_ids"]) - len(combined_ids)}
+
+    def run_ioa_copy(self, job_id, params):
+        source_token = self.tokens(params["source_cid"]).get()
+        destination_token = self.tokens(params["destination_cid"]).get()
+        return {"results": self.scripts["ioa"].copy_rule_groups(source_token, destination_token, params["rule_group_ids"])}
+
+    def run_firewall_migration(self, job_id, params):
+        firewall = self.scripts["firewall"]
+        source_token = self.tokens(params["source_cid"]).get()
+        target_token = self.tokens(params["target_cid"]).get()
+        rule_groups = [rule_group for chunk in firewall.iter_rule_group_details(source_token) for rule_group in chunk]
+        groups = params.get("groups", "all")
+        if isinstance(groups, list):
+            selected_groups = [rule_group for rule_group in rule_groups if rule_group["name"] in groups or rule_group["id"] in groups]
+        else:
+            selected_groups = [rule_groups[idx] for idx in firewall.parse_selection(groups, len(rule_groups))]
+        return {"results": firewall.migrate_rule_groups(source_token, target_token, selected_groups, sync=params.get("sync", False))}
+
+    # --- Job bookkeeping ---
+
+    def submit(self, job_type, params):
+        if job_type not in self.handlers:
+            raise ValueError(f"Unknown job type {job_type!r}, expected one of {sorted(self.handlers)}")
+        job = {"id": uuid.uuid4().hex, "type": job_type, "status": "queued", "submitted": time.time(),
+               "started": None, "finished": None, "result": None, "error": None, "future": None}
+        # The job is complete before it is published, so readers never see a dict that is still growing
+        with self._lock:
+            job["future"] = self._executor.submit(self._run, job, params)
+            self._jobs[job["id"]] = job
+            self._trim_history()
+        logging.info(f"Job {job['id']} ({job_type}) queued")
+        return job
+
+    def _run(self, job, params):
+        job["status"] = "running"
+        job["started"] = time.time()
+        try:
+            with profiler.phase(f"job {job['type']}"), tracer.span(f"job {job['type']}", **{"cs.job_id": job["id"]}):
+                job["result"] = self.handlers[job["type"]](job["id"], params)
+            job["status"] = "succeeded"
+        except Exception as e:
+            job["error"] = str(e)
+            job["status"] = "failed"
+            logging.error(f"Job {job['id']} ({job['type']}) failed: {e}")
+        job["finished"] = time.time()
+        logging.info(f"Job {job['id']} ({job['type']}) {job['status']} in {job['finished'] - job['started']:.2f}s")
+
+    def _trim_history(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job["finished"]]
+        for job_id in finished[:max(0, len(self._jobs) - CONFIG["job_history"])]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def health(self):
+        return {"uptime": round(time.time() - self.started, 1), "warm_tokens": len(self._tokens),
+                "jobs": len(self._jobs), "job_types": sorted(self.handlers)}
+
+
+def public_job(job):
+    return {key: value for key, value in job.items() if key != "future"}
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """POST /jobs {"type", "params", "wait"}; GET /jobs, /jobs/<id>, /health.
+
+    Every request needs the X-Service-Key header and a Host header naming the service itself,
+    so a web page the operator happens to open cannot reach it through DNS rebinding.
+    """
+
+    service = None
+    api_key = None
+    allowed_hosts = frozenset()
+
+    def _reply(self, status, body):
+        data = json.dumps(body, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self):
+        if (self.headers.get("Host") or "").lower() not in self.allowed_hosts:
+            self._reply(400, {"error": "unexpected Host header"})
+            return False
+        if not self.api_key or not hmac.compare_digest(self.headers.get("X-Service-Key", "").encode(), self.api_key.encode()):
+            self._reply(401, {"error": "missing or wrong X-Service-Key"})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path == "/health":
+            self._reply(200, self.service.health())
+        elif self.path == "/jobs":
+            self._reply(200, [public_job(job) for job in self.service.list()])
+        elif self.path.startswith("/jobs/"):
+            job = self.service.get(self.path[len("/jobs/"):])
+            if job:
+                self._reply(200, public_job(job))
+            else:
+                self._reply(404, {"error": "unknown job"})
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if self.path != "/jobs":
+            self._reply(404, {"error": "not found"})
+            return
+        if self.headers.get("Content-Type", "").split(";")[0].strip().lower() != "application/json":
+            self._reply(415, {"error": "Content-Type must be application/json"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            job = self.service.submit(request.get("type"), request.get("params") or {})
+        except (ValueError, KeyError) as e:
+            self._reply(400, {"error": str(e)})
+            return
+        if request.get("wait"):
+            job["future"].result()
+            self._reply(200, public_job(job))
+        else:
+            self._reply(202, public_job(job))
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} {format % args}")
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def allowed_hosts(host, port):
+    # Host header values the service answers to: the bind address, plus the loopback names when bound locally
+    names = {host}
+    if is_loopback(host):
+        names.update({"127.0.0.1", "localhost", "[::1]"})
+    names.update(name.strip() for name in os.getenv("SERVICE_ALLOWED_HOSTS", "").split(",") if name.strip())
+    names = {f"[{name}]" if ":" in name and not name.startswith("[") else name for name in names}
+    return frozenset(f"{name}:{port}".lower() for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the CrowdStrike scripts as jobs of a resident local HTTP service.")
+    parser.add_argument("--host", default=CONFIG["host"], help="Bind address (keep it local; any other address needs SERVICE_API_KEY)")
+    parser.add_argument("--port", type=int, default=CONFIG["port"])
+    parser.add_argument("--max-jobs", type=int, default=CONFIG["max_jobs"], help="Jobs running at the same time")
+    add_profile_arguments(parser)
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    api_key = os.getenv("SERVICE_API_KEY")
+    if not is_loopback(args.host) and not api_key:
+        parser.error(f"--host {args.host} is not a loopback address; set SERVICE_API_KEY before exposing the service")
+    start_from_args(args, "service")
+    cstrace.start_from_args(args, "service")
+    logging.basicConfig(filename="cs_service.log", level=logging.INFO,
+                        format="%(asctime)s - %(levelname)s - %(message)s")
+
+    # Credentials are read once at startup instead of on every run
+    client_id = os.getenv("PARENT_CLIENT_ID") or input("Enter the parent client ID: ")
+    client_secret = os.getenv("PARENT_CLIENT_SECRET") or getpass.getpass("Enter the parent client secret: ")
+
+    ServiceHandler.service = JobService(client_id, client_secret, args.max_jobs)
+    if not api_key:
+        # No key configured: mint one for this run; it is printed once and never logged
+        api_key = secrets.token_urlsafe(32)
+        print(f"SERVICE_API_KEY is not set, send this X-Service-Key for this run: {api_key}")
+    ServiceHandler.api_key = api_key
+    server = ThreadingHTTPServer((args.host, args.port), ServiceHandler)
+    ServiceHandler.allowed_hosts = allowed_hosts(args.host, server.server_address[1])
+    print(f"Service listening on http://{args.host}:{args.port} (job types: {', '.join(sorted(ServiceHandler.service.handlers))})")
+    logging.info(f"Service started on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logging.info("Service stopped")
+
+
+if __name__ == "__main__":
+    main()
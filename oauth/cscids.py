@@ -0,0 +1,9 @@
+#Author: kshitijshukla345@gmail.com
+#Description: Reads the target CID list (target_cids.csv format) shared by the multi-CID scripts.
+import csv
+
+
+def read_cids(file_path):
+    """Returns the CIDs in the "cid" column of a CSV, skipping blank rows."""
+    with open(file_path, newline="") as file:
+        return [row["cid"].strip() for row in csv.DictReader(file) if (row.get("cid") or "").strip()]
@@ -0,0 +1,75 @@
+#Author: kshitijshukla345@gmail.com
+#Description: Paginated ID queries and chunked, concurrent entity fetches for Falcon query/entity endpoint pairs.
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from oauth.csjson import decode
+from oauth.csprofile import profiler
+from oauth.csretry import session
+from oauth.cstrace import tracer
+
+FETCH_CONFIG = {
+    "page_size": 100,  # IDs per queries/ page
+    "chunk_size": 100,  # IDs per entities/ GET
+    "max_workers": 8,  # Concurrent entity chunk fetches
+}
+
+
+def iter_query_pages(url, headers, params=None, page_size=None, get=None):
+    """Yields pages of IDs from a queries/ endpoint, following offset pagination to the end."""
+    get = get or session.get
+    page_size = page_size or FETCH_CONFIG["page_size"]
+    offset = 0
+    while True:
+        page_params = dict(params or {}, offset=offset, limit=page_size)
+        with profiler.phase("list"):
+            response = get(url, headers=headers, params=page_params)
+        response.raise_for_status()
+        body = decode(response)
+        ids = body.get("resources") or []
+        if ids:
+            yield ids
+        offset += len(ids)
+        total = body.get("meta", {}).get("pagination", {}).get("total", 0)
+        if not ids or offset >= total:
+            break
+
+
+def fetch_entity_chunk(url, headers, ids, get=None):
+    with profiler.phase("fetch"):
+        response = (get or session.get)(url, headers=headers, params={"ids": ids})
+    response.raise_for_status()
+    return decode(response).get("resources") or []
+
+
+def iter_entities(url, headers, id_pages, chunk_size=None, max_workers=None, get=None):
+    """Fetches the entities for a stream of ID pages in concurrent chunks.
+
+    Yields one list of entities per chunk, in chunk order, as soon as that chunk and all
+    chunks before it are done, so callers can show the first page while later ones load.
+    """
+    chunk_size = chunk_size or FETCH_CONFIG["chunk_size"]
+    max_workers = max_workers or FETCH_CONFIG["max_workers"]
+    pending = deque()
+    id_pages = iter(id_pages)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            # Keep the pool busy by pulling the next ID page while chunks are in flight
+            while len(pending) < max_workers:
+                ids = next(id_pages, None)
+                if ids is None:
+                    break
+                for i in range(0, len(ids), chunk_size):
+                    pending.append(executor.submit(tracer.wrap(fetch_entity_chunk), url, headers, ids[i:i + chunk_size], get))
+            if not pending:
+                break
+            yield pending.popleft().result()
+
+
+def fetch_entities(url, headers, ids, chunk_size=None, max_workers=None, get=None):
+    """Returns the entities for `ids`, fetched in concurrent chunks, in chunk order."""
+    chunk_size = chunk_size or FETCH_CONFIG["chunk_size"]
+    ids = list(ids)
+    return [entity for chunk in iter_entities(url, headers, [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)],
+                                              chunk_size, max_workers, get)
+            for entity in chunk]
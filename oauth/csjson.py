@@ -0,0 +1,106 @@
+#Author: kshitijshukla345@gmail.com
+#Description: Parses each response body once, with orjson when it is installed, and very large
+#documents can be streamed as parse events (ijson) so only the needed fields are kept.
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_CONFIG = {
+    "stream_chunk_size": 64 * 1024,  # Bytes read per step when streaming a body
+}
+
+CODEC = "orjson" if orjson else "json"
+_MISSING = object()
+_ijson = _MISSING  # Resolved on the first iter_events call, so importing this module stays cheap
+
+
+def loads(data):
+    """Parses JSON text or bytes with the fastest available codec."""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def decode(response):
+    """Parses a response body once; later calls on the same response return the same object."""
+    body = getattr(response, "_cs_body", _MISSING)
+    if body is _MISSING:
+        body = loads(response.content)
+        response._cs_body = body
+    return body
+
+
+class _ChunkReader:
+    """File-like view over response.iter_content, as ijson wants something with read().
+
+    read(size) returns at most `size` bytes and keeps the rest of a chunk for the next call;
+    ijson probes the reader with read(0), which must not consume anything.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+
+    def read(self, size=-1):
+        if size == 0:
+            return b""
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+def _scalar_event(value):
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, str):
+        return "string"
+    return "number"
+
+
+def _walk(value, prefix):
+    # Same (prefix, event, value) tuples ijson.parse yields, for when ijson is not installed
+    if isinstance(value, dict):
+        yield prefix, "start_map", None
+        for key, item in value.items():
+            yield prefix, "map_key", key
+            yield from _walk(item, f"{prefix}.{key}" if prefix else key)
+        yield prefix, "end_map", None
+    elif isinstance(value, list):
+        yield prefix, "start_array", None
+        for item in value:
+            yield from _walk(item, f"{prefix}.item" if prefix else "item")
+        yield prefix, "end_array", None
+    else:
+        yield prefix, _scalar_event(value), value
+
+
+def iter_events(response):
+    """Yields ijson-style (prefix, event, value) parse events for a response body.
+
+    Prefixes join map keys with "." and use "item" for array elements, e.g.
+    "resources.item.name". With ijson the body is read in chunks (request it with
+    stream=True) and no object tree is built; without it the body is decoded once and walked.
+    """
+    global _ijson
+    if _ijson is _MISSING:
+        try:
+            import ijson as _ijson
+        except ImportError:
+            _ijson = None
+    if _ijson is None:
+        yield from _walk(decode(response), "")
+        return
+    reader = _ChunkReader(response.iter_content(JSON_CONFIG["stream_chunk_size"]))
+    yield from _ijson.parse(reader)
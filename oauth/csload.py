@@ -0,0 +1,25 @@
+import importlib.util
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_loaded = {}
+
+
+def load_script(relative_path):
+    """Imports one of the repo's scripts (e.g. "CustomIOA/ioaMTv1.4.0.py") as a module.
+
+    The versioned file names are not valid module names, so they are loaded by path.
+    Scripts keep logging setup, .env loading and heavy imports (pandas) inside main() or
+    the functions that need them, so loading one is cheap and has no side effects.
+    """
+    if relative_path not in _loaded:
+        path = os.path.join(REPO_ROOT, relative_path)
+        name = "cs_" + os.path.splitext(os.path.basename(path))[0].replace(".", "_")
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+        _loaded[relative_path] = module
+    return _loaded[relative_path]
@@ -1,7 +1,12 @@
-import requests
+import threading
+import time
 
-def get_bearer(client_id, client_secret, member_cid=None):
-    token_url = "https://api.eu-1.crowdstrike.com/oauth2/token"
+from oauth import csregion, csretry
+from oauth.csprofile import profiler
+
+TOKEN_URL = csregion.token_url(csregion.DEFAULT_REGION)
+
+def request_token_response(client_id, client_secret, member_cid=None, token_url=TOKEN_URL):
     token_headers = {
         "accept": "application/json",
         "Content-Type": "application/x-www-form-urlencoded"
@@ -10,10 +15,76 @@ def get_bearer(client_id, client_secret, member_cid=None):
         "client_id": client_id,
         "client_secret": client_secret
     }
-    
+
     if member_cid and "09a068" not in member_cid:
         data["member_cid"] = member_cid
 
-    token_response = requests.post(token_url, headers=token_headers, data=data)
-    bearer_token = token_response.json().get("access_token")
-    return bearer_token
\ No newline at end of file
+    with profiler.phase("auth"):
+        return csretry.session.post(token_url, headers=token_headers, data=data)
+
+def request_token(client_id, client_secret, member_cid=None, token_url=TOKEN_URL):
+    return request_token_response(client_id, client_secret, member_cid, token_url).json()
+
+def get_bearer(client_id, client_secret, member_cid=None):
+    """Mints a token in the tenant's own cloud; RetrySession routes the calls made with it there."""
+    return TokenManager(client_id, client_secret, member_cid=member_cid).get()
+
+
+class TokenManager:
+    """Thread-safe bearer token that is re-minted before it expires or after a 401.
+
+    Without an explicit token_url the CID's region comes from the region cache, and every
+    token response's region header updates it, so .base_url always points at the tenant's cloud.
+    """
+
+    def __init__(self, client_id, client_secret, member_cid=None, token_url=None, refresh_margin=120):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.member_cid = member_cid
+        self.region_key = member_cid or client_id
+        self.region = csregion.cached_region(self.region_key) or csregion.DEFAULT_REGION
+        self.fixed_token_url = token_url is not None
+        self.token_url = token_url or csregion.token_url(self.region)
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0.0
+
+    def get(self):
+        """Returns a valid token, minting a new one only when the current one is about to expire."""
+        with self._lock:
+            if self._token is None or time.time() >= self._expires_at - self.refresh_margin:
+                token_response = request_token_response(self.client_id, self.client_secret, self.member_cid, self.token_url)
+                token_json = token_response.json()
+                region = csregion.region_from_response(token_response)
+                if region:
+                    self.region = region
+                    csregion.remember_region(self.region_key, region)
+                    if not self.fixed_token_url:
+                        self.token_url = csregion.token_url(region)
+                if "access_token" not in token_json:
+                    raise RuntimeError(f"Failed to get token for CID {self.member_cid}: {token_json.get('errors')}")
+                self._token = token_json["access_token"]
+                csretry.register_token(self._token, self.member_cid, self.region)
+                self._expires_at = time.time() + token_json.get("expires_in", 1799)
+            return self._token
+
+    @property
+    def base_url(self):
+        return csregion.base_url(self.region)
+
+    def session(self):
+        """Shared connection pool for this tenant's region."""
+        return csregion.get_session(self.region)
+
+    def invalidate(self, token):
+        """Forces a re-mint on the next get() unless another thread already replaced `token`."""
+        with self._lock:
+            if self._token == token:
+                self._token = None
+
+    def headers(self, content_type=None):
+        headers = {"Authorization": f"Bearer {self.get()}"}
+        if content_type:
+            headers["Content-Type"] = content_type
+        return headers
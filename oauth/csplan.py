@@ -0,0 +1,79 @@
+#Author: kshitijshukla345@gmail.com
+#Description: Dry-run planner used by the --plan switch of the bulk scripts.
+#Counts the reads and writes a run would make per endpoint and estimates wall time.
+import logging
+import math
+
+# Default assumptions for the wall time estimate (override per run if needed)
+PLAN_CONFIG = {
+    "avg_latency": 0.4,  # Average seconds per API round trip
+    "rate_limit_per_minute": 6000,  # Falcon API requests per minute per CID
+}
+
+WRITE_METHODS = ("POST", "PATCH", "PUT", "DELETE")
+AUTH_ENDPOINT = "/oauth2/token"
+
+
+def endpoint_path(url):
+    """Strips the scheme, host and query string so calls group by endpoint."""
+    path = url.split("://", 1)[-1]
+    path = "/" + path.split("/", 1)[1] if "/" in path else "/"
+    return path.split("?", 1)[0]
+
+
+class ApiPlan:
+    """Collects the API calls a run would make, grouped by method and endpoint."""
+
+    def __init__(self, title):
+        self.title = title
+        self.calls = {}  # (method, endpoint) -> {"count": n, "workers": w}
+
+    def add(self, method, url, count=1, workers=1):
+        """Records `count` calls of `method` against `url`, issued `workers` at a time."""
+        if count <= 0:
+            return
+        key = (method.upper(), endpoint_path(url))
+        entry = self.calls.setdefault(key, {"count": 0, "workers": workers})
+        entry["count"] += count
+        entry["workers"] = max(entry["workers"], workers)
+
+    def merge(self, other):
+        for (method, endpoint), entry in other.calls.items():
+            self.add(method, endpoint, entry["count"], entry["workers"])
+
+    @property
+    def auth(self):
+        return sum(e["count"] for (_, p), e in self.calls.items() if p == AUTH_ENDPOINT)
+
+    @property
+    def reads(self):
+        return sum(e["count"] for (m, p), e in self.calls.items() if m not in WRITE_METHODS and p != AUTH_ENDPOINT)
+
+    @property
+    def writes(self):
+        return sum(e["count"] for (m, p), e in self.calls.items() if m in WRITE_METHODS and p != AUTH_ENDPOINT)
+
+    def estimate_seconds(self, avg_latency=None, rate_limit_per_minute=None):
+        """Estimates wall time: latency bound per endpoint, capped below by the rate limit."""
+        avg_latency = avg_latency or PLAN_CONFIG["avg_latency"]
+        rate_limit_per_minute = rate_limit_per_minute or PLAN_CONFIG["rate_limit_per_minute"]
+        latency_bound = 0.0
+        for entry in self.calls.values():
+            workers = max(1, min(entry["workers"], entry["count"]))
+            latency_bound += math.ceil(entry["count"] / workers) * avg_latency
+        rate_bound = (self.auth + self.reads + self.writes) / (rate_limit_per_minute / 60.0)
+        return max(latency_bound, rate_bound)
+
+    def report(self):
+        """Prints and logs the per-endpoint call counts and the wall time estimate."""
+        lines = [f"Plan: {self.title}"]
+        for (method, endpoint), entry in sorted(self.calls.items(), key=lambda kv: kv[0][1]):
+            lines.append(f"  {method:<6} {endpoint:<55} {entry['count']:>8} calls  (workers={entry['workers']})")
+        seconds = self.estimate_seconds()
+        lines.append(f"  Total: {self.reads} reads, {self.writes} writes, {self.auth} token requests")
+        lines.append(f"  Estimated wall time: {seconds:.1f}s (~{seconds / 60:.1f} min) at "
+                     f"{PLAN_CONFIG['avg_latency']}s/call, {PLAN_CONFIG['rate_limit_per_minute']} req/min")
+        text = "\n".join(lines)
+        print(text)
+        logging.info(text)
+        return text
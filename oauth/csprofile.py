@@ -0,0 +1,139 @@
+#Author: kshitijshukla345@gmail.com
+#Description: Opt-in run profiling: wall-clock time per phase (auth, list, fetch, diff, write, report),
+#tracemalloc peak memory per phase and cProfile output, written as one text report per run.
+# cProfile, pstats and tracemalloc are imported only when profiling is on; pstats alone costs
+# tens of milliseconds of startup for every script that imports this module.
+import atexit
+import io
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PROFILE_CONFIG = {
+    "report_dir": "profiles",  # Reports are named <script>_<timestamp>.txt, cProfile dumps .prof next to them
+    "top_functions": 30,  # cProfile rows included in the text report
+}
+
+
+class Profiler:
+    """Collects phase spans for one run. Disabled by default, so phase() costs almost nothing."""
+
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.name = None
+        self.started = None
+        self._lock = threading.Lock()
+        self._phases = {}  # name -> {"calls", "seconds", "max_seconds", "peak_bytes"}
+        self._open = {}  # id -> phase record, for the phases currently running on any thread
+        self._cprofile = None
+
+    def start(self, name, memory=False, cprofile=False):
+        self.enabled = True
+        self.name = name
+        self.started = time.perf_counter()
+        self.memory = memory
+        if memory:
+            import tracemalloc
+            tracemalloc.start()
+        if cprofile:
+            import cProfile
+            # cProfile only sees the thread that enabled it, which is where each script's main loop runs
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def _fold_peak(self):
+        # Credit the peak since the last reset to every running phase, then start a new window
+        import tracemalloc
+        _, peak = tracemalloc.get_traced_memory()
+        for record in self._open.values():
+            record["peak_bytes"] = max(record["peak_bytes"], peak)
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def phase(self, name):
+        """Times the enclosed block as phase `name`; phases may nest and run on several threads."""
+        if not self.enabled:
+            yield
+            return
+        record = {"peak_bytes": 0}
+        with self._lock:
+            if self.memory:
+                self._fold_peak()
+            self._open[id(record)] = record
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            with self._lock:
+                if self.memory:
+                    self._fold_peak()
+                del self._open[id(record)]
+                stats = self._phases.setdefault(name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "peak_bytes": 0})
+                stats["calls"] += 1
+                stats["seconds"] += seconds
+                stats["max_seconds"] = max(stats["max_seconds"], seconds)
+                stats["peak_bytes"] = max(stats["peak_bytes"], record["peak_bytes"])
+
+    def report(self, file_path=None):
+        """Writes the report and returns its path; None when profiling is off."""
+        if not self.enabled:
+            return None
+        wall = time.perf_counter() - self.started
+        if file_path is None:
+            os.makedirs(PROFILE_CONFIG["report_dir"], exist_ok=True)
+            file_path = os.path.join(PROFILE_CONFIG["report_dir"], f"{self.name}_{time.strftime('%Y%m%d_%H%M%S')}.txt")
+        lines = [f"Profile of {self.name}: {wall:.2f}s wall clock",
+                 "Phase seconds are summed over threads, so concurrent phases can add up to more than the wall clock.",
+                 "",
+                 f"{'phase':<24}{'calls':>8}{'total s':>12}{'max s':>10}{'% wall':>8}" + (f"{'peak MB':>10}" if self.memory else "")]
+        for name, stats in sorted(self._phases.items(), key=lambda item: item[1]["seconds"], reverse=True):
+            line = (f"{name:<24}{stats['calls']:>8}{stats['seconds']:>12.3f}{stats['max_seconds']:>10.3f}"
+                    f"{100 * stats['seconds'] / wall if wall else 0:>7.1f}%")
+            if self.memory:
+                line += f"{stats['peak_bytes'] / 2 ** 20:>10.1f}"
+            lines.append(line)
+        if self.memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            lines += ["", f"Traced memory at exit: {current / 2 ** 20:.1f} MB"]
+            tracemalloc.stop()
+        if self._cprofile:
+            import pstats
+            self._cprofile.disable()
+            prof_path = os.path.splitext(file_path)[0] + ".prof"
+            self._cprofile.dump_stats(prof_path)
+            output = io.StringIO()
+            pstats.Stats(self._cprofile, stream=output).sort_stats("cumulative").print_stats(PROFILE_CONFIG["top_functions"])
+            lines += ["", f"cProfile (full data in {prof_path}, open with pstats or snakeviz):", output.getvalue()]
+        with open(file_path, "w") as file:
+            file.write("\n".join(lines) + "\n")
+        self.enabled = False
+        return file_path
+
+
+# One profiler per process, shared by the scripts and the oauth helpers
+profiler = Profiler()
+
+
+def add_profile_arguments(parser):
+    parser.add_argument("--profile", action="store_true", help="Time each phase of the run and write a profile report")
+    parser.add_argument("--profile-memory", action="store_true", help="With --profile: record peak memory per phase (tracemalloc)")
+    parser.add_argument("--profile-cprofile", action="store_true", help="With --profile: add cProfile output to the report")
+
+
+def start_from_args(args, name):
+    """Starts the shared profiler when --profile was given; the report is written when the process exits."""
+    if args.profile:
+        profiler.start(name, memory=args.profile_memory, cprofile=args.profile_cprofile)
+        atexit.register(finish)
+
+
+def finish():
+    """Writes the report if profiling was on and tells the user where it is."""
+    file_path = profiler.report()
+    if file_path:
+        print(f"Profile report written to {file_path}")
+    return file_path
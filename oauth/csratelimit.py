@@ -0,0 +1,25 @@
+import threading
+import time
+
+from oauth.cstrace import tracer
+
+
+class RateLimiter:
+    """Spaces out requests so that threads sharing it stay under `per_minute` calls."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        """Blocks until the caller's slot comes up."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            tracer.current().event("rate_limit_wait", wait_s=round(slot - now, 3))
+            time.sleep(slot - now)
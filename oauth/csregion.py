@@ -0,0 +1,101 @@
+#Author: kshitijshukla345@gmail.com
+#Description: Per-CID Falcon cloud region discovery, a small on-disk region cache and one connection pool per region.
+import json
+import os
+import threading
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+
+from oauth import csretry
+
+REGION_URLS = {
+    "us-1": "https://api.crowdstrike.com",
+    "us-2": "https://api.us-2.crowdstrike.com",
+    "eu-1": "https://api.eu-1.crowdstrike.com",
+    "us-gov-1": "https://api.laggar.gcw.crowdstrike.com",
+    "us-gov-2": "https://api.us-gov-2.crowdstrike.mil",
+}
+DEFAULT_REGION = "eu-1"  # What the scripts have always used
+REGION_HEADER = "X-Cs-Region"
+API_HOSTS = {urlsplit(url).netloc for url in REGION_URLS.values()}
+
+REGION_CONFIG = {
+    "cache_file": "cs_regions.json",  # CID -> region, so later runs skip discovery
+    "pool_maxsize": 16,  # Connections kept per region
+}
+
+_cache_lock = threading.Lock()
+_cache = None
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def base_url(region):
+    return REGION_URLS.get(region, REGION_URLS[DEFAULT_REGION])
+
+
+def token_url(region):
+    return f"{base_url(region)}/oauth2/token"
+
+
+def region_from_response(response):
+    """Reads the region from the token response header, or from the host the request ended up on."""
+    region = (response.headers.get(REGION_HEADER) or "").strip().lower()
+    if region in REGION_URLS:
+        return region
+    host = urlsplit(response.url).netloc
+    for name, url in REGION_URLS.items():
+        if urlsplit(url).netloc == host:
+            return name
+    return None
+
+
+def _load_cache():
+    global _cache
+    if _cache is None:
+        try:
+            with open(REGION_CONFIG["cache_file"]) as file:
+                _cache = json.load(file)
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def cached_region(key):
+    with _cache_lock:
+        return _load_cache().get(key)
+
+
+def remember_region(key, region):
+    with _cache_lock:
+        cache = _load_cache()
+        if cache.get(key) == region:
+            return
+        cache[key] = region
+        tmp_path = REGION_CONFIG["cache_file"] + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(cache, file, indent=2, sort_keys=True)
+        os.replace(tmp_path, REGION_CONFIG["cache_file"])
+
+
+def is_api_url(url):
+    return urlsplit(url).netloc in API_HOSTS
+
+
+def route(url, region):
+    """Points an absolute API URL at the given region, keeping its path and query."""
+    parts = urlsplit(url)
+    target = base_url(region)
+    return target + url[len(f"{parts.scheme}://{parts.netloc}"):]
+
+
+def get_session(region):
+    """Returns the shared session for a region; each region gets its own connection pool and the shared retry policy."""
+    with _sessions_lock:
+        if region not in _sessions:
+            session = csretry.RetrySession()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=REGION_CONFIG["pool_maxsize"])
+            session.mount("https://", adapter)
+            _sessions[region] = session
+        return _sessions[region]
@@ -0,0 +1,217 @@
+#Author: kshitijshukla345@gmail.com
+#Description: One retry policy for every Falcon API call: capped exponential backoff with full jitter,
+#server delay hints (Retry-After, X-RateLimit-RetryAfter) and circuit breakers per endpoint and per CID.
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+
+from oauth import csregion
+from oauth.cstrace import tracer
+
+RETRY_CONFIG = {
+    "max_retries": 4,  # Retries after the first attempt
+    "base_delay": 0.5,  # Seconds; the backoff cap doubles per attempt
+    "max_delay": 30,  # Longest sleep between attempts, also caps server hints
+    "retry_statuses": (429, 500, 502, 503, 504),
+    # 5xx and connection errors are only retried where repeating the call is safe;
+    # a 429 was not processed, so it is retried for every method
+    "idempotent_methods": ("GET", "HEAD", "OPTIONS", "PUT", "DELETE"),
+    "idempotent_posts": ("/oauth2/token", "/devices/entities/devices/v2", "/devices/entities/devices-actions/v2"),
+    "endpoint_failure_threshold": 10,  # Consecutive failures before an endpoint's breaker opens
+    "cid_failure_threshold": 5,  # Consecutive failures before a CID's breaker opens
+    "breaker_cooldown": 30,  # Seconds an open breaker rejects calls before letting one trial through
+    "max_tracked_tokens": 1000,  # Token -> CID/region entries kept; the oldest are dropped, since tokens are re-minted every 30 minutes
+}
+
+# Bearer token -> member CID and -> region, filled by the token helpers so requests can be attributed
+# to a CID and sent to the cloud that issued the token
+_token_cids = {}
+_token_regions = {}
+_token_cids_lock = threading.Lock()
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling an endpoint or CID whose breaker is open."""
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; after `cooldown` seconds one trial call decides."""
+
+    def __init__(self, name, threshold, cooldown):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._trial_running:
+                return False
+            self._trial_running = True  # Half-open: exactly one call probes the backend
+            return True
+
+    def release(self):
+        """Gives back a trial slot that was granted but not used."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logging.info(f"Circuit {self.name} closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or (self._opened_at is None and self._failures >= self.threshold):
+                logging.warning(f"Circuit {self.name} open for {self.cooldown}s after {self._failures} failures")
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+def get_breaker(kind, key):
+    with _breakers_lock:
+        if (kind, key) not in _breakers:
+            threshold = RETRY_CONFIG[f"{kind}_failure_threshold"]
+            _breakers[(kind, key)] = CircuitBreaker(f"{kind} {key}", threshold, RETRY_CONFIG["breaker_cooldown"])
+        return _breakers[(kind, key)]
+
+
+def register_token(token, member_cid, region=None):
+    """Lets the retry layer attribute calls made with `token` to `member_cid` and route them to `region`."""
+    if not token:
+        return
+    with _token_cids_lock:
+        if member_cid:
+            _token_cids[token] = member_cid
+        if region:
+            _token_regions[token] = region
+        for registry in (_token_cids, _token_regions):
+            while len(registry) > RETRY_CONFIG["max_tracked_tokens"]:
+                del registry[next(iter(registry))]  # Dicts keep insertion order, so this is the oldest token
+
+
+def backoff_delay(attempt):
+    """Full jitter: uniform between 0 and the capped exponential backoff."""
+    return random.uniform(0, min(RETRY_CONFIG["max_delay"], RETRY_CONFIG["base_delay"] * (2 ** attempt)))
+
+
+def server_delay(response):
+    """Seconds the server asked us to wait, if it said so."""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    reset_at = response.headers.get("X-RateLimit-RetryAfter")  # Falcon: epoch seconds when the window resets
+    if reset_at:
+        try:
+            return max(0.0, float(reset_at) - time.time())
+        except ValueError:
+            pass
+    return None
+
+
+def _token_of(headers):
+    authorization = (headers or {}).get("Authorization", "")
+    return authorization[len("Bearer "):] if authorization.startswith("Bearer ") else None
+
+
+class RetrySession(requests.Session):
+    """requests.Session that applies the shared retry policy and circuit breakers to every call.
+
+    Falcon API URLs are sent to the region of the bearer token's tenant, whatever cloud they name.
+    """
+
+    def request(self, method, url, *args, **kwargs):
+        method = method.upper()
+        token = _token_of(kwargs.get("headers"))
+        cid = _token_cids.get(token)
+        region = _token_regions.get(token)
+        if region and csregion.is_api_url(url):
+            url = csregion.route(url, region)
+        parts = urlsplit(url)
+        with tracer.span(f"{method} {parts.path}", "client", **{"http.request.method": method, "url.path": parts.path,
+                                                               "server.address": parts.netloc, "cs.cid": cid}) as span:
+            response = self._send(method, url, parts.path, cid, span, *args, **kwargs)
+            span.set("http.response.status_code", response.status_code)
+            if response.status_code >= 400:
+                span.fail(f"HTTP {response.status_code}")
+            return response
+
+    def _send(self, method, url, path, cid, span, *args, **kwargs):
+        breakers = [get_breaker("endpoint", f"{method} {path}")]
+        if cid:
+            breakers.append(get_breaker("cid", cid))
+        safe_to_repeat = method in RETRY_CONFIG["idempotent_methods"] or path in RETRY_CONFIG["idempotent_posts"]
+
+        for attempt in range(RETRY_CONFIG["max_retries"] + 1):
+            span.set("http.resend_count", attempt or None)
+            for index, breaker in enumerate(breakers):
+                if not breaker.allow():
+                    for granted in breakers[:index]:
+                        granted.release()
+                    raise CircuitOpenError(f"Circuit {breaker.name} is open, not calling {method} {path}")
+            last_attempt = attempt == RETRY_CONFIG["max_retries"]
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                for breaker in breakers:
+                    breaker.record_failure()
+                if last_attempt or not safe_to_repeat:
+                    raise
+                delay = backoff_delay(attempt)
+                logging.warning(f"{method} {path} failed ({e}), retrying in {delay:.1f}s")
+                span.event("retry", reason=type(e).__name__, delay_s=round(delay, 3))
+                time.sleep(delay)
+                continue
+            except Exception:
+                # Any other failure (decoding errors, invalid URLs) also counts and frees a half-open trial slot
+                for breaker in breakers:
+                    breaker.record_failure()
+                raise
+            except BaseException:
+                for breaker in breakers:
+                    breaker.release()
+                raise
+
+            status = response.status_code
+            if status >= 500:
+                for breaker in breakers:
+                    breaker.record_failure()
+            else:
+                # 429 means the backend is healthy but busy, so it does not count against the breakers
+                for breaker in breakers:
+                    breaker.record_success()
+            if status not in RETRY_CONFIG["retry_statuses"] or last_attempt or (status != 429 and not safe_to_repeat):
+                return response
+            hint = server_delay(response)
+            delay = min(RETRY_CONFIG["max_delay"], hint) if hint is not None else backoff_delay(attempt)
+            logging.warning(f"Status {status} from {method} {path}, retrying in {delay:.1f}s")
+            span.event("retry", reason=f"HTTP {status}", delay_s=round(delay, 3))
+            time.sleep(delay)
+        return response
+
+
+# Shared session for helpers that do not have their own. Scripts keep one module-level RetrySession
+# for all their calls, so connections are reused across requests and across csservice.py jobs.
+session = RetrySession()
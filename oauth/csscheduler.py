@@ -0,0 +1,172 @@
+#Author: kshitijshukla345@gmail.com
+#Description: Fair scheduling of per-CID work on one shared pool, with a per-CID bulkhead.
+import logging
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from oauth.cstrace import tracer
+
+SCHEDULER_CONFIG = {
+    "max_in_flight": 8,  # Work items running at once, across all CIDs
+    "max_in_flight_per_cid": 4,  # Slots one CID may hold, so a slow tenant cannot fill the pool
+    "max_consecutive_failures": 3,  # A CID failing this many items in a row is stopped; 0 disables it
+}
+
+_DONE = object()
+DRAIN_CHUNK = 100  # Items of a stopped CID pulled per drain step
+
+
+class TenantScheduler:
+    """Runs work items from per-CID queues round-robin on one bounded pool.
+
+    Each CID is a bulkhead: it holds at most per_cid_cap slots, and after
+    max_consecutive_failures failed items in a row its remaining items are abandoned
+    instead of run, so one slow or failing tenant neither starves nor drags down the others.
+    """
+
+    def __init__(self, max_in_flight=None, per_cid_cap=None, max_consecutive_failures=None):
+        self.max_in_flight = max_in_flight or SCHEDULER_CONFIG["max_in_flight"]
+        self.per_cid_cap = per_cid_cap or SCHEDULER_CONFIG["max_in_flight_per_cid"]
+        self.max_consecutive_failures = (SCHEDULER_CONFIG["max_consecutive_failures"]
+                                         if max_consecutive_failures is None else max_consecutive_failures)
+
+    def run(self, queues, work, on_result=None, on_abandon=None, priority=None, on_stop=None):
+        """Runs work(cid, item) for every item of every queue ({cid: iterable}).
+
+        on_result(cid, item, result, error) and on_abandon(cid, item) are called on the
+        calling thread, so they can write shared results without locks. on_stop(cid, reason)
+        runs when a CID is stopped, before its remaining items are drained into on_abandon,
+        so a lazy queue can stop doing real work for them. Queues are read lazily, one
+        item at a time, on the worker threads. With priority ({cid: expected seconds}) free
+        slots go to the longest CIDs first (LPT) instead of round-robin; the per-CID cap
+        still leaves the remaining slots to the others. Returns per-CID stats, including busy_seconds (summed
+        item time) and wall_seconds (first start to last finish).
+        """
+        iterators = {cid: iter(items) for cid, items in queues.items()}
+        # Items are pulled on the worker threads, so a queue that does slow work per item (a preflight
+        # lookup, say) only holds its own CID's slots, never the dispatch of the other CIDs
+        locks = {cid: threading.Lock() for cid in iterators}
+        stats = {cid: {"succeeded": 0, "failed": 0, "abandoned": 0, "stopped": None,
+                       "busy_seconds": 0.0, "wall_seconds": 0.0} for cid in iterators}
+        if priority:
+            active = deque(sorted(iterators, key=lambda cid: priority.get(cid, 0), reverse=True))
+        else:
+            active = deque(iterators)
+        stopped = set()
+        first_start = {}
+        running = {}  # future -> cid
+        in_flight = Counter()
+        failures_in_row = Counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            while active or running:
+                submitted = False
+                for cid in list(active):
+                    if len(running) >= self.max_in_flight:
+                        break
+                    if not priority:
+                        active.rotate(-1)
+                    if in_flight[cid] >= self.per_cid_cap:
+                        continue
+                    future = executor.submit(tracer.wrap(self._pull_and_run), work, cid, iterators[cid], locks[cid],
+                                             stopped, time.monotonic())
+                    running[future] = cid
+                    in_flight[cid] += 1
+                    submitted = True
+                if running and not submitted:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        cid = running.pop(future)
+                        in_flight[cid] -= 1
+                        outcome, item, result, error, started = future.result()
+                        if outcome == "drained":
+                            # item is a chunk of abandoned items; keep draining until the queue is empty
+                            for abandoned in item:
+                                stats[cid]["abandoned"] += 1
+                                if on_abandon:
+                                    on_abandon(cid, abandoned)
+                            if error:
+                                logging.error(f"Could not list the remaining work of stopped CID {cid}: {error}")
+                            elif result:
+                                running[executor.submit(self._drain, cid, iterators[cid], locks[cid])] = cid
+                                in_flight[cid] += 1
+                            continue
+                        if outcome in ("done", "queue failed"):
+                            if cid in active:
+                                active.remove(cid)
+                            if outcome == "queue failed" and stats[cid]["stopped"] is None:
+                                # The queue itself failed (e.g. a lookup feeding it): drop the rest of this CID only
+                                logging.error(f"Stopping CID {cid}: {error}")
+                                stats[cid]["stopped"] = str(error)
+                            continue
+                        if outcome == "abandoned":
+                            # Pulled after the CID was stopped
+                            stats[cid]["abandoned"] += 1
+                            if on_abandon:
+                                on_abandon(cid, item)
+                            continue
+                        now = time.monotonic()
+                        first_start.setdefault(cid, started)
+                        stats[cid]["busy_seconds"] += now - started
+                        stats[cid]["wall_seconds"] = now - first_start[cid]
+                        if error:
+                            stats[cid]["failed"] += 1
+                            failures_in_row[cid] += 1
+                        else:
+                            stats[cid]["succeeded"] += 1
+                            failures_in_row[cid] = 0
+                        if on_result:
+                            on_result(cid, item, result, error)
+                        if (error and self.max_consecutive_failures and stats[cid]["stopped"] is None
+                                and failures_in_row[cid] >= self.max_consecutive_failures):
+                            self._stop(cid, f"{failures_in_row[cid]} failures in a row, last: {error}", stats, active, stopped, on_stop)
+                            running[executor.submit(self._drain, cid, iterators[cid], locks[cid])] = cid
+                            in_flight[cid] += 1
+        return stats
+
+    @staticmethod
+    def _pull_and_run(work, cid, items, lock, stopped, submitted):
+        # Never raises: returns (outcome, item, result, error, started) for the dispatch thread to record.
+        # cs.pool_wait_ms is how long the task sat in the executor queue before a thread took it
+        pool_wait_ms = round((time.monotonic() - submitted) * 1000, 1)
+        try:
+            with lock:
+                item = next(items, _DONE)
+        except Exception as e:
+            return "queue failed", None, None, e, None
+        if item is _DONE:
+            return "done", None, None, None, None
+        if cid in stopped:
+            return "abandoned", item, None, None, None
+        started = time.monotonic()
+        with tracer.span(f"CID {cid}", **{"cs.cid": cid, "cs.pool_wait_ms": pool_wait_ms}):
+            try:
+                return "ran", item, work(cid, item), None, started
+            except Exception as e:
+                return "ran", item, None, e, started
+
+    @staticmethod
+    def _drain(cid, items, lock):
+        # Pulls the next chunk of a stopped CID's items; result is True while more may follow
+        chunk = []
+        try:
+            with lock:
+                for item in items:
+                    chunk.append(item)
+                    if len(chunk) >= DRAIN_CHUNK:
+                        return "drained", chunk, True, None, None
+        except Exception as e:
+            return "drained", chunk, False, e, None
+        return "drained", chunk, False, None, None
+
+    @staticmethod
+    def _stop(cid, reason, stats, active, stopped, on_stop):
+        logging.error(f"Stopping CID {cid}: {reason}")
+        stats[cid]["stopped"] = reason
+        stopped.add(cid)
+        if cid in active:
+            active.remove(cid)
+        if on_stop:
+            on_stop(cid, reason)
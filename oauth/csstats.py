@@ -0,0 +1,77 @@
+#Author: kshitijshukla345@gmail.com
+#Description: Per-CID run history (time and item counts) used to start the longest tenants first and estimate run time.
+import json
+import os
+import statistics
+import time
+
+STATS_CONFIG = {
+    "stats_file": "cs_run_stats.json",  # {job: {cid: history}}, shared by every multi-CID runner
+    "smoothing": 0.5,  # Weight of the latest run in the moving average
+}
+
+
+class RunStats:
+    """History of one kind of multi-CID job, e.g. "exception_push" or "host_action"."""
+
+    def __init__(self, job, file_path=None):
+        self.job = job
+        self.file_path = file_path or STATS_CONFIG["stats_file"]
+        try:
+            with open(self.file_path) as file:
+                self._all = json.load(file)
+        except (OSError, ValueError):
+            self._all = {}
+        self.history = self._all.setdefault(job, {})
+
+    def expected_seconds(self, cid, items=None):
+        """Busy seconds the CID is expected to need; scaled by item count when both are known."""
+        history = self.history.get(cid)
+        if not history:
+            return None
+        if items is not None and history.get("items"):
+            return history["busy_seconds"] / history["items"] * items
+        return history["busy_seconds"]
+
+    def priorities(self, cids, items=None):
+        """Expected busy seconds for every CID; CIDs without history get the median of the known ones.
+
+        Empty when no CID has history yet, so callers fall back to plain round-robin.
+        """
+        items = items or {}
+        expected = {cid: self.expected_seconds(cid, items.get(cid)) for cid in cids}
+        known = [seconds for seconds in expected.values() if seconds is not None]
+        if not known:
+            return {}
+        default = statistics.median(known)
+        return {cid: default if seconds is None else seconds for cid, seconds in expected.items()}
+
+    def eta(self, priorities, max_in_flight, per_cid_cap):
+        """Estimated wall seconds: the pool's total work or the longest CID at its cap, whichever is larger."""
+        if not priorities:
+            return 0.0
+        return max(sum(priorities.values()) / max_in_flight, max(priorities.values()) / per_cid_cap)
+
+    def record(self, cid, busy_seconds, wall_seconds, items):
+        weight = STATS_CONFIG["smoothing"]
+        previous = self.history.get(cid)
+        if previous and previous.get("items") and items:
+            # Average the per-item time, so runs of different sizes can be compared
+            per_item = weight * busy_seconds / items + (1 - weight) * previous["busy_seconds"] / previous["items"]
+            busy_seconds = per_item * items
+        self.history[cid] = {"busy_seconds": round(busy_seconds, 3), "wall_seconds": round(wall_seconds, 3),
+                             "items": items, "runs": (previous or {}).get("runs", 0) + 1, "updated": int(time.time())}
+
+    def record_run(self, scheduler_stats):
+        """Records every CID that finished without being stopped, then saves."""
+        for cid, cid_stats in scheduler_stats.items():
+            items = cid_stats["succeeded"] + cid_stats["failed"]
+            if items and not cid_stats["stopped"]:
+                self.record(cid, cid_stats["busy_seconds"], cid_stats["wall_seconds"], items)
+        self.save()
+
+    def save(self):
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self._all, file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.file_path)
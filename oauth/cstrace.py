@@ -0,0 +1,190 @@
+#Author: kshitijshukla345@gmail.com
+#Description: Opt-in request tracing. Logical operations (CID, policy, rule group, batch) and every HTTP call
+#become spans with timing, retries and status, exported as OpenTelemetry OTLP/JSON lines to a local file.
+import atexit
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+TRACE_CONFIG = {
+    "trace_dir": "traces",  # Traces are named <script>_<timestamp>.otlp.jsonl
+    "flush_spans": 1000,  # Finished spans per exported line, so long runs do not hold every span in memory
+}
+
+# OTLP enum values
+SPAN_KINDS = {"internal": 1, "client": 3}
+STATUS_OK, STATUS_ERROR = 1, 2
+
+_current = contextvars.ContextVar("cs_span", default=None)
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Span:
+    def __init__(self, trace_id, name, parent, kind, attributes):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else ""
+        self.name = name
+        self.kind = kind
+        self.attributes = {key: value for key, value in attributes.items() if value is not None}
+        self.events = []
+        self.status = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set(self, key, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def event(self, name, **attributes):
+        self.events.append((time.time_ns(), name, attributes))
+
+    def fail(self, message):
+        self.status = (STATUS_ERROR, message)
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KINDS[self.kind],
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(key, value) for key, value in self.attributes.items()],
+            "events": [{"timeUnixNano": str(at), "name": name,
+                        "attributes": [_attribute(key, value) for key, value in attributes.items()]}
+                       for at, name, attributes in self.events],
+            "status": {"code": self.status[0], "message": self.status[1]} if self.status else {"code": STATUS_OK},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    """Stands in for a span while tracing is off, so call sites never check."""
+
+    def set(self, key, value):
+        pass
+
+    def event(self, name, **attributes):
+        pass
+
+    def fail(self, message):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """One trace per run; spans nest through contextvars, and wrap() carries the parent into pool threads."""
+
+    def __init__(self):
+        self.enabled = False
+        self.service_name = None
+        self.file_path = None
+        self.trace_id = None
+        self._lock = threading.Lock()
+        self._finished = []
+
+    def start(self, service_name, file_path=None):
+        self.service_name = service_name
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        if file_path is None:
+            os.makedirs(TRACE_CONFIG["trace_dir"], exist_ok=True)
+            file_path = os.path.join(TRACE_CONFIG["trace_dir"], f"{service_name}_{time.strftime('%Y%m%d_%H%M%S')}.otlp.jsonl")
+        self.file_path = file_path
+        open(file_path, "w").close()
+        self.enabled = True
+
+    @contextmanager
+    def span(self, name, kind="internal", **attributes):
+        """Runs the block inside a child span of the current one; exceptions mark it as failed."""
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        span = Span(self.trace_id, name, _current.get(), kind, attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.fail(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current.reset(token)
+            span.end_ns = time.time_ns()
+            self._finish(span)
+
+    def current(self):
+        """The innermost open span of this thread, for adding events without opening a new span."""
+        return (_current.get() if self.enabled else None) or NOOP_SPAN
+
+    def wrap(self, fn):
+        """Binds fn to the caller's span, for work handed to a thread pool. Call it once per submit."""
+        if not self.enabled:
+            return fn
+        context = contextvars.copy_context()
+        return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+    def _finish(self, span):
+        with self._lock:
+            self._finished.append(span)
+            if len(self._finished) >= TRACE_CONFIG["flush_spans"]:
+                self._flush()
+
+    def _flush(self):
+        if not self._finished:
+            return
+        request = {"resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", self.service_name), _attribute("process.pid", os.getpid())]},
+            "scopeSpans": [{"scope": {"name": "oauth.cstrace"}, "spans": [span.to_otlp() for span in self._finished]}],
+        }]}
+        with open(self.file_path, "a") as file:
+            file.write(json.dumps(request) + "\n")
+        self._finished = []
+
+    def close(self):
+        """Writes the spans still buffered; returns the trace file, or None when tracing is off."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._flush()
+        self.enabled = False
+        return self.file_path
+
+
+# One tracer per process, shared by the scripts and the oauth helpers
+tracer = Tracer()
+
+
+def add_trace_arguments(parser):
+    parser.add_argument("--trace", action="store_true",
+                        help="Record a span per operation and HTTP call and export them as OTLP/JSON")
+
+
+def start_from_args(args, name):
+    """Starts the shared tracer when --trace was given; the trace is flushed when the process exits."""
+    if args.trace:
+        tracer.start(name)
+        atexit.register(finish)
+
+
+def finish():
+    file_path = tracer.close()
+    if file_path:
+        print(f"Trace written to {file_path}")
+    return file_path
@@ -0,0 +1,51 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth.csload import load_script
+
+drift = load_script("Inventory/csdrift.py")
+
+MARK = "2026-01-01T00:00:00Z"
+
+
+class StubTokens:
+    def get(self):
+        return "token"
+
+
+class RefreshKindTest(unittest.TestCase):
+    def refresh(self, listings, entities, known_ids, high_water):
+        filters = []
+
+        def list_ids(api_token, kind, fql_filter=None):
+            filters.append(fql_filter)
+            return listings[fql_filter]
+
+        fetcher = mock.Mock(return_value=entities)
+        with mock.patch.object(drift, "list_ids", list_ids), mock.patch.dict(drift.FETCHERS, {"firewall": fetcher}):
+            result = drift._refresh_kind(StubTokens(), "cid1", "firewall", known_ids, high_water)
+        return result, filters, fetcher
+
+    def test_edit_in_the_same_second_as_the_mark_is_fetched(self):
+        _, modified_field = drift.KIND_QUERIES["firewall"]
+        listings = {None: ["a", "b"], f"{modified_field}:>='{MARK}'": ["a", "b"]}
+        entities = [{"id": "a", modified_field: MARK}, {"id": "b", modified_field: MARK}]
+        (rows, removed, high_water, changed, total), filters, fetcher = self.refresh(listings, entities, {"a", "b"}, MARK)
+        self.assertEqual(filters[1], f"{modified_field}:>='{MARK}'")
+        self.assertEqual(fetcher.call_args[0][1], ["a", "b"])
+        self.assertEqual(sorted(row[2] for row in rows), ["a", "b"])
+        self.assertEqual((removed, high_water, changed, total), (set(), MARK, 2, 2))
+
+    def test_rows_are_deduplicated_by_id(self):
+        _, modified_field = drift.KIND_QUERIES["firewall"]
+        listings = {None: ["a"]}
+        entities = [{"id": "a", modified_field: MARK, "name": "old"}, {"id": "a", modified_field: MARK, "name": "new"}]
+        (rows, *_), _, _ = self.refresh(listings, entities, set(), None)
+        self.assertEqual([(row[2], row[3]) for row in rows], [("a", "new")])
+
+
+if __name__ == "__main__":
+    unittest.main()
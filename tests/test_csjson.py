@@ -0,0 +1,105 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth import csjson
+from oauth.csjson import _ChunkReader, decode, iter_events
+from oauth.csload import load_script
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+class StubResponse:
+    """Serves a body both as .content and in iter_content chunks, like a streamed requests response."""
+
+    def __init__(self, body, chunk_size=None):
+        self.content = json.dumps(body).encode()
+        self.chunk_size = chunk_size
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        size = self.chunk_size or chunk_size
+        for i in range(0, len(self.content), size):
+            yield self.content[i:i + size]
+
+
+def policy(exception_count):
+    exceptions = [{"id": str(i), "combined_id": f"1234_5678_SERIAL{i:06d}"} for i in range(exception_count)]
+    return {"resources": [{"id": "p1", "name": "CyberSOC Windows - Production", "settings": {"classes": [
+        {"id": "ANY", "exceptions": [{"combined_id": "other"}]},
+        {"id": "MASS_STORAGE", "exceptions": exceptions},
+    ]}}]}
+
+
+class ChunkReaderTest(unittest.TestCase):
+    def test_read_zero_consumes_nothing(self):
+        reader = _ChunkReader([b"abc", b"def"])
+        self.assertEqual(reader.read(0), b"")
+        self.assertEqual(reader.read(), b"abcdef")
+
+    def test_read_honours_size_across_chunks(self):
+        reader = _ChunkReader([b"abc", b"", b"defg", b"h"])
+        self.assertEqual([reader.read(2), reader.read(3), reader.read(10), reader.read(1)], [b"ab", b"cde", b"fgh", b""])
+
+
+class IterEventsTest(unittest.TestCase):
+    def collect_combined_ids(self, response):
+        return [value for prefix, event, value in iter_events(response)
+                if prefix == "resources.item.settings.classes.item.exceptions.item.combined_id"]
+
+    @unittest.skipIf(ijson is None, "ijson is not installed")
+    def test_ijson_streams_small_and_large_bodies(self):
+        for exception_count, chunk_size in ((1, None), (10000, None), (300, 7)):
+            body = policy(exception_count)
+            combined_ids = self.collect_combined_ids(StubResponse(body, chunk_size))
+            self.assertEqual(len(combined_ids), exception_count + 1)
+            self.assertEqual(combined_ids[-1], body["resources"][0]["settings"]["classes"][1]["exceptions"][-1]["combined_id"])
+
+    def test_fallback_walk_matches_ijson_events(self):
+        body = policy(3)
+        saved = csjson._ijson
+        csjson._ijson = None
+        try:
+            events = list(iter_events(StubResponse(body)))
+        finally:
+            csjson._ijson = saved
+        self.assertEqual(len(self.collect_combined_ids(StubResponse(body))), 4)
+        if ijson is not None:
+            self.assertEqual(events, [(prefix, event, value) for prefix, event, value in ijson.parse(StubResponse(body).content)])
+
+    def test_decode_parses_once(self):
+        response = StubResponse({"resources": [1]})
+        first = decode(response)
+        response.content = b"not json"
+        self.assertIs(decode(response), first)
+
+
+class PolicySummaryTest(unittest.TestCase):
+    def test_summary_of_a_large_streamed_policy(self):
+        exceptions_script = load_script("DeviceControlExceptions/exceptionV1.4.1.py")
+        body = policy(10000)
+
+        class StubSession:
+            def get(self, url, headers=None, stream=False):
+                return StubResponse(body)
+
+        saved = exceptions_script.session
+        exceptions_script.session = StubSession()
+        try:
+            summary = exceptions_script.get_policy_summary("token", "p1")
+        finally:
+            exceptions_script.session = saved
+        self.assertEqual(summary["name"], "CyberSOC Windows - Production")
+        self.assertEqual(len(summary["combined_ids"]), 10000)
+        self.assertNotIn("other", summary["combined_ids"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth.csplan import ApiPlan, endpoint_path
+
+BASE = "https://api.crowdstrike.com"
+
+
+class EndpointPathTest(unittest.TestCase):
+    def test_host_and_query_are_dropped(self):
+        self.assertEqual(endpoint_path(f"{BASE}/devices/entities/devices/v2?ids=1&ids=2"), "/devices/entities/devices/v2")
+        self.assertEqual(endpoint_path("/fwmgr/entities/rules/v1"), "/fwmgr/entities/rules/v1")
+        self.assertEqual(endpoint_path(BASE), "/")
+
+
+class ApiPlanTest(unittest.TestCase):
+    def test_calls_group_by_method_and_endpoint(self):
+        plan = ApiPlan("test")
+        plan.add("get", f"{BASE}/fwmgr/entities/rules/v1?ids=a", 2, workers=4)
+        plan.add("GET", f"{BASE}/fwmgr/entities/rules/v1?ids=b", 3, workers=2)
+        plan.add("POST", f"{BASE}/fwmgr/entities/rule-groups/v1", 1)
+        plan.add("DELETE", f"{BASE}/fwmgr/entities/rule-groups/v1", 0)
+        self.assertEqual(plan.calls[("GET", "/fwmgr/entities/rules/v1")], {"count": 5, "workers": 4})
+        self.assertEqual(plan.calls[("POST", "/fwmgr/entities/rule-groups/v1")], {"count": 1, "workers": 1})
+        self.assertNotIn(("DELETE", "/fwmgr/entities/rule-groups/v1"), plan.calls)
+        self.assertEqual((plan.reads, plan.writes), (5, 1))
+
+    def test_merge_adds_counts(self):
+        first, second = ApiPlan("first"), ApiPlan("second")
+        first.add("GET", f"{BASE}/policy/queries/device-control/v1", 2)
+        second.add("GET", f"{BASE}/policy/queries/device-control/v1", 3, workers=8)
+        second.add("PATCH", f"{BASE}/policy/entities/device-control/v1", 4)
+        first.merge(second)
+        self.assertEqual(first.calls[("GET", "/policy/queries/device-control/v1")], {"count": 5, "workers": 8})
+        self.assertEqual((first.reads, first.writes), (5, 4))
+
+    def test_estimate_is_latency_bound_when_under_the_rate_limit(self):
+        plan = ApiPlan("test")
+        plan.add("GET", f"{BASE}/devices/entities/devices/v2", 10, workers=5)
+        plan.add("POST", f"{BASE}/devices/entities/devices-actions/v2", 3)
+        # 2 rounds of 5 reads plus 3 sequential writes
+        self.assertAlmostEqual(plan.estimate_seconds(avg_latency=1, rate_limit_per_minute=6000), 5.0)
+
+    def test_estimate_is_rate_bound_when_over_the_rate_limit(self):
+        plan = ApiPlan("test")
+        plan.add("GET", f"{BASE}/devices/entities/devices/v2", 600, workers=600)
+        # one round at 0.1s, but 600 calls at 60/min take 600s
+        self.assertAlmostEqual(plan.estimate_seconds(avg_latency=0.1, rate_limit_per_minute=60), 600.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth import csoauth, csregion
+
+
+def make_token_response(url, region_header=None):
+    response = requests.Response()
+    response.status_code = 201
+    response._content = json.dumps({"access_token": "region-test-token", "expires_in": 1799}).encode()
+    response.url = url
+    if region_header:
+        response.headers[csregion.REGION_HEADER] = region_header
+    return response
+
+
+class RegionCacheMixin:
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_file = os.path.join(cache_dir.name, "cs_regions.json")
+        patches = [mock.patch.dict(csregion.REGION_CONFIG, {"cache_file": self.cache_file}),
+                   mock.patch.object(csregion, "_cache", None)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+
+class RouteTest(unittest.TestCase):
+    def test_path_and_query_are_kept(self):
+        self.assertEqual(csregion.route("https://api.eu-1.crowdstrike.com/devices/queries/devices/v1?limit=5", "us-2"),
+                         "https://api.us-2.crowdstrike.com/devices/queries/devices/v1?limit=5")
+
+    def test_unknown_region_falls_back_to_the_default(self):
+        self.assertEqual(csregion.base_url("mars-1"), csregion.REGION_URLS[csregion.DEFAULT_REGION])
+
+
+class RegionFromResponseTest(unittest.TestCase):
+    def test_header_wins(self):
+        response = make_token_response("https://api.eu-1.crowdstrike.com/oauth2/token", "US-2")
+        self.assertEqual(csregion.region_from_response(response), "us-2")
+
+    def test_redirected_host_is_used_without_a_header(self):
+        response = make_token_response("https://api.laggar.gcw.crowdstrike.com/oauth2/token")
+        self.assertEqual(csregion.region_from_response(response), "us-gov-1")
+
+    def test_unknown_host_gives_no_region(self):
+        self.assertIsNone(csregion.region_from_response(make_token_response("https://example.com/oauth2/token")))
+
+
+class RegionCacheTest(RegionCacheMixin, unittest.TestCase):
+    def test_regions_are_written_to_disk(self):
+        csregion.remember_region("cid1", "us-2")
+        self.assertEqual(csregion.cached_region("cid1"), "us-2")
+        with open(self.cache_file) as file:
+            self.assertEqual(json.load(file), {"cid1": "us-2"})
+
+
+class TokenManagerRegionTest(RegionCacheMixin, unittest.TestCase):
+    def test_token_response_region_is_discovered_and_cached(self):
+        token_urls = []
+
+        def request_token_response(client_id, client_secret, member_cid, token_url):
+            token_urls.append(token_url)
+            return make_token_response(token_url, "us-2")
+
+        with mock.patch.object(csoauth, "request_token_response", request_token_response):
+            tokens = csoauth.TokenManager("id", "secret", member_cid="cid1")
+            tokens.get()
+        self.assertEqual(token_urls, [csregion.token_url(csregion.DEFAULT_REGION)])
+        self.assertEqual((tokens.region, tokens.base_url), ("us-2", "https://api.us-2.crowdstrike.com"))
+        self.assertEqual(tokens.token_url, "https://api.us-2.crowdstrike.com/oauth2/token")
+        # A later run starts in the cached region
+        self.assertEqual(csoauth.TokenManager("id", "secret", member_cid="cid1").base_url, tokens.base_url)
+
+    def test_explicit_token_url_is_kept(self):
+        fixed_url = "https://api.eu-1.crowdstrike.com/oauth2/token"
+        with mock.patch.object(csoauth, "request_token_response", return_value=make_token_response(fixed_url, "us-2")):
+            tokens = csoauth.TokenManager("id", "secret", member_cid="cid1", token_url=fixed_url)
+            tokens.get()
+        self.assertEqual((tokens.region, tokens.token_url), ("us-2", fixed_url))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth import csretry
+from oauth.csretry import CircuitBreaker, CircuitOpenError, RetrySession, RETRY_CONFIG
+
+URL = "https://api.eu-1.crowdstrike.com/policy/queries/device-control/v1"
+
+
+def make_response(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = b"{}"
+    response.url = URL
+    return response
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_opens_after_threshold_and_lets_one_trial_through_after_cooldown(self):
+        breaker = CircuitBreaker("test", threshold=2, cooldown=0.05)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # Only one trial at a time
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker("test", threshold=1, cooldown=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+
+class RetrySessionTest(unittest.TestCase):
+    def setUp(self):
+        saved = dict(RETRY_CONFIG)
+        self.addCleanup(RETRY_CONFIG.update, saved)
+        RETRY_CONFIG.update({"base_delay": 0, "breaker_cooldown": 0.05})
+        csretry._breakers.clear()
+        self.addCleanup(csretry._breakers.clear)
+        self.session = RetrySession()
+
+    def send(self, side_effect):
+        with mock.patch.object(requests.Session, "request", side_effect=side_effect) as transport:
+            try:
+                return self.session.get(URL)
+            finally:
+                self.calls = transport.call_count
+
+    def test_get_retries_5xx_then_succeeds(self):
+        response = self.send([make_response(503), make_response(503), make_response(200)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.calls, 3)
+
+    def test_post_is_not_retried_on_5xx(self):
+        with mock.patch.object(requests.Session, "request", return_value=make_response(503)) as transport:
+            response = self.session.post(URL.replace("queries", "entities"), json={})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(transport.call_count, 1)
+
+    def test_unexpected_error_in_half_open_trial_does_not_wedge_the_breaker(self):
+        RETRY_CONFIG.update({"max_retries": 0, "endpoint_failure_threshold": 2})
+        for _ in range(2):
+            self.send([make_response(503)])
+        with self.assertRaises(CircuitOpenError):
+            self.send([make_response(200)])
+        time.sleep(0.06)
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            self.send(requests.exceptions.ChunkedEncodingError("truncated body"))
+        time.sleep(0.06)
+        self.assertEqual(self.send([make_response(200)]).status_code, 200)
+
+    def test_calls_go_to_the_tokens_region(self):
+        self.addCleanup(csretry._token_regions.clear)
+        csretry.register_token("us2token", "cid1", "us-2")
+        with mock.patch.object(requests.Session, "request", return_value=make_response(200)) as transport:
+            self.session.get(URL, headers={"Authorization": "Bearer us2token"})
+            self.session.get("https://example.com/health", headers={"Authorization": "Bearer us2token"})
+        self.assertEqual([call.args[1] for call in transport.call_args_list],
+                         ["https://api.us-2.crowdstrike.com/policy/queries/device-control/v1", "https://example.com/health"])
+
+    def test_token_registry_is_bounded(self):
+        RETRY_CONFIG["max_tracked_tokens"] = 3
+        self.addCleanup(csretry._token_cids.clear)
+        for i in range(5):
+            csretry.register_token(f"token{i}", f"cid{i}")
+        self.assertEqual(list(csretry._token_cids), ["token2", "token3", "token4"])
+
+
+if __name__ == "__main__":
+    unittest.main()
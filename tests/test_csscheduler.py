@@ -0,0 +1,84 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth.csscheduler import TenantScheduler
+
+
+class TenantSchedulerTest(unittest.TestCase):
+    def test_round_robin_across_cids(self):
+        order = []
+        TenantScheduler(1, 1, 0).run({"a": [1, 2, 3], "b": [1, 2], "c": [1]}, lambda cid, item: order.append((cid, item)))
+        self.assertEqual(order, [("a", 1), ("b", 1), ("c", 1), ("a", 2), ("b", 2), ("a", 3)])
+
+    def test_priority_starts_longest_cid_first(self):
+        order = []
+        TenantScheduler(1, 1, 0).run({"small": [1], "large": [1, 2]}, lambda cid, item: order.append(cid),
+                                     priority={"small": 1.0, "large": 10.0})
+        self.assertEqual(order[0], "large")
+
+    def test_per_cid_cap_is_never_exceeded(self):
+        lock = threading.Lock()
+        running = {"a": 0, "b": 0}
+        peak = {"a": 0, "b": 0}
+        release = threading.Event()
+
+        def work(cid, item):
+            with lock:
+                running[cid] += 1
+                peak[cid] = max(peak[cid], running[cid])
+            release.wait(0.01)
+            with lock:
+                running[cid] -= 1
+
+        stats = TenantScheduler(6, 2, 0).run({"a": range(10), "b": range(10)}, work)
+        self.assertLessEqual(max(peak.values()), 2)
+        self.assertEqual(stats["a"]["succeeded"] + stats["b"]["succeeded"], 20)
+
+    def test_stopped_cid_is_drained_after_on_stop(self):
+        events = []
+
+        def failing_queue():
+            for item in range(6):
+                events.append(("pull", item))
+                yield item
+
+        def work(cid, item):
+            if cid == "bad":
+                raise RuntimeError("server error")
+
+        stats = TenantScheduler(1, 1, 2).run(
+            {"bad": failing_queue(), "good": [1, 2, 3]}, work,
+            on_abandon=lambda cid, item: events.append(("abandon", item)),
+            on_stop=lambda cid, reason: events.append(("stop", cid)))
+
+        self.assertEqual(stats["bad"]["failed"], 2)
+        self.assertEqual(stats["bad"]["abandoned"], 4)
+        self.assertEqual(stats["good"]["succeeded"], 3)
+        stop_at = events.index(("stop", "bad"))
+        self.assertEqual([event for event in events[stop_at + 1:] if event[0] == "abandon"],
+                         [("abandon", item) for item in range(2, 6)])
+        self.assertNotIn(("pull", 2), events[:stop_at])
+
+    def test_slow_queue_does_not_hold_up_other_cids(self):
+        def slow_queue():
+            for item in range(3):
+                time.sleep(0.3)  # A lookup feeding the queue, e.g. a preflight POST
+                yield item
+
+        finished = {}
+        start = time.monotonic()
+
+        def work(cid, item):
+            finished.setdefault(cid, []).append(time.monotonic() - start)
+
+        stats = TenantScheduler(4, 1, 0).run({"slow": slow_queue(), "fast": [1, 2, 3]}, work)
+        self.assertEqual(stats["slow"]["succeeded"], 3)
+        self.assertLess(max(finished["fast"]), 0.2)
+
+
+if __name__ == "__main__":
+    unittest.main()
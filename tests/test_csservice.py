@@ -0,0 +1,69 @@
+import http.client
+import json
+import os
+import sys
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth.csload import load_script
+
+csservice = load_script("Service/csservice.py")
+
+
+class StubService:
+    def __init__(self):
+        self.submitted = []
+
+    def health(self):
+        return {"uptime": 0}
+
+    def submit(self, job_type, params):
+        self.submitted.append((job_type, params))
+        return {"id": "job1", "type": job_type, "status": "queued"}
+
+
+class ServiceHandlerTest(unittest.TestCase):
+    def setUp(self):
+        handler = type("Handler", (csservice.ServiceHandler,), {"service": StubService(), "api_key": "secret"})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.port = self.server.server_address[1]
+        handler.allowed_hosts = csservice.allowed_hosts("127.0.0.1", self.port)
+        self.service = handler.service
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def request(self, method, path, body=None, **headers):
+        headers = {"Host": f"localhost:{self.port}", "X-Service-Key": "secret", **headers}
+        connection = http.client.HTTPConnection("127.0.0.1", self.port)
+        connection.request(method, path, body=body, headers={key: value for key, value in headers.items() if value is not None})
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+        return response.status
+
+    def test_key_is_required(self):
+        self.assertEqual(self.request("GET", "/health"), 200)
+        self.assertEqual(self.request("GET", "/health", **{"X-Service-Key": None}), 401)
+        self.assertEqual(self.request("GET", "/health", **{"X-Service-Key": "wrong"}), 401)
+
+    def test_foreign_host_header_is_rejected(self):
+        self.assertEqual(self.request("GET", "/health", Host=f"attacker.example:{self.port}"), 400)
+
+    def test_post_needs_json_content_type(self):
+        body = json.dumps({"type": "host_action", "params": {}})
+        self.assertEqual(self.request("POST", "/jobs", body, **{"Content-Type": "text/plain"}), 415)
+        self.assertEqual(self.service.submitted, [])
+        self.assertEqual(self.request("POST", "/jobs", body, **{"Content-Type": "application/json; charset=utf-8"}), 202)
+        self.assertEqual(self.service.submitted, [("host_action", {})])
+
+    def test_loopback_detection(self):
+        self.assertTrue(csservice.is_loopback("localhost"))
+        self.assertTrue(csservice.is_loopback("::1"))
+        self.assertFalse(csservice.is_loopback("0.0.0.0"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth.csstats import RunStats
+
+
+def cid_stats(busy_seconds, items, stopped=None):
+    return {"succeeded": items, "failed": 0, "abandoned": 0, "stopped": stopped,
+            "busy_seconds": busy_seconds, "wall_seconds": busy_seconds / 2}
+
+
+class RunStatsTest(unittest.TestCase):
+    def setUp(self):
+        stats_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(stats_dir.cleanup)
+        self.stats_file = os.path.join(stats_dir.name, "cs_run_stats.json")
+
+    def test_no_history_means_no_priorities(self):
+        self.assertEqual(RunStats("job", self.stats_file).priorities(["a", "b"]), {})
+
+    def test_unknown_cids_get_the_median(self):
+        stats = RunStats("job", self.stats_file)
+        for cid, busy_seconds in (("a", 10.0), ("b", 30.0), ("c", 90.0)):
+            stats.record(cid, busy_seconds, busy_seconds, 10)
+        self.assertEqual(stats.priorities(["a", "c", "new"]), {"a": 10.0, "c": 90.0, "new": 50.0})
+
+    def test_expected_time_scales_with_item_count(self):
+        stats = RunStats("job", self.stats_file)
+        stats.record("a", 20.0, 20.0, 10)
+        self.assertEqual(stats.priorities(["a"], items={"a": 5}), {"a": 10.0})
+
+    def test_per_item_time_is_a_moving_average(self):
+        stats = RunStats("job", self.stats_file)
+        stats.record("a", 10.0, 10.0, 10)
+        stats.record("a", 60.0, 60.0, 20)
+        # 0.5 * 3s + 0.5 * 1s per item, over 20 items
+        self.assertEqual(stats.history["a"]["busy_seconds"], 40.0)
+        self.assertEqual(stats.history["a"]["runs"], 2)
+
+    def test_eta_is_bound_by_the_pool_or_the_longest_cid(self):
+        stats = RunStats("job", self.stats_file)
+        self.assertEqual(stats.eta({"a": 10.0, "b": 10.0, "c": 10.0, "d": 10.0}, 4, 1), 10.0)
+        self.assertEqual(stats.eta({"a": 100.0, "b": 10.0}, 4, 2), 50.0)
+        self.assertEqual(stats.eta({}, 4, 2), 0.0)
+
+    def test_record_run_skips_stopped_cids_and_saves(self):
+        stats = RunStats("job", self.stats_file)
+        stats.record_run({"a": cid_stats(12.0, 4), "b": cid_stats(50.0, 4, stopped="failures"), "c": cid_stats(0.0, 0)})
+        with open(self.stats_file) as file:
+            self.assertEqual(list(json.load(file)["job"]), ["a"])
+        self.assertEqual(RunStats("job", self.stats_file).expected_seconds("a"), 12.0)
+        self.assertIsNone(RunStats("other job", self.stats_file).expected_seconds("a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth.csload import load_script
+
+firewall = load_script("FirewallManagement/FirewallRuleGroupAPIMigration.py")
+
+
+def make_rules(names, **fields):
+    return [dict({"name": name, "action": "ALLOW", "id": f"id-{name}", "version": 1}, **fields) for name in names]
+
+
+def apply_patch(rules, operations):
+    """Applies the /rules JSON patch operations diff_rules emits to a list of normalized rules."""
+    rules = [dict(rule) for rule in rules]
+    for operation in operations:
+        parts = operation["path"].split("/")[2:]
+        index = int(parts[0])
+        if len(parts) == 2:
+            field = parts[1]
+            if operation["op"] == "remove":
+                del rules[index][field]
+            else:
+                rules[index][field] = operation["value"]
+        elif operation["op"] == "remove":
+            rules.pop(index)
+        elif operation["op"] == "add":
+            rules.insert(index, operation["value"])
+        elif operation["op"] == "move":
+            rules.insert(index, rules.pop(int(operation["from"].split("/")[2])))
+    return rules
+
+
+class DiffRulesTest(unittest.TestCase):
+    def assert_patch(self, target_rules, source_rules):
+        operations, counts = firewall.diff_rules(target_rules, source_rules)
+        patched = apply_patch([firewall.normalize_rule(rule) for rule in target_rules], operations)
+        self.assertEqual(patched, [firewall.normalize_rule(rule) for rule in source_rules])
+        return operations, counts
+
+    def test_moving_the_first_rule_to_the_end_is_one_move(self):
+        names = [f"r{i}" for i in range(500)]
+        operations, counts = self.assert_patch(make_rules(names), make_rules(names[1:] + names[:1]))
+        self.assertEqual(len(operations), 1)
+        self.assertEqual(counts["reorder"], 1)
+
+    def test_identical_rules_give_no_operations(self):
+        rules = make_rules(["a", "b", "c"])
+        self.assertEqual(self.assert_patch(rules, rules)[0], [])
+
+    def test_add_remove_modify_and_reorder(self):
+        target = make_rules(["a", "b", "c", "d", "e"])
+        source = make_rules(["e", "a", "x", "c", "b"])
+        source[3]["action"] = "BLOCK"
+        operations, counts = self.assert_patch(target, source)
+        self.assertEqual(counts, {"add": 1, "remove": 1, "modify": 1, "reorder": 2})
+        self.assertEqual(len(operations), 5)
+
+    def test_repeated_names_are_matched_by_occurrence(self):
+        self.assert_patch(make_rules(["a", "a", "b"]), make_rules(["b", "a", "a"]))
+
+    def test_random_reorders_apply_cleanly_with_minimal_moves(self):
+        generator = random.Random(7)
+        for _ in range(200):
+            names = [f"r{i}" for i in range(generator.randint(0, 12))]
+            target = make_rules(generator.sample(names, len(names)))
+            source = make_rules(generator.sample(names, len(names)))
+            operations, counts = self.assert_patch(target, source)
+            source_order = [rule["name"] for rule in source]
+            kept = len(firewall.longest_increasing_run([source_order.index(rule["name"]) for rule in target]))
+            self.assertEqual(counts["reorder"], len(names) - kept)
+
+
+class UpdateRuleGroupTest(unittest.TestCase):
+    def test_refuses_to_patch_when_target_rules_are_missing(self):
+        target_group = {"id": "g1", "name": "group", "tracking": "t", "description": "", "enabled": True,
+                        "rule_ids": ["id-a", "id-b"]}
+        new_data = {"description": "", "enabled": True, "rules": make_rules(["b", "a"])}
+        with self.assertRaises(RuntimeError):
+            firewall.update_rule_group("token", target_group, make_rules(["a"]), new_data)
+
+
+if __name__ == "__main__":
+    unittest.main()
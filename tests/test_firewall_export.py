@@ -0,0 +1,49 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth.csload import load_script
+
+firewall = load_script("FirewallManagement/FirewallRuleGroupAPIMigration.py")
+
+
+def make_rule(rule_id, family=None):
+    return {"id": rule_id, "family": family or rule_id, "name": f"rule {rule_id}"}
+
+
+class ExportRuleDetailsTest(unittest.TestCase):
+    def export(self, rule_ids, rules):
+        requested = []
+
+        def fetch_entities(url, headers, ids, *args, **kwargs):
+            requested.append(list(ids))
+            # The API does not return rules in request order
+            return [rule for rule in reversed(rules) if rule["id"] in ids or rule["family"] in ids]
+
+        with mock.patch.object(firewall, "fetch_entities", fetch_entities):
+            return firewall.export_rule_details("token", rule_ids), requested
+
+    def test_rules_come_back_in_precedence_order(self):
+        rule_ids = ["r5", "r1", "r4", "r2", "r3"]
+        exported, requested = self.export(rule_ids, [make_rule(rule_id) for rule_id in rule_ids])
+        self.assertEqual([rule["id"] for rule in exported], rule_ids)
+        self.assertEqual(requested, [rule_ids])
+
+    def test_family_ids_resolve_to_their_rule(self):
+        exported, _ = self.export(["f2", "f1"], [make_rule("v1", "f1"), make_rule("v2", "f2")])
+        self.assertEqual([rule["id"] for rule in exported], ["v2", "v1"])
+
+    def test_missing_rules_are_dropped_and_logged(self):
+        with self.assertLogs(level="WARNING") as logs:
+            exported, _ = self.export(["r1", "gone", "r2"], [make_rule("r1"), make_rule("r2")])
+        self.assertEqual([rule["id"] for rule in exported], ["r1", "r2"])
+        self.assertIn("gone", logs.output[0])
+
+    def test_no_rule_ids_export_no_rules(self):
+        self.assertEqual(self.export([], [])[0], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
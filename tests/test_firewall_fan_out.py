@@ -0,0 +1,69 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth.csload import load_script
+
+firewall = load_script("FirewallManagement/FirewallRuleGroupAPIMigration.py")
+
+GROUP = {"name": "Block SMB", "rules": []}
+
+
+def http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.exceptions.HTTPError(f"{status_code} error", response=response)
+
+
+class StubTokens:
+    member_cid = "cid1"
+
+    def __init__(self):
+        self.invalidated = []
+
+    def get(self):
+        return "token"
+
+    def invalidate(self, api_key):
+        self.invalidated.append(api_key)
+
+
+class DeliverGroupTest(unittest.TestCase):
+    def deliver(self, import_effects, listings):
+        self.tokens = StubTokens()
+        with mock.patch.object(firewall, "copy_rule_group", side_effect=import_effects) as copy, \
+                mock.patch.object(firewall, "list_target_groups_by_name", side_effect=listings) as listing, \
+                mock.patch.object(firewall.time, "sleep"):
+            try:
+                return firewall.deliver_group(self.tokens, GROUP)
+            finally:
+                self.imports, self.listings = copy.call_count, listing.call_count
+
+    def test_import_that_landed_despite_a_timeout_is_not_sent_again(self):
+        result = self.deliver([requests.exceptions.ReadTimeout("read timed out")], [{"Block SMB": {"id": "g1"}}])
+        self.assertEqual(result, {"status": "found after error", "target_ids": ["g1"]})
+        self.assertEqual(self.imports, 1)
+
+    def test_import_is_resent_once_the_target_shows_it_missing(self):
+        imported = {"status": "imported", "target_ids": ["g2"]}
+        result = self.deliver([http_error(502), imported], [{}])
+        self.assertEqual(result, imported)
+        self.assertEqual((self.imports, self.listings), (2, 1))
+
+    def test_client_errors_are_not_retried(self):
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.deliver([http_error(400)], [])
+        self.assertEqual((self.imports, self.listings), (1, 0))
+
+    def test_expired_token_is_reminted_and_retried(self):
+        imported = {"status": "imported", "target_ids": ["g3"]}
+        self.assertEqual(self.deliver([http_error(401), imported], []), imported)
+        self.assertEqual(self.tokens.invalidated, ["token"])
+
+
+if __name__ == "__main__":
+    unittest.main()
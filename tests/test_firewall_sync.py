@@ -0,0 +1,74 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth.csload import load_script
+
+firewall = load_script("FirewallManagement/FirewallRuleGroupAPIMigration.py")
+
+
+def make_group(rule_names, **fields):
+    rules = [{"name": name, "action": "ALLOW", "id": f"source-{name}", "version": 1} for name in rule_names]
+    return dict({"name": "web", "description": "web servers", "platform": "windows", "enabled": True, "rules": rules}, **fields)
+
+
+def as_target(group, group_id="target-group"):
+    # The same content as it comes back from another tenant: new ids, versions and timestamps
+    rules = [dict(rule, id=f"target-{rule['name']}", version=7, modified_on="2026-01-01") for rule in group["rules"]]
+    target_group = {key: value for key, value in group.items() if key != "rules"}
+    target_group.update(id=group_id, rule_ids=[rule["id"] for rule in rules], tracking="t1")
+    return target_group, rules
+
+
+class RuleGroupHashTest(unittest.TestCase):
+    def test_server_managed_fields_are_ignored(self):
+        group = make_group(["a", "b"])
+        target_group, rules = as_target(group)
+        self.assertEqual(firewall.rule_group_hash(dict(target_group, rules=rules)), firewall.rule_group_hash(group))
+
+    def test_rule_order_and_content_change_the_hash(self):
+        group_hash = firewall.rule_group_hash(make_group(["a", "b"]))
+        self.assertNotEqual(firewall.rule_group_hash(make_group(["b", "a"])), group_hash)
+        self.assertNotEqual(firewall.rule_group_hash(make_group(["a", "b"], enabled=False)), group_hash)
+
+    def test_missing_description_matches_an_empty_one(self):
+        self.assertEqual(firewall.rule_group_hash(make_group(["a"], description=None)),
+                         firewall.rule_group_hash(make_group(["a"], description="")))
+
+
+class SyncRuleGroupTest(unittest.TestCase):
+    def sync(self, group, target_groups_by_name, target_rules=()):
+        with mock.patch.object(firewall, "export_rule_details", return_value=list(target_rules)) as export, \
+                mock.patch.object(firewall, "import_rule_group", return_value={"resources": ["new-group"]}) as create, \
+                mock.patch.object(firewall, "update_rule_group", return_value={}) as update:
+            result = firewall.sync_rule_group("token", group, target_groups_by_name)
+        return result, export, create, update
+
+    def test_group_missing_from_the_target_is_created(self):
+        result, export, create, update = self.sync(make_group(["a"]), {})
+        self.assertEqual((result["status"], result["target_ids"]), ("imported", ["new-group"]))
+        export.assert_not_called()
+        update.assert_not_called()
+
+    def test_identical_group_is_skipped(self):
+        group = make_group(["a", "b"])
+        target_group, rules = as_target(group)
+        result, export, create, update = self.sync(group, {"web": target_group}, rules)
+        self.assertEqual((result["status"], result["target_ids"]), ("unchanged", ["target-group"]))
+        export.assert_called_once_with("token", target_group["rule_ids"])
+        create.assert_not_called()
+        update.assert_not_called()
+
+    def test_changed_group_is_updated_in_place(self):
+        target_group, rules = as_target(make_group(["a", "b"]))
+        group = make_group(["a", "b", "c"])
+        result, export, create, update = self.sync(group, {"web": target_group}, rules)
+        self.assertEqual((result["status"], result["target_ids"]), ("updated", ["target-group"]))
+        update.assert_called_once_with("token", target_group, rules, group)
+        create.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
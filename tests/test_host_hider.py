@@ -0,0 +1,148 @@
+import csv
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth.csload import load_script
+
+host = load_script("HostManagement/crowdstrike_host_hider.py")
+
+BAD_ID = "b" * 32
+HOST_IDS = [f"{i:032x}" for i in range(1, 8)]
+HOST_IDS.insert(1, BAD_ID)
+
+
+def make_response(status_code, body=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body or {}).encode()
+    response.url = host.devices_actions_url
+    return response
+
+
+class StubSession:
+    """Answers devices-actions POSTs from a function of the submitted IDs and records every batch."""
+
+    def __init__(self, status_for):
+        self.status_for = status_for
+        self.batches = []
+
+    def request(self, method, url, headers=None, json=None, **kwargs):
+        self.batches.append(list(json["ids"]))
+        return make_response(self.status_for(json["ids"]))
+
+
+class StubTokens:
+    member_cid = None
+    region = "eu-1"
+
+    def __init__(self, session):
+        self._session = session
+
+    def get(self):
+        return "token"
+
+    def invalidate(self, token):
+        pass
+
+    def session(self):
+        return self._session
+
+
+class SubmitWithIsolationTest(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(host.CONFIG.__setitem__, "max_requests_per_minute", host.CONFIG["max_requests_per_minute"])
+        host.CONFIG["max_requests_per_minute"] = 0  # No rate limiting in tests
+        host._rate_limiters.clear()
+        self.workdir = tempfile.TemporaryDirectory()
+        self.ledger_path = os.path.join(self.workdir.name, "ledger.csv")
+        self.ledger = host.ResultLedger(self.ledger_path, "hide_host", os.path.join(self.workdir.name, "failed.csv"))
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def ledger_rows(self):
+        self.ledger.close()
+        with open(self.ledger_path, newline="") as file:
+            return {row["host_id"]: row["result"] for row in csv.DictReader(file)}
+
+    def run_split(self, status_for):
+        session = StubSession(status_for)
+        error = host.submit_with_isolation(StubTokens(session), "hide_host", HOST_IDS, self.ledger)
+        return error, session
+
+    def test_bad_id_is_isolated(self):
+        error, _ = self.run_split(lambda ids: 400 if BAD_ID in ids else 202)
+        self.assertIsNone(error)
+        rows = self.ledger_rows()
+        self.assertEqual(rows.pop(BAD_ID), "failed")
+        self.assertEqual(set(rows.values()), {"succeeded"})
+
+    def test_non_id_error_on_left_half_still_submits_right_half(self):
+        # The full batch is rejected for the bad ID, then the left half hits a server error
+        def status_for(ids):
+            if len(ids) == len(HOST_IDS):
+                return 400
+            return 503 if BAD_ID in ids else 202
+
+        error, session = self.run_split(status_for)
+        self.assertIsInstance(error, requests.exceptions.HTTPError)
+        rows = self.ledger_rows()
+        self.assertEqual(sorted(rows), sorted(HOST_IDS))
+        self.assertEqual({rows[host_id] for host_id in HOST_IDS[:4]}, {"failed"})
+        self.assertEqual({rows[host_id] for host_id in HOST_IDS[4:]}, {"succeeded"})
+        self.assertIn(HOST_IDS[4:], session.batches)
+
+    def test_every_id_reaches_the_ledger_when_every_half_fails(self):
+        def status_for(ids):
+            return 400 if len(ids) == len(HOST_IDS) else 429
+
+        self.run_split(status_for)
+        self.assertEqual(sorted(self.ledger_rows()), sorted(HOST_IDS))
+
+
+class PreflightFilterTest(unittest.TestCase):
+    def test_skip_lookup_passes_ids_through_without_lookups(self):
+        self.addCleanup(host.CONFIG.__setitem__, "max_requests_per_minute", host.CONFIG["max_requests_per_minute"])
+        host.CONFIG["max_requests_per_minute"] = 0
+        host._rate_limiters.clear()
+        self.addCleanup(host.CONFIG.__setitem__, "preflight_chunk", host.CONFIG["preflight_chunk"])
+        host.CONFIG["preflight_chunk"] = 2
+        lookups = []
+
+        def lookup(tokens, chunk):
+            lookups.append(chunk)
+            return {host_id: {"status": "normal"} for host_id in chunk}
+
+        original = host.lookup_visible_hosts
+        host.lookup_visible_hosts = lookup
+        self.addCleanup(setattr, host, "lookup_visible_hosts", original)
+        stopped = []
+        filtered = host.preflight_filter(StubTokens(None), "hide_host", iter(HOST_IDS), ledger=None,
+                                         skip_lookup=lambda: bool(stopped))
+
+        self.assertEqual([next(filtered), next(filtered)], HOST_IDS[:2])
+        stopped.append(True)
+        self.assertEqual(list(filtered), HOST_IDS[2:])
+        self.assertEqual(lookups, [HOST_IDS[:2]])
+
+
+class PlanMultiCidTest(unittest.TestCase):
+    def test_preflight_lookups_are_counted_per_cid(self):
+        cid_host_ids = {"cid1": HOST_IDS, "cid2": HOST_IDS[:3]}
+        with mock.patch("sys.stdout"):
+            without = host.plan_multi_cid(cid_host_ids, "hide_host")
+            with_preflight = host.plan_multi_cid(cid_host_ids, "hide_host", preflight=True)
+        lookup = ("POST", "/devices/entities/devices/v2")
+        self.assertNotIn(lookup, without.calls)
+        self.assertEqual(with_preflight.calls[lookup]["count"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
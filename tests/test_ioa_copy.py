@@ -0,0 +1,74 @@
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oauth.csload import load_script
+
+ioa = load_script("CustomIOA/ioaMTv1.4.0.py")
+
+GROUP = {"id": "g1", "name": "Block LOLBins", "platform": "windows", "enabled": True, "rule_ids": ["1", "2"]}
+
+
+def make_response(status_code, body):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body).encode()
+    return response
+
+
+def rule(rule_id):
+    return {"instance_id": rule_id, "name": f"rule {rule_id}", "description": "", "pattern_severity": "high",
+            "disposition_id": 10, "field_values": [], "ruletype_id": "1"}
+
+
+class StubSession:
+    """Serves rule entity GETs from `rules` (missing IDs are just left out) and records every call."""
+
+    def __init__(self, rules, fail=False):
+        self.rules = rules
+        self.fail = fail
+        self.gets = []
+
+    def get(self, url, headers=None, params=None):
+        self.gets.append((url, params))
+        if self.fail:
+            raise requests.exceptions.ConnectionError("connection reset")
+        return make_response(200, {"resources": [self.rules[rule_id] for rule_id in params["ids"] if rule_id in self.rules]})
+
+
+class CopyRuleGroupsTest(unittest.TestCase):
+    def copy(self, stub_session):
+        with mock.patch.object(ioa, "session", stub_session), \
+                mock.patch.object(ioa, "get_custom_ioa_rule_group_details", return_value=dict(GROUP)), \
+                mock.patch.object(ioa, "create_rule_group", return_value="new1") as create_group, \
+                mock.patch.object(ioa, "create_rule") as create_rule:
+            results = ioa.copy_rule_groups("source", "destination", ["g1"])
+        self.created_groups, self.created_rules = create_group.call_count, create_rule.call_count
+        return results
+
+    def test_only_the_groups_rule_ids_are_fetched(self):
+        stub_session = StubSession({"1": rule("1"), "2": rule("2")})
+        results = self.copy(stub_session)
+        self.assertEqual(results[0]["status"], "copied")
+        self.assertEqual(self.created_rules, 2)
+        self.assertEqual([(url.rsplit("/", 3)[-3], params) for url, params in stub_session.gets], [("entities", {"ids": ["1", "2"]})])
+
+    def test_missing_rule_fails_the_group_before_anything_is_created(self):
+        results = self.copy(StubSession({"1": rule("1")}))
+        self.assertEqual(results[0]["status"], "failed")
+        self.assertIn("1 of 2 rules", results[0]["error"])
+        self.assertEqual((self.created_groups, self.created_rules), (0, 0))
+
+    def test_fetch_error_fails_the_group(self):
+        results = self.copy(StubSession({}, fail=True))
+        self.assertEqual(results[0]["status"], "failed")
+        self.assertEqual(self.created_groups, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()